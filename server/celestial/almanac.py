@@ -0,0 +1,353 @@
+# coding=utf-8
+
+"""
+
+Copyright(c) 2022-2023 Max Qian  <lightapt.com>
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Library General Public
+License version 3 as published by the Free Software Foundation.
+This library is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Library General Public License for more details.
+You should have received a copy of the GNU Library General Public License
+along with this library; see the file COPYING.LIB.  If not, write to
+the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+Boston, MA 02110-1301, USA.
+
+"""
+
+import datetime
+import os
+import sqlite3
+import threading
+
+import numpy as np
+from astropy import units as u
+from astropy.coordinates import EarthLocation, TETE, get_body, get_sun
+from astropy.time import Time
+
+from ..logging import logger
+from . import calculator
+from .planner import _first_crossing, night_grid, tonight
+
+ALMANACPATH = os.path.join(os.path.dirname(__file__), "almanac.db")
+
+# Altitude of the center of the Sun and the Moon at rising and setting ,
+# refraction and semi-diameter together
+RISE_ALTITUDE = -0.8333
+
+# Equatorial radius of the Earth in km
+EARTH_RADIUS = 6378.137
+
+# Seconds between the positions which are interpolated
+COARSE_STEP = 3600.0
+
+# Altitude of the center of the Sun at the end of each twilight
+TWILIGHTS = {
+    "civil": -6,
+    "nautical": -12,
+    "astro": -18,
+}
+
+NIGHT_DTYPE = np.dtype([
+    ("date", "i8"),
+    ("sunset", "f8"),
+    ("sunrise", "f8"),
+    ("civil_dusk", "f8"),
+    ("civil_dawn", "f8"),
+    ("nautical_dusk", "f8"),
+    ("nautical_dawn", "f8"),
+    ("astro_dusk", "f8"),
+    ("astro_dawn", "f8"),
+    ("moonrise", "f8"),
+    ("moonset", "f8"),
+    ("moon_illumination", "f8"),
+    ("moon_waxing", "?"),
+])
+
+def _add_months(date : datetime.date, months : int) -> datetime.date:
+    """
+        Add calendar months to a date , the day is kept if the month is long enough
+    """
+    month = date.month - 1 + months
+    year = date.year + month // 12
+    month = month % 12 + 1
+    for day in range(date.day, 27, -1):
+        try:
+            return datetime.date(year, month, day)
+        except ValueError:
+            continue
+    return datetime.date(year, month, min(date.day, 28))
+
+def compute_nights(location : EarthLocation, start : datetime.date, count : int, step : float = 5) -> np.ndarray:
+    """
+        Compute the twilights , the Moon events and the Moon illumination of many nights in a single batch
+        Args :
+            location : EarthLocation # the observer
+            start : datetime.date # date of the first evening
+            count : int # number of nights
+            step : float # minutes between two time steps , the events are interpolated in between
+        Returns : np.ndarray # NIGHT_DTYPE , one row per night , the events are UTC unix timestamps
+        NOTE : Every night runs from local mean noon to the next one , so an event which doesn't happen
+            during that night is NaN
+    """
+    grid = night_grid(start, location, step)
+    length = len(grid)
+    # Unix time has no leap seconds , so every night is the first one shifted by whole days
+    offsets = np.arange(count) * 86400.0
+    unix = grid.unix
+    fine = (unix[None, :] + offsets[:, None]).ravel()
+
+    # The geocentric places and the sidereal time are smooth , so they are computed hourly
+    # and interpolated , which is far cheaper than transforming every time step
+    coarse = Time(np.arange(fine[0], fine[-1] + 2 * COARSE_STEP, COARSE_STEP), format="unix")
+    frame = TETE(obstime=coarse)
+    sun = get_sun(coarse).transform_to(frame)
+    moon = get_body("moon", coarse).transform_to(frame)
+    lst = coarse.sidereal_time("apparent", longitude=location.lon).rad
+
+    def interpolate(values : np.ndarray) -> np.ndarray:
+        return np.interp(fine, coarse.unix, values)
+
+    lat = location.lat.rad
+    def altitude(ra : np.ndarray, dec : np.ndarray) -> np.ndarray:
+        ha = interpolate(np.unwrap(lst)) - interpolate(np.unwrap(ra))
+        dec = interpolate(dec)
+        sin_alt = np.sin(lat) * np.sin(dec) + np.cos(lat) * np.cos(dec) * np.cos(ha)
+        return np.arcsin(np.clip(sin_alt, -1, 1))
+
+    sun_altitude = np.degrees(altitude(sun.ra.rad, sun.dec.rad)).reshape(count, length)
+    moon_altitude = altitude(moon.ra.rad, moon.dec.rad)
+    # Topocentric altitude of the Moon , its horizontal parallax is about one degree
+    parallax = np.arcsin(EARTH_RADIUS / interpolate(moon.distance.to_value(u.km)))
+    moon_altitude = np.degrees(moon_altitude - parallax * np.cos(moon_altitude)).reshape(count, length)
+
+    nights = np.zeros(count, dtype=NIGHT_DTYPE)
+    nights["date"] = start.toordinal() + np.arange(count)
+    def crossing(altitude : np.ndarray, horizon : float, rising : bool) -> np.ndarray:
+        return _first_crossing(altitude, unix, horizon, rising) + offsets
+
+    nights["sunset"] = crossing(sun_altitude, RISE_ALTITUDE, rising=False)
+    nights["sunrise"] = crossing(sun_altitude, RISE_ALTITUDE, rising=True)
+    for name, horizon in TWILIGHTS.items():
+        nights[name + "_dusk"] = crossing(sun_altitude, horizon, rising=False)
+        nights[name + "_dawn"] = crossing(sun_altitude, horizon, rising=True)
+    nights["moonrise"] = crossing(moon_altitude, RISE_ALTITUDE, rising=True)
+    nights["moonset"] = crossing(moon_altitude, RISE_ALTITUDE, rising=False)
+
+    # Illumination at local mean midnight , from the elongation of the Moon
+    middle = fine.reshape(count, length)[:, length // 2]
+    sun_ra, sun_dec = (np.interp(middle, coarse.unix, np.unwrap(v)) for v in (sun.ra.rad, sun.dec.rad))
+    moon_ra, moon_dec = (np.interp(middle, coarse.unix, np.unwrap(v)) for v in (moon.ra.rad, moon.dec.rad))
+    cos_elongation = np.sin(sun_dec) * np.sin(moon_dec) \
+        + np.cos(sun_dec) * np.cos(moon_dec) * np.cos(moon_ra - sun_ra)
+    nights["moon_illumination"] = (1 - cos_elongation) / 2
+    # The Moon is waxing while it is east of the Sun
+    nights["moon_waxing"] = (moon_ra - sun_ra) % (2 * np.pi) < np.pi
+    return nights
+
+class Almanac(object):
+    """
+        Calendar of the nights of many sites , computed in batches and stored in SQLite ,
+        so that looking up a night needs no ephemeris work
+        The batches are computed ahead of time by fill() , when the server starts or with
+        python -m server.celestial.almanac , a lookup which misses computes only the nights it needs
+        and leaves the batch to a background thread
+    """
+
+    def __init__(self, path : str = ALMANACPATH, months : int = 6, step : float = 5) -> None:
+        """
+            Args :
+                path : str # SQLite file
+                months : int # number of months computed at once when a night is missing
+                step : float # minutes between two time steps of the batch
+        """
+        self.path = path
+        self.months = months
+        self.step = step
+        self._conn = None
+        self._lock = threading.Lock()
+        # sites whose batch is being computed in the background
+        self._filling = set()
+
+    def _connection(self) -> sqlite3.Connection:
+        """
+            Open the database on first use
+        """
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            columns = ", ".join(f"{name} REAL" for name in NIGHT_DTYPE.names[1:])
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS nights (site TEXT NOT NULL, date INTEGER NOT NULL, "
+                f"{columns}, PRIMARY KEY (site, date)) WITHOUT ROWID"
+            )
+            self._conn.commit()
+        return self._conn
+
+    @staticmethod
+    def site(location : EarthLocation) -> str:
+        """
+            Key of a site in the database
+            Args : location : EarthLocation
+            Returns : str
+        """
+        return "%.4f,%.4f,%.0f" % (location.lat.to_value(u.deg), location.lon.to_value(u.deg),
+                                   location.height.to_value(u.m))
+
+    def generate(self, location : EarthLocation | None = None, start : datetime.date | None = None,
+                 months : int | None = None) -> int:
+        """
+            Compute the nights of a site for the next months and store them , replacing the old ones
+            Args :
+                location : EarthLocation # default is the location set in calculator
+                start : datetime.date # date of the first evening , default is tonight
+                months : int # default is self.months
+            Returns : int # number of nights stored
+        """
+        location = self._location(location)
+        if start is None:
+            start = tonight(location)
+        if months is None:
+            months = self.months
+        count = (_add_months(start, months) - start).days
+        rows = self._rows(self.site(location), compute_nights(location, start, count, self.step))
+        placeholders = ", ".join("?" * (len(NIGHT_DTYPE.names) + 1))
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany(f"INSERT OR REPLACE INTO nights VALUES ({placeholders})", rows)
+        return len(rows)
+
+    def fill(self, location : EarthLocation | None = None, days : int = 30) -> int:
+        """
+            Compute the next months of a site ahead of time , unless the next nights are already stored
+            Args :
+                location : EarthLocation # default is the location set in calculator
+                days : int # number of nights from tonight which must be stored
+            Returns : int # number of nights stored , 0 if they were up to date or no location is set
+        """
+        if location is None and calculator.location is None:
+            return 0
+        location = self._location(location)
+        start = tonight(location)
+        if len(self._select(location, start, start + datetime.timedelta(days=days - 1))) >= days:
+            return 0
+        return self.generate(location, start)
+
+    def _fill_in_background(self, location : EarthLocation, start : datetime.date, months : int) -> None:
+        """
+            Compute a batch in a thread , at most one for each site
+        """
+        site = self.site(location)
+        with self._lock:
+            if site in self._filling:
+                return
+            self._filling.add(site)
+
+        def run():
+            try:
+                self.generate(location, start, months)
+            except Exception as e:
+                logger.error("Failed to compute the almanac of %s : %s" % (site, str(e)))
+            finally:
+                with self._lock:
+                    self._filling.discard(site)
+
+        threading.Thread(target=run, name="almanac", daemon=True).start()
+
+    def nights(self, start : datetime.date | None = None, end : datetime.date | None = None,
+               location : EarthLocation | None = None) -> list[dict]:
+        """
+            Look up the nights between two dates
+            When some are missing , only these nights are computed for the caller ,
+            the batch of the next months is computed in the background
+            Args :
+                start : datetime.date # date of the first evening , default is tonight
+                end : datetime.date # date of the last evening , default is start
+                location : EarthLocation # default is the location set in calculator
+            Returns : list[dict] # events are UTC unix timestamps , None if they don't happen
+        """
+        location = self._location(location)
+        if start is None:
+            start = tonight(location)
+        if end is None:
+            end = start
+        rows = self._select(location, start, end)
+        count = (end - start).days + 1
+        if len(rows) < count:
+            months = self.months
+            while _add_months(start, months) <= end:
+                months += self.months
+            self._fill_in_background(location, start, months)
+            rows = self._rows(self.site(location), compute_nights(location, start, count, self.step))
+        return [self._to_dict(row) for row in rows]
+
+    def night(self, date : datetime.date | None = None, location : EarthLocation | None = None) -> dict:
+        """
+            Look up a single night
+            Args :
+                date : datetime.date # date of the evening , default is tonight
+                location : EarthLocation # default is the location set in calculator
+            Returns : dict
+        """
+        return self.nights(date, date, location)[0]
+
+    def _select(self, location : EarthLocation, start : datetime.date, end : datetime.date) -> list:
+        with self._lock:
+            return self._connection().execute(
+                "SELECT * FROM nights WHERE site = ? AND date BETWEEN ? AND ? ORDER BY date",
+                (self.site(location), start.toordinal(), end.toordinal())
+            ).fetchall()
+
+    @staticmethod
+    def _rows(site : str, nights : np.ndarray) -> list:
+        """
+            Rows of the database , NaN is stored as NULL
+        """
+        return [
+            (site, int(night["date"])) + tuple(
+                None if np.isnan(value) else float(value)
+                for value in (night[name] for name in NIGHT_DTYPE.names[1:])
+            )
+            for night in nights
+        ]
+
+    @staticmethod
+    def _to_dict(row : tuple) -> dict:
+        night = dict(zip(("site",) + NIGHT_DTYPE.names, row))
+        night["date"] = datetime.date.fromordinal(night["date"]).isoformat()
+        night["moon_waxing"] = bool(night["moon_waxing"])
+        return night
+
+    @staticmethod
+    def _location(location : EarthLocation | None) -> EarthLocation:
+        if location is None:
+            location = calculator.location
+        if location is None:
+            raise ValueError("Observer location is not set")
+        return location
+
+    def close(self) -> None:
+        """
+            Close the database
+        """
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+almanac = Almanac()
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Compute the almanac of a site ahead of time")
+    parser.add_argument("lat", type=float, help="latitude of the site , in degrees")
+    parser.add_argument("lon", type=float, help="longitude of the site , in degrees")
+    parser.add_argument("elevation", type=float, nargs="?", default=0, help="in meters , default is 0")
+    parser.add_argument("--months", type=int, default=almanac.months, help="number of months to compute")
+    args = parser.parse_args()
+    site = EarthLocation(lat=args.lat * u.deg, lon=args.lon * u.deg, height=args.elevation * u.m)
+    print("Stored %d nights of %s" % (almanac.generate(site, months=args.months), Almanac.site(site)))
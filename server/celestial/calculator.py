@@ -19,7 +19,9 @@ Boston, MA 02110-1301, USA.
 """
 
 import datetime
+from functools import lru_cache
 
+import numpy as np
 from astropy import units as u
 from astropy.coordinates import AltAz, EarthLocation, SkyCoord
 from astropy.time import Time
@@ -27,12 +29,50 @@ from astropy.coordinates import FK5
 
 location = None
 
+@lru_cache(maxsize=16)
+def precession_matrix(date : datetime.date) -> np.ndarray:
+    """
+        Get the rotation matrix from J2000 to the mean equator and equinox of a date.
+        The matrix is computed once per day with the astropy FK5 transform , then cached.
+        Args :
+            date : datetime.date # UTC date of the equinox
+        Returns : np.ndarray # (3, 3) , jnow_vector = matrix @ j2000_vector
+    """
+    equinox = Time(datetime.datetime(date.year, date.month, date.day), scale="utc")
+    # FK5 to FK5 is a pure rotation , the images of the axes are the matrix columns
+    axes = SkyCoord(x=[1, 0, 0], y=[0, 1, 0], z=[0, 0, 1], representation_type="cartesian",
+                    frame=FK5(equinox="J2000"))
+    rotated = axes.transform_to(FK5(equinox=equinox)).cartesian.xyz.value
+    rotated.flags.writeable = False
+    return rotated
+
+def precess_j2000_to_jnow(ra : np.ndarray, dec : np.ndarray, date : datetime.date | None = None) -> tuple:
+    """
+        Convert many J2000 coordinates to JNow at once
+        Args :
+            ra : np.ndarray # J2000 R.A. in degrees
+            dec : np.ndarray # J2000 Dec in degrees
+            date : datetime.date # UTC date of the equinox , default is today
+        Returns : tuple # (ra, dec) of date in degrees
+    """
+    if date is None:
+        date = datetime.datetime.utcnow().date()
+    ra = np.radians(np.asarray(ra, dtype=float))
+    dec = np.radians(np.asarray(dec, dtype=float))
+    cos_dec = np.cos(dec)
+    vectors = np.stack([cos_dec * np.cos(ra), cos_dec * np.sin(ra), np.sin(dec)], axis=-1)
+    x, y, z = np.moveaxis(vectors @ precession_matrix(date).T, -1, 0)
+    return np.degrees(np.arctan2(y, x)) % 360, np.degrees(np.arctan2(z, np.hypot(x, y)))
+
 def convert_j2000_to_jnow(star_object : SkyCoord) -> SkyCoord:
     """
-        Convert coordinates in J2000 format to JNow format
+        Convert coordinates in J2000 format to JNow format , star_object may hold many coordinates
     """
+    date = datetime.datetime.utcnow().date()
     tmp = star_object.fk5
-    return tmp.transform_to(FK5(equinox=f'J{datetime.datetime.today().year}'))
+    ra, dec = precess_j2000_to_jnow(tmp.ra.deg, tmp.dec.deg, date)
+    equinox = Time(datetime.datetime(date.year, date.month, date.day), scale="utc")
+    return SkyCoord(ra * u.deg, dec * u.deg, frame=FK5(equinox=equinox))
 
 def convert_radec_to_azalt(star_object : SkyCoord) -> SkyCoord:
     """
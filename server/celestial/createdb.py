@@ -20,10 +20,14 @@ Boston, MA 02110-1301, USA.
 
 import os
 import csv
+import io
+import re
 import numpy as np
 import sqlite3
+from typing import Dict, Iterable, Optional
 
 outputFile = os.path.join(os.path.dirname(__file__), "data.db")
+inputFile = os.path.join(os.path.dirname(__file__), "data.csv")
 
 # Dictionaries
 objectTypes = {
@@ -50,11 +54,89 @@ objectTypes = {
     "Dup": "Duplicated record",
 }
 
-# Create db
-try:
-    db = sqlite3.connect(outputFile)
-    cursor = db.cursor()
+# PRAGMAs used while building a new database file. Journal and syncs are not
+# needed, the file is written aside and moved in place only once complete
+buildPragmas = (
+    "PRAGMA journal_mode = OFF",
+    "PRAGMA synchronous = OFF",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -65536",
+)
 
+# PRAGMAs used while updating the database in place, keep the rollback journal
+updatePragmas = (
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -65536",
+)
+
+
+def sexagesimal_to_radians(values: np.ndarray, hours: bool = False) -> np.ndarray:
+    """
+        Convert a column of sexagesimal strings to radians in a single pass
+        Args:
+            values : np.ndarray # strings like "HH:MM:SS.ss" or "+DD:MM:SS.s", empty if unknown
+            hours : bool # whether the values are hours (R.A.) instead of degrees
+        Returns:
+            np.ndarray # angles in radians, NaN where the value is empty
+    """
+    values = np.asarray(values, dtype=str)
+    result = np.full(values.shape, np.nan)
+    known = values != ""
+    if not known.any():
+        return result
+    fields = np.loadtxt(io.StringIO("\n".join(values[known])), delimiter=":", ndmin=2)
+    weights = [15, 1 / 4, 1 / 240] if hours else [1, 1 / 60, 1 / 3600]
+    # The sign is only written on the first field, -00 is parsed as -0.0
+    sign = np.where(np.signbit(fields[:, 0]), -1.0, 1.0)
+    result[known] = np.radians(
+        fields[:, 0] * weights[0]
+        + fields[:, 1] * (sign * weights[1])
+        + fields[:, 2] * (sign * weights[2])
+    )
+    return result
+
+
+def identifier_alias(identifier: str) -> str:
+    """
+        Split an identifier in the words indexed for prefix searches
+        Args:
+            identifier : str # like "NGC0070A" or "ESO123-045"
+        Returns:
+            str # like "NGC 70 A" or "ESO 123 45"
+    """
+    words = re.findall(r"[^\W\d_]+|\d+", identifier.upper())
+    return " ".join(word.lstrip("0") or "0" if word.isdigit() else word for word in words)
+
+
+def read_catalog(filename: str) -> Dict[str, np.ndarray]:
+    """
+        Read a catalog in OpenNGC CSV format
+        Args:
+            filename : str # path of the CSV file, with at least Name,Type,RA,Dec,Const columns
+        Returns:
+            dict # one array per column, RA and Dec converted to radians
+    """
+    with open(filename, "r", newline="") as csvFile:
+        reader = csv.reader(csvFile, delimiter=",")
+        header = next(reader)
+        rows = list(reader)
+    columns = {
+        name: np.array(values, dtype=str)
+        for name, values in zip(header, zip(*rows) if rows else [[]] * len(header))
+    }
+    columns["RA"] = sexagesimal_to_radians(columns["RA"], hours=True)
+    columns["Dec"] = sexagesimal_to_radians(columns["Dec"])
+    return columns
+
+
+def create_tables(cursor: sqlite3.Cursor) -> None:
+    """
+        Create empty catalog tables, dropping the existing ones
+        Args:
+            cursor : sqlite3.Cursor
+        Returns : None
+    """
     # Create objects types table
     cursor.execute("DROP TABLE IF EXISTS objTypes")
     cursor.execute(
@@ -84,57 +166,155 @@ try:
         "name TEXT NOT NULL, "
         "identifier TEXT NOT NULL UNIQUE)"
     )
-    filename = "data.csv"
-    if True:
-        notngc = True if filename != "data.csv" else False
-        with open(filename, "r") as csvFile:
-            reader = csv.DictReader(csvFile, delimiter=",")
-            # List of columns that are not text and should be transformed in NULL if empty
-            columns_maybe_null = [
-               
-            ]
-            for line in reader:
-                for column in columns_maybe_null:
-                    if line[column] == "":
-                        line[column] = None
-                # Convert RA and Dec in radians
-                if line["RA"] != "":
-                    ra_array = np.array([float(x) for x in line["RA"].split(":")])
-                    ra_rad = np.radians(np.sum(ra_array * [15, 1 / 4, 1 / 240]))
-                else:
-                    ra_rad = None
-                if line["Dec"] != "":
-                    dec_array = np.array([float(x) for x in line["Dec"].split(":")])
-                    if np.signbit(dec_array[0]):
-                        dec_rad = np.radians(
-                            np.sum(dec_array * [1, -1 / 60, -1 / 3600])
-                        )
-                    else:
-                        dec_rad = np.radians(np.sum(dec_array * [1, 1 / 60, 1 / 3600]))
-                else:
-                    dec_rad = None
-                cursor.execute(
-                    "INSERT INTO objects(name,type,ra,dec,const)"
-                    "VALUES(?,?,?,?,?)",
-                    (
-                        line["Name"],
-                        line["Type"],
-                        ra_rad,
-                        dec_rad,
-                        line["Const"],
-                    ),
-                )
-                cursor.execute(
-                    "INSERT INTO objIdentifiers(name,identifier) VALUES(?,?)",
-                    (line["Name"], line["Name"].upper()),
-                )
-                
+
+    # Create spatial index of the objects positions, as points on the unit sphere.
+    # Cone searches become box queries on the 3D coordinates, which don't need any
+    # special handling near the poles or across RA=0
+    cursor.execute("DROP TABLE IF EXISTS objPositions")
     cursor.execute(
-        'CREATE UNIQUE INDEX "idx_identifiers" ON "objIdentifiers" ("identifier");'
+        "CREATE VIRTUAL TABLE objPositions USING rtree("
+        "id, "
+        "minX, maxX, "
+        "minY, maxY, "
+        "minZ, maxZ)"
+    )
+
+    # Create full-text index of the object names for prefix searches, rowid is the
+    # rowid of the object. Identifiers are indexed as separate words with no zero
+    # padding (NGC0070 as "NGC 70"), so that typing "NGC7" finds NGC0007, NGC0070...
+    cursor.execute("DROP TABLE IF EXISTS objNames")
+    cursor.execute(
+        "CREATE VIRTUAL TABLE objNames USING fts5("
+        "identifier UNINDEXED, "
+        "alias, "
+        "commonname, "
+        "prefix='1 2 3 4')"
+    )
+
+
+def insert_catalog(cursor: sqlite3.Cursor, catalog: Dict[str, np.ndarray],
+                   upsert: bool = False) -> int:
+    """
+        Insert the objects of a catalog read by read_catalog
+        Args:
+            cursor : sqlite3.Cursor
+            catalog : dict # columns of the catalog
+            upsert : bool # whether to update objects already in the database instead of failing
+        Returns:
+            int # number of objects inserted or updated
+    """
+    names = catalog["Name"].tolist()
+    ra = catalog["RA"]
+    dec = catalog["Dec"]
+    # Convert to Python objects once for the whole column, NaN becomes NULL
+    ra_values = np.where(np.isnan(ra), None, ra).tolist()
+    dec_values = np.where(np.isnan(dec), None, dec).tolist()
+
+    sql = "INSERT INTO objects(name,type,ra,dec,const) VALUES(?,?,?,?,?)"
+    if upsert:
+        sql += (
+            " ON CONFLICT(name) DO UPDATE SET "
+            "type=excluded.type, ra=excluded.ra, dec=excluded.dec, const=excluded.const"
+        )
+    cursor.executemany(
+        sql,
+        zip(names, catalog["Type"].tolist(), ra_values, dec_values, catalog["Const"].tolist()),
+    )
+    cursor.executemany(
+        "INSERT OR IGNORE INTO objIdentifiers(name,identifier) VALUES(?,?)"
+        if upsert else
+        "INSERT INTO objIdentifiers(name,identifier) VALUES(?,?)",
+        zip(names, np.char.upper(catalog["Name"]).tolist()),
+    )
+
+    # Update the spatial index, objects without coordinates are left out of it
+    rowids = dict(cursor.execute("SELECT name, rowid FROM objects"))
+    ids = [rowids[name] for name in names]
+    if upsert:
+        cursor.executemany("DELETE FROM objPositions WHERE id=?", ((i,) for i in ids))
+        cursor.executemany("DELETE FROM objNames WHERE rowid=?", ((i,) for i in ids))
+    identifiers = np.char.upper(catalog["Name"]).tolist()
+    # OpenNGC lists common names separated by commas
+    commonnames = (
+        np.char.replace(catalog["Common names"], ",", " ").tolist()
+        if "Common names" in catalog else [""] * len(names)
+    )
+    cursor.executemany(
+        "INSERT INTO objNames(rowid,identifier,alias,commonname) VALUES(?,?,?,?)",
+        zip(ids, identifiers, map(identifier_alias, identifiers), commonnames),
     )
-    db.commit()
-except Exception as e:
-    db.rollback()
-    raise e
-finally:
+    valid = ~(np.isnan(ra) | np.isnan(dec))
+    x = (np.cos(dec) * np.cos(ra))[valid].tolist()
+    y = (np.cos(dec) * np.sin(ra))[valid].tolist()
+    z = np.sin(dec)[valid].tolist()
+    valid_ids = np.array(ids, dtype=np.int64)[valid].tolist()
+    cursor.executemany(
+        "INSERT INTO objPositions VALUES(?,?,?,?,?,?,?)",
+        zip(valid_ids, x, x, y, y, z, z),
+    )
+    return len(names)
+
+
+def build_database(output: str = outputFile, catalogs: Iterable[str] = (inputFile,)) -> int:
+    """
+        Build a new catalog database from CSV files
+        Args:
+            output : str # path of the database file, replaced only once complete
+            catalogs : list # CSV files to load, objects in later files update the earlier ones
+        Returns:
+            int # number of objects in the database
+    """
+    tmpFile = output + ".tmp"
+    if os.path.exists(tmpFile):
+        os.remove(tmpFile)
+    db = sqlite3.connect(tmpFile, isolation_level=None)
+    try:
+        cursor = db.cursor()
+        for pragma in buildPragmas:
+            cursor.execute(pragma)
+        cursor.execute("BEGIN")
+        create_tables(cursor)
+        for i, filename in enumerate(catalogs):
+            insert_catalog(cursor, read_catalog(filename), upsert=i > 0)
+        cursor.execute(
+            'CREATE UNIQUE INDEX "idx_identifiers" ON "objIdentifiers" ("identifier");'
+        )
+        # Objects of later files may update earlier ones, count the distinct objects
+        count = cursor.execute("SELECT COUNT(*) FROM objects").fetchone()[0]
+        cursor.execute("COMMIT")
+    except Exception as e:
+        db.close()
+        os.remove(tmpFile)
+        raise e
     db.close()
+    os.replace(tmpFile, output)
+    return count
+
+
+def update_database(catalog: str, output: str = outputFile) -> int:
+    """
+        Insert or update the objects of an extra catalog in an existing database
+        Args:
+            catalog : str # CSV file to load
+            output : str # path of the database file
+        Returns:
+            int # number of objects inserted or updated
+    """
+    columns = read_catalog(catalog)
+    db = sqlite3.connect(output)
+    try:
+        cursor = db.cursor()
+        for pragma in updatePragmas:
+            cursor.execute(pragma)
+        count = insert_catalog(cursor, columns, upsert=True)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise e
+    finally:
+        db.close()
+    return count
+
+
+if __name__ == "__main__":
+    build_database()
@@ -19,6 +19,8 @@ Boston, MA 02110-1301, USA.
 """
 
 import datetime
+import threading
+import time
 import ephem
 import numpy
 
@@ -110,6 +112,165 @@ def parser(observer: ephem.Observer, body) -> list:
     return positions
 
 
+# Bodies available in the ephemeris table
+BODIES = {
+    "sun": ephem.Sun,
+    "moon": ephem.Moon,
+    "mercury": ephem.Mercury,
+    "venus": ephem.Venus,
+    "mars": ephem.Mars,
+    "jupiter": ephem.Jupiter,
+    "saturn": ephem.Saturn,
+    "uranus": ephem.Uranus,
+    "neptune": ephem.Neptune,
+}
+
+
+class EphemerisTable(object):
+    """
+    Positions of the solar system bodies over a local day , computed once on a per-minute grid.
+    Positions at any time of the day are interpolated from the grid , and rise , transit and
+    set times are computed only once per body.
+    """
+
+    def __init__(self, lat: str, lon: str, elevation: float, date: ephem.Date) -> None:
+        """
+        Args :
+            lat : str
+            lon : str
+            elevation : float
+            date : ephem.Date # any time in the local day to cover
+        """
+        self.home = ephem.Observer()
+        self.home.lat = lat
+        self.home.lon = lon
+        self.home.elevation = elevation
+        self.home.date = date
+        # The day starts at local midnight , just like the dates compared by parser()
+        local = ephem.localtime(ephem.Date(date))
+        offset = local - ephem.Date(date).datetime()
+        midnight = datetime.datetime.combine(local.date(), datetime.time()) - offset
+        self.start = float(ephem.Date(midnight))
+        # One extra minute at each end , so that the whole day can be interpolated
+        self.times = self.start + numpy.arange(-1, 24 * 60 + 2) * ephem.minute
+        self._positions = {}
+        self._events = {}
+        self._lock = threading.Lock()
+
+    def covers(self, date: ephem.Date) -> bool:
+        """
+        Check whether a time is inside the local day of the table
+        Args : date : ephem.Date
+        Returns : bool
+        """
+        return self.times[1] <= float(date) <= self.times[-2]
+
+    def _grid(self, name: str) -> numpy.ndarray:
+        """
+        Get the grid of a body , computing it on first use
+        Returns : numpy.ndarray # (4, minutes) R.A. , Dec , Az and Alt in radians , R.A. and Az unwrapped
+        """
+        grid = self._positions.get(name)
+        if grid is None:
+            with self._lock:
+                grid = self._positions.get(name)
+                if grid is None:
+                    observer = ephem.Observer()
+                    observer.lat = self.home.lat
+                    observer.lon = self.home.lon
+                    observer.elevation = self.home.elevation
+                    body = BODIES[name]()
+                    grid = numpy.empty((4, len(self.times)))
+                    for i, t in enumerate(self.times):
+                        observer.date = t
+                        body.compute(observer)
+                        grid[:, i] = body.ra, body.dec, body.az, body.alt
+                    grid[0] = numpy.unwrap(grid[0])
+                    grid[2] = numpy.unwrap(grid[2])
+                    self._positions[name] = grid
+        return grid
+
+    def position(self, name: str, date: ephem.Date) -> tuple:
+        """
+        Get the position of a body at a time of the day
+        Args :
+            name : str # key of BODIES
+            date : ephem.Date
+        Returns : tuple # (ra, dec, az, alt) as ephem angles
+        """
+        grid = self._grid(name)
+        ra, dec, az, alt = (numpy.interp(float(date), self.times, row) for row in grid)
+        return (
+            ephem.hours(ra % (2 * numpy.pi)),
+            ephem.degrees(dec),
+            ephem.degrees(az % (2 * numpy.pi)),
+            ephem.degrees(alt),
+        )
+
+    def events(self, name: str) -> list:
+        """
+        Get the rise , transit and set times of a body , as returned by parser()
+        Args : name : str # key of BODIES
+        Returns : list
+        """
+        events = self._events.get(name)
+        if events is None:
+            with self._lock:
+                events = self._events.get(name)
+                if events is None:
+                    events = parser(self.home, BODIES[name](self.home))
+                    self._events[name] = events
+        return events
+
+
+_ephemeris_tables = {}
+_ephemeris_lock = threading.Lock()
+
+
+def get_ephemeris(observer: ephem.Observer) -> EphemerisTable:
+    """
+    Get the ephemeris table of the day of an observer , the tables are shared between callers
+    Args : observer : ephem.Observer
+    Returns : EphemerisTable
+    """
+    key = (float(observer.lat), float(observer.lon), float(observer.elevation))
+    with _ephemeris_lock:
+        table = _ephemeris_tables.get(key)
+        if table is None or not table.covers(observer.date):
+            table = EphemerisTable(observer.lat, observer.lon, observer.elevation, observer.date)
+            _ephemeris_tables[key] = table
+    return table
+
+
+def _location(observer: ephem.Observer):
+    """
+    Convert an observer to an astropy location
+    Args : observer : ephem.Observer
+    Returns : EarthLocation
+    """
+    from astropy import units as u
+    from astropy.coordinates import EarthLocation
+
+    return EarthLocation(
+        lat=numpy.degrees(observer.lat) * u.deg,
+        lon=numpy.degrees(observer.lon) * u.deg,
+        height=observer.elevation * u.m,
+    )
+
+
+def _local_time(timestamp: float | None) -> str:
+    """
+    Format a UTC unix timestamp like parser() does , "-" if there is no such event
+    Args : timestamp : float | None
+    Returns : str
+    """
+    if timestamp is None:
+        return "-"
+    return ephem.localtime(
+        ephem.Date(datetime.datetime.utcfromtimestamp(timestamp))
+    ).strftime("%H:%M:%S")
+
+
 class Moon(object):
     """
     Show some infomation about moon
@@ -250,13 +411,24 @@ class Moon(object):
         ):
             return "Waning Crescent"
 
+    @property
+    def get_moon_illumination(self) -> float:
+        """
+        Get the illuminated fraction of the moon tonight , looked up in the almanac
+        Args : None
+        Returns : float
+        """
+        from .almanac import almanac
+
+        return almanac.night(ephem.localtime(self.home.date).date(), _location(self.home))["moon_illumination"]
+
     def get_moon_ra(self) -> str:
         """
         Get the current RA of the moon
         Args : None
         Returns : str
         """
-        return ephem.Moon(self.home).ra
+        return get_ephemeris(self.home).position("moon", self.home.date)[0]
 
     def get_moon_dec(self) -> str:
         """
@@ -264,7 +436,7 @@ class Moon(object):
         Args : None
         Returns : str
         """
-        return ephem.Moon(self.home).dec
+        return get_ephemeris(self.home).position("moon", self.home.date)[1]
 
     def get_moon_az(self) -> str:
         """
@@ -272,7 +444,7 @@ class Moon(object):
         Args : None
         Returns : str
         """
-        return numpy.degrees(ephem.Moon(self.home).az)
+        return numpy.degrees(get_ephemeris(self.home).position("moon", self.home.date)[2])
 
     def get_moon_dec(self) -> str:
         """
@@ -280,7 +452,7 @@ class Moon(object):
         Args : None
         Returns : str
         """
-        return numpy.degrees(ephem.Moon(self.home).alt)
+        return numpy.degrees(get_ephemeris(self.home).position("moon", self.home.date)[3])
 
     def get_moon_rise(self) -> str:
         """
@@ -288,7 +460,7 @@ class Moon(object):
         Args : None
         Returns : str
         """
-        return parser(self.home, ephem.Moon(self.home))[0]
+        return get_ephemeris(self.home).events("moon")[0]
 
     def get_moon_set(self) -> str:
         """
@@ -296,7 +468,7 @@ class Moon(object):
         Args : None
         Returns : str
         """
-        return parser(self.home, ephem.Moon(self.home))[2]
+        return get_ephemeris(self.home).events("moon")[2]
 
     def get_moon_transmit(self) -> str:
         """
@@ -304,7 +476,7 @@ class Moon(object):
         Args : None
         Returns : str
         """
-        return parser(self.home, ephem.Moon(self.home))[1]
+        return get_ephemeris(self.home).events("moon")[1]
 
 
 class Sun(object):
@@ -327,7 +499,7 @@ class Sun(object):
         Args : None
         Returns : str
         """
-        return self.get_sun_twilights(self.home)[2][0]
+        return self.get_sun_twilights()[2][0]
 
     @property
     def get_astro_twilight_stop(self) -> str:
@@ -336,7 +508,7 @@ class Sun(object):
         Args : None
         Returns : str
         """
-        return self.get_sun_twilights(self.home)[2][1]
+        return self.get_sun_twilights()[2][1]
 
     @property
     def get_civil_twilight_start(self) -> str:
@@ -345,7 +517,7 @@ class Sun(object):
         Args : None
         Returns : str
         """
-        return self.get_sun_twilights(self.home)[0][0]
+        return self.get_sun_twilights()[0][0]
 
     @property
     def get_civil_twilight_stop(self) -> str:
@@ -354,30 +526,25 @@ class Sun(object):
         Args : None
         Returns : str
         """
-        return self.get_sun_twilights(self.home)[0][1]
+        return self.get_sun_twilights()[0][1]
 
     def get_sun_twilights(self) -> list:
         """
-        Get the sun-twilights for the given observer
-        Args :
-            observer : ephem.Observer
-        Returns : list
+        Get today's sun-twilights of the observer , looked up in the almanac
+        Args : None
+        Returns : list # (start, stop) of the civil , nautical and astronomical twilights
         """
-        results = []
-        # remember entry observer horizon
-        observer_horizon = self.home.horizon
-        # Twilights, their horizons and whether to use the centre of the Sun or not
-        twilights = [("-6", True), ("-12", True), ("-18", True)]
-        for twi in twilights:
-            self.home.horizon = twi[0]
-            try:
-                rising_setting = parser(self.home, ephem.Sun(self.home))
-                results.append((rising_setting[0], rising_setting[2]))
-            except ephem.AlwaysUpError:
-                results.append(("n/a", "n/a"))
-        # reset observer horizon to entry
-        self.home.horizon = observer_horizon
-        return results
+        from .almanac import almanac
+
+        today = ephem.localtime(self.home.date).date()
+        # The morning belongs to the night of yesterday's evening
+        yesterday, tonight = almanac.nights(
+            today - datetime.timedelta(days=1), today, _location(self.home)
+        )
+        return [
+            (_local_time(yesterday[name + "_dawn"]), _local_time(tonight[name + "_dusk"]))
+            for name in ("civil", "nautical", "astro")
+        ]
 
     def get_sun_ra(self) -> str:
         """
@@ -385,7 +552,7 @@ class Sun(object):
         Args : None
         Returns : str
         """
-        return ephem.Sun(self.home).ra
+        return get_ephemeris(self.home).position("sun", self.home.date)[0]
 
     def get_sun_dec(self) -> str:
         """
@@ -393,7 +560,7 @@ class Sun(object):
         Args : None
         Returns : str
         """
-        return ephem.Sun(self.home).dec
+        return get_ephemeris(self.home).position("sun", self.home.date)[1]
 
     def get_sun_az(self) -> str:
         """
@@ -401,7 +568,7 @@ class Sun(object):
         Args : None
         Returns : str
         """
-        return numpy.degrees(ephem.Sun(self.home).az)
+        return numpy.degrees(get_ephemeris(self.home).position("sun", self.home.date)[2])
 
     def get_sun_dec(self) -> str:
         """
@@ -409,7 +576,7 @@ class Sun(object):
         Args : None
         Returns : str
         """
-        return numpy.degrees(ephem.Sun(self.home).alt)
+        return numpy.degrees(get_ephemeris(self.home).position("sun", self.home.date)[3])
 
     def get_sun_rise(self) -> str:
         """
@@ -417,7 +584,7 @@ class Sun(object):
         Args : None
         Returns : str
         """
-        return parser(self.home, ephem.Sun(self.home))[0]
+        return get_ephemeris(self.home).events("sun")[0]
 
     def get_sun_set(self) -> str:
         """
@@ -425,7 +592,7 @@ class Sun(object):
         Args : None
         Returns : str
         """
-        return parser(self.home, ephem.Sun(self.home))[2]
+        return get_ephemeris(self.home).events("sun")[2]
 
     def get_sun_transmit(self) -> str:
         """
@@ -433,7 +600,7 @@ class Sun(object):
         Args : None
         Returns : str
         """
-        return parser(self.home, ephem.Sun(self.home))[1]
+        return get_ephemeris(self.home).events("sun")[1]
 
 
 class OtherPlanet(object):
@@ -455,15 +622,7 @@ class OtherPlanet(object):
         Args : None
         Returns : dict
         """
-        return {
-            "mercury_rise": "%s" % parser(self.home, ephem.Mercury(self.home))[0],
-            "mercury_transit": "%s" % parser(self.home, ephem.Mercury(self.home))[1],
-            "mercury_set": "%s" % parser(self.home, ephem.Mercury(self.home))[2],
-            "mercury_az": "%.2f°" % numpy.degrees(ephem.Mercury(self.home).az),
-            "mercury_alt": "%.2f°" % numpy.degrees(ephem.Mercury(self.home).alt),
-            "mercury_ra": "%s" % ephem.Mercury(self.home).ra,
-            "mercury_dec": "%s" % ephem.Mercury(self.home).dec,
-        }
+        return self._planet("mercury", with_coordinates=True)
 
     def venus(self) -> dict:
         """
@@ -471,70 +630,55 @@ class OtherPlanet(object):
         Args : None
         Returns : dict
         """
-        return {
-            "venus_rise": "%s" % parser(self.home, ephem.Venus(self.home))[0],
-            "venus_transit": "%s" % parser(self.home, ephem.Venus(self.home))[1],
-            "venus_set": "%s" % parser(self.home, ephem.Venus(self.home))[2],
-            "venus_az": "%.2f°" % numpy.degrees(ephem.Venus(self.home).az),
-            "venus_alt": "%.2f°" % numpy.degrees(ephem.Venus(self.home).alt),
-            "venus_ra": "%s" % ephem.Venus(self.home).ra,
-            "venus_dec": "%s" % ephem.Venus(self.home).dec,
-        }
+        return self._planet("venus", with_coordinates=True)
 
     def Mars(self) -> dict:
         """"""
-        return {
-            "mars_rise": "%s" % parser(self.home, ephem.Mars(self.home))[0],
-            "mars_transit": "%s" % parser(self.home, ephem.Mars(self.home))[1],
-            "mars_set": "%s" % parser(self.home, ephem.Mars(self.home))[2],
-            "mars_az": "%.2f°" % numpy.degrees(ephem.Mars(self.home).az),
-            "mars_alt": "%.2f°" % numpy.degrees(ephem.Mars(self.home).alt),
-        }
+        return self._planet("mars", with_coordinates=False)
 
     def Jupiter(self) -> dict:
         """"""
-        return {
-            "jupiter_rise": "%s" % parser(self.home, ephem.Jupiter(self.home))[0],
-            "jupiter_transit": "%s" % parser(self.home, ephem.Jupiter(self.home))[1],
-            "jupiter_set": "%s" % parser(self.home, ephem.Jupiter(self.home))[2],
-            "jupiter_az": "%.2f°" % numpy.degrees(ephem.Jupiter(self.home).az),
-            "jupiter_alt": "%.2f°" % numpy.degrees(ephem.Jupiter(self.home).alt),
-        }
+        return self._planet("jupiter", with_coordinates=False)
 
     def Saturn(self) -> dict:
         """"""
-        return {
-            "saturn_rise": "%s" % parser(self.home, ephem.Saturn(self.home))[0],
-            "saturn_transit": "%s" % parser(self.home, ephem.Saturn(self.home))[1],
-            "saturn_set": "%s" % parser(self.home, ephem.Saturn(self.home))[2],
-            "saturn_az": "%.2f°" % numpy.degrees(ephem.Saturn(self.home).az),
-            "saturn_alt": "%.2f°" % numpy.degrees(ephem.Saturn(self.home).alt),
-        }
+        return self._planet("saturn", with_coordinates=False)
 
     def Uranus(self) -> dict:
         """"""
-        return {
-            "uranus_rise": "%s" % parser(self.home, ephem.Uranus(self.home))[0],
-            "uranus_transit": "%s" % parser(self.home, ephem.Uranus(self.home))[1],
-            "uranus_set": "%s" % parser(self.home, ephem.Uranus(self.home))[2],
-            "uranus_az": "%.2f°" % numpy.degrees(ephem.Uranus(self.home).az),
-            "uranus_alt": "%.2f°" % numpy.degrees(ephem.Uranus(self.home).alt),
-        }
+        return self._planet("uranus", with_coordinates=False)
 
     def Neptune(self) -> dict:
         """"""
-        return {
-            "neptune_rise": "%s" % parser(self.home, ephem.Neptune(self.home))[0],
-            "neptune_transit": "%s" % parser(self.home, ephem.Neptune(self.home))[1],
-            "neptune_set": "%s" % parser(self.home, ephem.Neptune(self.home))[2],
-            "neptune_az": "%.2f°" % numpy.degrees(ephem.Neptune(self.home).az),
-            "neptune_alt": "%.2f°" % numpy.degrees(ephem.Neptune(self.home).alt),
+        return self._planet("neptune", with_coordinates=False)
+
+    def _planet(self, name: str, with_coordinates: bool) -> dict:
+        """
+        Get real-time information of a planet from the ephemeris table
+        Args :
+            name : str # key of BODIES
+            with_coordinates : bool # whether to include R.A. and Dec
+        Returns : dict
+        """
+        table = get_ephemeris(self.home)
+        events = table.events(name)
+        ra, dec, az, alt = table.position(name, self.home.date)
+        info = {
+            f"{name}_rise": "%s" % events[0],
+            f"{name}_transit": "%s" % events[1],
+            f"{name}_set": "%s" % events[2],
+            f"{name}_az": "%.2f°" % numpy.degrees(az),
+            f"{name}_alt": "%.2f°" % numpy.degrees(alt),
         }
+        if with_coordinates:
+            info[f"{name}_ra"] = "%s" % ra
+            info[f"{name}_dec"] = "%s" % dec
+        return info
 
 
 class NorthPolar(object):
     """
-    Show infomation about other planets in our solar system
+    Show infomation about Polaris for polar alignment
     """
 
     def __init__(self, lat: str, lon: str, elevation: float) -> None:
@@ -549,64 +693,130 @@ class NorthPolar(object):
         """
         Get the polar data for a given observer
         Args : None
-        Returns : list
+        Returns : list # hour angle in degrees , next transit and altitude
         """
-        polaris_data = []
+        state = get_polaris_model(self.home).state(_unix(self.home.date))
+        return [
+            state["polaris_hour_angle"],
+            state["polaris_next_transit"],
+            ephem.degrees(numpy.radians(state["polaris_alt"])),
+        ]
 
-        """
-        lst = 100.46 + 0.985647 * d + lon + 15 * ut [based on http://www.stargazing.net/kepler/altaz.html]
-        d - the days from J2000 (1200 hrs UT on Jan 1st 2000 AD), including the fraction of a day
-        lon - your longitude in decimal degrees, East positive
-        ut - the universal time in decimal hours
-        """
+    def get_polar_info(self) -> dict:
+        """"""
+        polaris_data = self.get_polaris_data()
+        return {
+            "polaris_hour_angle": polaris_data[0],
+            "polaris_next_transit": "%s" % polaris_data[1],
+            "polaris_alt": "%.2f°" % numpy.degrees(polaris_data[2]),
+        }
 
-        j2000 = ephem.Date("2000/01/01 12:00:00")
-        d = self.home.date - j2000
 
-        lon = numpy.rad2deg(float(repr(self.home.lon)))
+# Polaris , from the Hipparcos catalogue
+POLARIS = "Polaris,f|M|F7,2:31:48.704,89:15:50.72,2.02,2000"
 
-        utstr = self.home.date.datetime().strftime("%H:%M:%S")
-        ut = (
-            float(utstr.split(":")[0])
-            + float(utstr.split(":")[1]) / 60
-            + float(utstr.split(":")[2]) / 3600
-        )
+# Length of the sidereal day in seconds
+SIDEREAL_DAY = 86164.0905
+
+# A model is rebuilt once it is older than this , in seconds
+POLARIS_MODEL_LIFETIME = 6 * 3600
 
-        lst = 100.46 + 0.985647 * d + lon + 15 * ut
-        lst = lst - int(lst / 360) * 360
 
-        polaris = ephem.readdb("Polaris,f|M|F7,2:31:48.704,89:15:50.72,2.02,2000")
-        polaris.compute()
-        polaris_ra_deg = numpy.rad2deg(float(repr(polaris.ra)))
+def _unix(date: ephem.Date) -> float:
+    """
+    Convert an ephem date to a UTC unix timestamp
+    Args : date : ephem.Date
+    Returns : float
+    """
+    return (float(date) - float(ephem.Date("1970/1/1"))) * 86400
 
-        # Polaris Hour Angle = LST - RA Polaris [expressed in degrees or 15*(h+m/60+s/3600)]
-        pha = lst - polaris_ra_deg
 
-        # normalize
-        if pha < 0:
-            pha += 360
-        elif pha > 360:
-            pha -= 360
-        # append polaris hour angle
-        polaris_data.append(pha)
+class PolarisModel(object):
+    """
+    Hour angle and altitude of Polaris for an observer. The apparent place of Polaris and the sidereal
+    time are computed once by ephem , the sidereal time then drifts linearly , so evaluating the model
+    is only a few multiplications and can be done many times per second.
+    """
 
-        # append polaris next transit
+    def __init__(self, lat: str, lon: str, elevation: float, date: ephem.Date | None = None) -> None:
+        """
+        Args :
+            lat : str
+            lon : str
+            elevation : float
+            date : ephem.Date # reference time of the model , default is now
+        """
+        observer = ephem.Observer()
+        observer.lat = lat
+        observer.lon = lon
+        observer.elevation = elevation
+        observer.date = date if date is not None else datetime.datetime.utcnow()
+        polaris = ephem.readdb(POLARIS)
+        polaris.compute(observer)
+
+        self.epoch = _unix(observer.date)
+        self.lst = float(observer.sidereal_time())
+        self.ra = float(polaris.ra)
+        self.dec = float(polaris.dec)
+        self.lat = float(observer.lat)
         try:
-            polaris_data.append(
-                ephem.localtime(self.home.next_transit(polaris)).strftime("%H:%M:%S")
-            )
+            self.transit = _unix(observer.next_transit(polaris))
         except (ephem.NeverUpError, ephem.AlwaysUpError):
-            polaris_data.append("-")
-        # append polaris alt
-        polaris_data.append(polaris.alt)
+            self.transit = None
 
-        return polaris_data
+    def hour_angle(self, timestamp: float) -> float:
+        """
+        Get the hour angle of Polaris
+        Args : timestamp : float # UTC unix timestamp
+        Returns : float # radians in [0 , 2pi)
+        """
+        lst = self.lst + 2 * numpy.pi * (timestamp - self.epoch) / SIDEREAL_DAY
+        return (lst - self.ra) % (2 * numpy.pi)
 
-    def get_polar_info(self) -> dict:
-        """"""
-        polaris_data = self.get_polaris_data(self.home)
+    def state(self, timestamp: float | None = None) -> dict:
+        """
+        Get the position of Polaris at a time
+        Args : timestamp : float # UTC unix timestamp , default is now
+        Returns : dict
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        ha = self.hour_angle(timestamp)
+        sin_alt = numpy.sin(self.lat) * numpy.sin(self.dec) + numpy.cos(self.lat) * numpy.cos(
+            self.dec
+        ) * numpy.cos(ha)
+        alt = numpy.degrees(numpy.arcsin(numpy.clip(sin_alt, -1, 1)))
+        # Refraction for the standard atmosphere , by Bennett
+        if alt > -1:
+            alt += 1 / numpy.tan(numpy.radians(alt + 7.31 / (alt + 4.4))) / 60
+        transit = "-"
+        if self.transit is not None:
+            next_transit = self.transit + numpy.ceil(
+                max(timestamp - self.transit, 0) / SIDEREAL_DAY
+            ) * SIDEREAL_DAY
+            transit = datetime.datetime.fromtimestamp(next_transit).strftime("%H:%M:%S")
         return {
-            "polaris_hour_angle": polaris_data[0],
-            "polaris_next_transit": "%s" % polaris_data[1],
-            "polaris_alt": "%.2f°" % numpy.degrees(polaris_data[2]),
+            "timestamp": timestamp,
+            "polaris_hour_angle": float(numpy.degrees(ha)),
+            "polaris_alt": float(alt),
+            "polaris_next_transit": transit,
         }
+
+
+_polaris_models = {}
+_polaris_lock = threading.Lock()
+
+
+def get_polaris_model(observer: ephem.Observer) -> PolarisModel:
+    """
+    Get the Polaris model of an observer , the models are shared and rebuilt every few hours
+    Args : observer : ephem.Observer
+    Returns : PolarisModel
+    """
+    key = (float(observer.lat), float(observer.lon), float(observer.elevation))
+    with _polaris_lock:
+        model = _polaris_models.get(key)
+        if model is None or abs(_unix(observer.date) - model.epoch) > POLARIS_MODEL_LIFETIME:
+            model = PolarisModel(observer.lat, observer.lon, observer.elevation, observer.date)
+            _polaris_models[key] = model
+    return model
@@ -0,0 +1,270 @@
+# coding=utf-8
+
+"""
+
+Copyright(c) 2022-2023 Max Qian  <lightapt.com>
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Library General Public
+License version 3 as published by the Free Software Foundation.
+This library is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Library General Public License for more details.
+You should have received a copy of the GNU Library General Public License
+along with this library; see the file COPYING.LIB.  If not, write to
+the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+Boston, MA 02110-1301, USA.
+
+"""
+
+import datetime
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from astropy import units as u
+from astropy.coordinates import AltAz, EarthLocation, SkyCoord, TETE, get_sun
+from astropy.time import Time
+
+from . import calculator
+
+# Sidereal day expressed in solar days
+SIDEREAL_RATE = 1.00273790935
+
+class NightPlan(object):
+    """
+        Visibility of many objects over a night , one row per object and one column per time step.
+        All of the times are UTC unix timestamps and all of the angles are in degrees ,
+        events which don't happen during the night are NaN.
+
+        Attributes :
+            times : np.ndarray # (T,) time grid
+            dark : np.ndarray # (T,) whether the Sun is below the twilight altitude
+            altitude : np.ndarray # (N, T) altitude of the objects
+            azimuth : np.ndarray # (N, T) azimuth of the objects , from North through East
+            airmass : np.ndarray # (N, T) airmass , NaN below the horizon
+            rise : np.ndarray # (N,) first time the object rises above the horizon
+            transit : np.ndarray # (N,) time of the upper culmination
+            set : np.ndarray # (N,) first time the object sets below the horizon
+            max_altitude : np.ndarray # (N,) highest altitude while dark
+            max_altitude_time : np.ndarray # (N,) time of the highest altitude while dark
+    """
+
+    def __init__(self, times : np.ndarray, dark : np.ndarray, altitude : np.ndarray,
+                 azimuth : np.ndarray, airmass : np.ndarray, rise : np.ndarray,
+                 transit : np.ndarray, set : np.ndarray, max_altitude : np.ndarray,
+                 max_altitude_time : np.ndarray) -> None:
+        self.times = times
+        self.dark = dark
+        self.altitude = altitude
+        self.azimuth = azimuth
+        self.airmass = airmass
+        self.rise = rise
+        self.transit = transit
+        self.set = set
+        self.max_altitude = max_altitude
+        self.max_altitude_time = max_altitude_time
+
+    def visible(self, min_altitude : float = 30) -> np.ndarray:
+        """
+            Select the objects which are high enough during the night
+            Args :
+                min_altitude : float # minimum altitude reached while dark , in degrees
+            Returns : np.ndarray # indices of the objects , highest first
+        """
+        with np.errstate(invalid="ignore"):
+            indices = np.flatnonzero(self.max_altitude >= min_altitude)
+        return indices[np.argsort(-self.max_altitude[indices], kind="stable")]
+
+def tonight(location : EarthLocation, now : datetime.datetime | None = None) -> datetime.date:
+    """
+        Get the date of the current night at the location , the night of a date starts at its local noon
+        Args :
+            location : EarthLocation
+            now : datetime # UTC time , default is now
+        Returns : datetime.date
+    """
+    if now is None:
+        now = datetime.datetime.utcnow()
+    local_mean_time = now + datetime.timedelta(hours=location.lon.to_value(u.deg) / 15)
+    return (local_mean_time - datetime.timedelta(hours=12)).date()
+
+def night_grid(date : datetime.date, location : EarthLocation, step : float = 10) -> Time:
+    """
+        Build the time grid of a night , from local mean noon of the date to the next one
+        Args :
+            date : datetime.date # date of the evening
+            location : EarthLocation
+            step : float # minutes between two time steps
+        Returns : Time # UTC times
+    """
+    start = Time(datetime.datetime(date.year, date.month, date.day, 12), scale="utc") \
+        - location.lon.to_value(u.deg) / 15 * u.hour
+    count = int(round(24 * 60 / step)) + 1
+    return start + np.arange(count) * step * u.min
+
+def airmass(altitude : np.ndarray) -> np.ndarray:
+    """
+        Airmass from the altitude with the Kasten & Young (1989) formula , which stays finite down to the horizon
+        Args :
+            altitude : np.ndarray # degrees
+        Returns : np.ndarray # NaN below the horizon
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        x = 1 / (np.sin(np.radians(altitude)) + 0.50572 * (altitude + 6.07995) ** -1.6364)
+    return np.where(altitude >= 0, x, np.nan)
+
+def _first_crossing(altitude : np.ndarray, times : np.ndarray, horizon : float, rising : bool) -> np.ndarray:
+    """
+        Time of the first horizon crossing of each row , linearly interpolated between time steps
+    """
+    above = altitude > horizon
+    if rising:
+        crossing = ~above[:, :-1] & above[:, 1:]
+    else:
+        crossing = above[:, :-1] & ~above[:, 1:]
+    found = crossing.any(axis=1)
+    index = np.argmax(crossing, axis=1)
+    rows = np.arange(len(altitude))
+    a0 = altitude[rows, index].astype(float)
+    a1 = altitude[rows, index + 1].astype(float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        fraction = np.clip((horizon - a0) / (a1 - a0), 0, 1)
+    result = times[index] + fraction * (times[index + 1] - times[index])
+    return np.where(found, result, np.nan)
+
+def plan_night(ra : np.ndarray, dec : np.ndarray, location : EarthLocation, times : Time,
+               horizon : float = 0, sun_altitude : float = -12) -> NightPlan:
+    """
+        Compute the visibility of many objects over a time grid in a single broadcast
+        Args :
+            ra : np.ndarray # J2000 R.A. of the objects in degrees , NaN if unknown
+            dec : np.ndarray # J2000 Dec of the objects in degrees , NaN if unknown
+            location : EarthLocation # the observer
+            times : Time # time grid , usually from night_grid()
+            horizon : float # altitude of the horizon in degrees
+            sun_altitude : float # the night is dark when the Sun is below this altitude
+        Returns : NightPlan
+        NOTE : Refraction is ignored and the objects are precessed once for the middle of the grid ,
+            the error is well below the size of a time step
+    """
+    ra = np.atleast_1d(np.asarray(ra, dtype=float))
+    dec = np.atleast_1d(np.asarray(dec, dtype=float))
+    unix = times.unix
+
+    # Apparent place of all the objects , computed once for the whole night
+    apparent = np.full((2, len(ra)), np.nan)
+    known = np.isfinite(ra) & np.isfinite(dec)
+    if known.any():
+        coords = SkyCoord(ra[known] * u.deg, dec[known] * u.deg, frame="icrs") \
+            .transform_to(TETE(obstime=times[len(times) // 2]))
+        apparent[0, known] = coords.ra.rad
+        apparent[1, known] = coords.dec.rad
+    ra_app, dec_app = apparent[0][:, None], apparent[1][:, None]
+
+    lst = times.sidereal_time("apparent", longitude=location.lon).rad[None, :]
+    lat = location.lat.rad
+    ha = lst - ra_app
+    sin_dec, cos_dec = np.sin(dec_app), np.cos(dec_app)
+    sin_alt = np.sin(lat) * sin_dec + np.cos(lat) * cos_dec * np.cos(ha)
+    altitude = np.degrees(np.arcsin(np.clip(sin_alt, -1, 1))).astype(np.float32)
+    azimuth = np.degrees(np.arctan2(
+        -cos_dec * np.sin(ha),
+        sin_dec * np.cos(lat) - cos_dec * np.sin(lat) * np.cos(ha)
+    )) % 360
+    azimuth = azimuth.astype(np.float32)
+    del sin_alt, ha
+
+    # Upper culmination , the hour angle grows at the sidereal rate
+    ha_start = (lst[0, 0] - apparent[0]) % (2 * np.pi)
+    transit = unix[0] + (2 * np.pi - ha_start) % (2 * np.pi) / (2 * np.pi * SIDEREAL_RATE) * 86400
+    transit = np.where(transit <= unix[-1], transit, np.nan)
+
+    sun = get_sun(times).transform_to(AltAz(obstime=times, location=location))
+    dark = sun.alt.to_value(u.deg) < sun_altitude
+
+    dark_altitude = np.where(dark[None, :], altitude, -np.inf)
+    best = np.argmax(dark_altitude, axis=1)
+    max_altitude = dark_altitude[np.arange(len(ra)), best].astype(float)
+    has_max = np.isfinite(max_altitude) & known
+    max_altitude = np.where(has_max, max_altitude, np.nan)
+    max_altitude_time = np.where(has_max, unix[best], np.nan)
+
+    return NightPlan(
+        times = unix,
+        dark = dark,
+        altitude = altitude,
+        azimuth = azimuth,
+        airmass = airmass(altitude).astype(np.float32),
+        rise = _first_crossing(altitude, unix, horizon, rising=True),
+        transit = transit,
+        set = _first_crossing(altitude, unix, horizon, rising=False),
+        max_altitude = max_altitude,
+        max_altitude_time = max_altitude_time
+    )
+
+class VisibilityPlanner(object):
+    """
+        Plan the visibility of the whole catalog , the plans are cached per night and site
+    """
+
+    def __init__(self, step : float = 10, horizon : float = 0, sun_altitude : float = -12, max_plans : int = 4) -> None:
+        """
+            Args :
+                step : float # minutes between two time steps
+                horizon : float # altitude of the horizon in degrees
+                sun_altitude : float # the night is dark when the Sun is below this altitude
+                max_plans : int # number of plans kept in the cache
+        """
+        self.step = step
+        self.horizon = horizon
+        self.sun_altitude = sun_altitude
+        self.max_plans = max_plans
+        self._plans = OrderedDict()
+        self._lock = threading.Lock()
+
+    def plan(self, date : datetime.date | None = None, location : EarthLocation | None = None) -> NightPlan:
+        """
+            Get the plan of the catalog objects for a night , rows follow the order of search.catalog_index
+            Args :
+                date : datetime.date # date of the evening , default is tonight
+                location : EarthLocation # default is the location set in calculator
+            Returns : NightPlan
+        """
+        from .search import catalog_index
+
+        if location is None:
+            location = calculator.location
+        if location is None:
+            raise ValueError("Observer location is not set")
+        if date is None:
+            date = tonight(location)
+
+        data = catalog_index.data
+        key = (date, location.lat.to_value(u.deg), location.lon.to_value(u.deg),
+               location.height.to_value(u.m), self.step, self.horizon, self.sun_altitude)
+        with self._lock:
+            cached = self._plans.get(key)
+            # The catalog may have been reloaded since the plan was computed
+            if cached is not None and cached[0] is data:
+                self._plans.move_to_end(key)
+                return cached[1]
+
+        plan = plan_night(np.degrees(data["ra"]), np.degrees(data["dec"]), location,
+                          night_grid(date, location, self.step), self.horizon, self.sun_altitude)
+        with self._lock:
+            self._plans[key] = (data, plan)
+            self._plans.move_to_end(key)
+            while len(self._plans) > self.max_plans:
+                self._plans.popitem(last=False)
+        return plan
+
+    def clear(self) -> None:
+        """
+            Drop all of the cached plans
+        """
+        with self._lock:
+            self._plans.clear()
+
+visibility_planner = VisibilityPlanner()
@@ -18,12 +18,18 @@ Boston, MA 02110-1301, USA.
 
 """
 
-from functools import cached_property
-from typing import Generator, List, Tuple, Optional, Union
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property, lru_cache
+from typing import Any, Callable, Generator, List, Tuple, Optional, Union
+import asyncio
 import json
 import numpy as np
+import os
 import re
 import sqlite3
+import threading
+import time
 
 from typing import Optional
 
@@ -73,7 +79,20 @@ class UnknownIdentifier(Exception):
         else:  # pragma: no cover
             super().__init__('Unrecognized object name.')
 
-DBPATH = "data.db"
+class CatalogBusy(Exception):
+    """
+    Raised when too many catalog queries are already waiting to run.
+
+    Async queries are run on a small pool of threads with a bounded queue,
+    so that a burst of requests can't pile up behind slow queries.
+    """
+    def __init__(self, text: Optional[str] = None):
+        if text is not None:
+            super().__init__(text)
+        else:  # pragma: no cover
+            super().__init__('Too many catalog queries pending.')
+
+DBPATH = os.path.join(os.path.dirname(__file__), "data.db")
 
 PATTERNS = {'NGC|IC': r'^((?:NGC|IC)\s?)(\d{1,4})\s?((NED)(\d{1,2})|[A-Z]{1,2})?$',
             'Messier': r'^(M\s?)(\d{1,3})$',
@@ -91,6 +110,273 @@ PATTERNS = {'NGC|IC': r'^((?:NGC|IC)\s?)(\d{1,4})\s?((NED)(\d{1,2})|[A-Z]{1,2})?
             }
 
 
+class CatalogConnection(object):
+    """Shared read-only access to the catalog database.
+
+    SQLite connections can't be shared between threads, so one connection is
+    opened lazily for each thread and then reused by every query issued from it.
+    Each connection keeps its own cache of prepared statements (keyed by the SQL
+    text), so queries should pass their values as parameters instead of
+    formatting them into the statement.
+
+    The instance also keeps some statistics about the queries it has run:
+
+            >>> from pyongc.ongc import catalog_db
+            >>> catalog_db.stats #doctest: +SKIP
+            {'connections': 1, 'queries': 3, 'rows': 3, 'total_time': 0.0004, 'mean_time': 0.00013}
+
+    """
+
+    def __init__(self, path: str, cached_statements: int = 256):
+        """Connection manager constructor.
+
+        Args:
+            path: path of the SQLite database file
+            cached_statements: number of prepared statements cached for each connection
+        """
+        self._path = path
+        self._cached_statements = cached_statements
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._queries = 0
+        self._rows = 0
+        self._total_time = 0.
+        self._watch = None
+
+    @property
+    def path(self) -> str:
+        """Path of the database file."""
+        return self._path
+
+    @property
+    def stats(self) -> dict:
+        """Statistics about the queries run so far.
+
+        Returns:
+            A dict with the number of open connections, the number of executed queries,
+            the number of fetched rows, and the total and mean query time in seconds.
+        """
+        with self._lock:
+            return {'connections': len(self._connections),
+                    'queries': self._queries,
+                    'rows': self._rows,
+                    'total_time': self._total_time,
+                    'mean_time': self._total_time / self._queries if self._queries else 0.,
+                    }
+
+    def reset_stats(self) -> None:
+        """Reset query statistics."""
+        with self._lock:
+            self._queries = 0
+            self._rows = 0
+            self._total_time = 0.
+
+    def watch(self, func: Optional[Callable[[], None]]) -> None:
+        """Set the function called by `check`.
+
+        Args:
+            func: function detecting a change of the database file, None to remove it
+        """
+        self._watch = func
+
+    def check(self) -> None:
+        """Detect a change of the database file, before a query or any use of catalog data."""
+        if self._watch is not None:
+            self._watch()
+
+    def connection(self) -> sqlite3.Connection:
+        """Return the connection for the calling thread, opening it if needed.
+
+        The database file is checked first, connections to a replaced file are closed
+        and opened again.
+
+        Raises:
+            OSError: If the database file can't be opened.
+        """
+        self.check()
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            try:
+                db = sqlite3.connect(f'file:{self._path}?mode=ro', uri=True,
+                                     cached_statements=self._cached_statements)
+            except sqlite3.Error:
+                raise OSError(f'There was a problem accessing database file at {self._path}')
+            self._local.db = db
+            with self._lock:
+                self._connections.append(db)
+        return db
+
+    def fetchone(self, sql: str, args: tuple = ()) -> Optional[tuple]:
+        """Execute a query and return its first row.
+
+        Args:
+            sql: the query to run
+            args: values bound to the query placeholders
+
+        Returns:
+            Selected row data from database or None.
+        """
+        start = time.perf_counter()
+        row = self.connection().execute(sql, args).fetchone()
+        self._record(time.perf_counter() - start, 0 if row is None else 1)
+        return row
+
+    def fetchall(self, sql: str, args: tuple = ()) -> List[tuple]:
+        """Execute a query and return all the rows.
+
+        Args:
+            sql: the query to run
+            args: values bound to the query placeholders
+
+        Returns:
+            Selected rows data from database.
+        """
+        start = time.perf_counter()
+        rows = self.connection().execute(sql, args).fetchall()
+        self._record(time.perf_counter() - start, len(rows))
+        return rows
+
+    def close(self) -> None:
+        """Close every connection opened by this manager.
+
+        Connections are opened again on demand by the next query.
+        """
+        with self._lock:
+            connections, self._connections = self._connections, []
+            # Drop the thread-local references too, otherwise the other threads
+            # would keep using their closed connection
+            self._local = threading.local()
+        for db in connections:
+            try:
+                db.close()
+            except sqlite3.ProgrammingError:  # pragma: no cover
+                # Connection belongs to another thread which is still running
+                pass
+
+    def _record(self, elapsed: float, rows: int) -> None:
+        with self._lock:
+            self._queries += 1
+            self._rows += rows
+            self._total_time += elapsed
+
+
+catalog_db = CatalogConnection(DBPATH)
+
+
+class ObjectCache(object):
+    """Size-bounded LRU cache of object lookups.
+
+    Entries are keyed by the normalized identifier and hold the database row of the
+    object, so every alias of a name shares the same entry. Identifiers not found in
+    the database are cached too, as well as duplicated records resolved to their
+    main object.
+
+    The cache is emptied when the database file changes, and `on_change` is called
+    so that other holders of catalog data can reload it.
+
+            >>> from pyongc.ongc import object_cache
+            >>> object_cache.stats #doctest: +SKIP
+            {'size': 12, 'maxsize': 4096, 'hits': 230, 'misses': 12}
+
+    """
+
+    def __init__(self, path: str, maxsize: int = 4096,
+                 on_change: Optional[Callable[[], None]] = None):
+        """Object cache constructor.
+
+        Args:
+            path: path of the database file to watch for changes
+            maxsize: maximum number of cached identifiers
+            on_change: function called when a change of the database file is detected
+        """
+        self._path = path
+        self._maxsize = maxsize
+        self._on_change = on_change
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._stamp = self._file_stamp()
+        self._hits = 0
+        self._misses = 0
+
+    @property
+    def stats(self) -> dict:
+        """Current size and hit/miss counters of the cache."""
+        with self._lock:
+            return {'size': len(self._entries),
+                    'maxsize': self._maxsize,
+                    'hits': self._hits,
+                    'misses': self._misses,
+                    }
+
+    def lookup(self, key: tuple) -> Tuple[bool, Optional[tuple]]:
+        """Search an entry in the cache.
+
+        Args:
+            key: normalized identifier
+
+        Returns:
+            `(found, row)`
+
+            Whether the key is in the cache, and the cached row or None if
+            the object is known not to be in the database.
+        """
+        self.check_file()
+        with self._lock:
+            try:
+                row = self._entries[key]
+            except KeyError:
+                self._misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return True, row
+
+    def store(self, key: tuple, row: Optional[tuple]) -> None:
+        """Add an entry to the cache, evicting the least recently used one if full.
+
+        Args:
+            key: normalized identifier
+            row: database row of the object, None if not found
+        """
+        with self._lock:
+            self._entries[key] = row
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Remove all the entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self._hits = 0
+            self._misses = 0
+
+    def _file_stamp(self) -> Optional[tuple]:
+        try:
+            st = os.stat(self._path)
+        except OSError:
+            return None
+        return st.st_ino, st.st_size, st.st_mtime_ns
+
+    def check_file(self) -> None:
+        """Empty the cache and call `on_change` if the database file changed since last check."""
+        stamp = self._file_stamp()
+        if stamp == self._stamp:
+            return
+        with self._lock:
+            changed = stamp != self._stamp
+            self._stamp = stamp
+            self._entries.clear()
+        if changed and self._on_change is not None:
+            self._on_change()
+
+# Columns needed to build an Object straight from a row of the objects table
+OBJECT_COLS = 'objects.name, objects.type, objects.ra, objects.dec, objects.const'
+
+CACHEPATH = os.path.join(os.path.dirname(__file__), "data.npy")
+
+
 class Object(object):
     """Describes a Deep Sky Object from ONGC database.
 
@@ -128,34 +414,71 @@ class Object(object):
 
         catalog, objectname = _recognize_name(name.upper())
 
+        key = (catalog, objectname, returndup)
+        found, objectData = object_cache.lookup(key)
+        if not found:
+            objectData = self._lookup(catalog, objectname, returndup)
+            object_cache.store(key, objectData)
+
+        if objectData is None:
+            raise ObjectNotFound(objectname)
+
+        # Assign object properties
+        self._name = objectData[0]
+        self._type = objectData[1]
+        self._ra = objectData[3]
+        self._dec = objectData[4]
+        self._const = objectData[5]
+
+    @staticmethod
+    def _lookup(catalog: str, objectname: str, returndup: bool) -> Optional[tuple]:
+        """Query the database for an object.
+
+        Args:
+            catalog: catalog name as returned by `_recognize_name`
+            objectname: normalized object identifier
+            returndup: If set to True, don't resolve Dup objects.
+
+        Returns:
+            Selected row data from database or None if the object isn't found.
+        """
         cols = ('objects.name, objects.type, objTypes.typedesc, ra, dec, const')
         tables = ('objects JOIN objTypes ON objects.type = objTypes.type '
                   'JOIN objIdentifiers ON objects.name = objIdentifiers.name')
         if catalog == 'Messier':
-            params = f'messier="{objectname}"'
+            params = 'messier=?'
         else:
-            params = f'objIdentifiers.identifier="{objectname}"'
-        objectData = _queryFetchOne(cols, tables, params)
-
-        if objectData is None:
-            raise ObjectNotFound(objectname)
+            params = 'objIdentifiers.identifier=?'
+        objectData = _queryFetchOne(cols, tables, params, (objectname, ))
 
         # If object is a duplicate then return the main object
-        if objectData[2] == "Dup" and not returndup:
+        if objectData is not None and objectData[2] == "Dup" and not returndup:
             if objectData[26] != "":
                 objectname = f'NGC{objectData[26]}'
             else:
                 objectname = f'IC{objectData[27]}'
-            params = f'objIdentifiers.identifier="{objectname}"'
-            objectData = _queryFetchOne(cols, tables, params)
+            params = 'objIdentifiers.identifier=?'
+            objectData = _queryFetchOne(cols, tables, params, (objectname, ))
+
+        return objectData
+
+    @classmethod
+    def _from_row(cls, row: tuple) -> 'Object':
+        """Build an object from a row already fetched from the database.
+
+        This skips name recognition and the lookup query, so many objects
+        can be built from the result of a single query.
+
+        Args:
+            row: `(name, type, ra, dec, const)` as selected by `OBJECT_COLS`.
+
+        Returns:
+            Object
+        """
+        obj = cls.__new__(cls)
+        obj._name, obj._type, obj._ra, obj._dec, obj._const = row
+        return obj
 
-        # Assign object properties
-        self._name = objectData[0]
-        self._type = objectData[1]
-        self._ra = objectData[3]
-        self._dec = objectData[4]
-        self._const = objectData[5]
-       
     def __str__(self) -> str:
         """
             Returns a basic description of the object.
@@ -299,6 +622,429 @@ class ObjectEncoder(json.JSONEncoder):
             return super().default(obj)
 
 
+class CatalogIndex(object):
+    """In-memory positional index of the catalog.
+
+    The whole `objects` table is loaded once into numpy arrays: names, types,
+    constellations, coordinates in radians and unit vectors on the celestial sphere.
+    A cone search is then a single dot product between the search center and all
+    the unit vectors, followed by a sort of the few objects within range.
+
+    The arrays are loaded on first use. If a cache path is given they are also saved
+    there as a `.npy` file, which is memory-mapped on the next startup as long as it
+    is newer than the database file.
+
+            >>> from pyongc.ongc import catalog_index
+            >>> indices, distances = catalog_index.cone(np.radians([10, 20]), 1)
+            >>> catalog_index.objects(indices) #doctest: +SKIP
+            [<pyongc.ongc.Object object at 0x...>, ...]
+
+    """
+
+    DTYPE = np.dtype([('name', 'U16'), ('type', 'U8'), ('const', 'U8'),
+                      ('ra', 'f8'), ('dec', 'f8'), ('xyz', 'f8', (3, ))])
+
+    # Number of cone searches evaluated together in a batch, bounds the memory
+    # used by the (queries x objects) dot product matrix
+    BATCH_SIZE = 256
+
+    # Larger catalogs are not loaded in memory, cone searches use the spatial
+    # index of the database instead. None to always load the catalog
+    MAX_ROWS = 500000
+
+    def __init__(self, db: CatalogConnection, cache_path: Optional[str] = None):
+        """Catalog index constructor.
+
+        Args:
+            db: connection manager of the catalog database
+            cache_path: where to save the index as a `.npy` file, None to disable
+        """
+        self._db = db
+        self._cache_path = cache_path
+        # Reentrant: loading runs a query, which may find a new file and invalidate the index
+        self._lock = threading.RLock()
+        self._data = None
+        self._rows = None
+        self._trees = {}
+
+    @property
+    def enabled(self) -> bool:
+        """Whether the catalog is small enough to be loaded in memory."""
+        if self._data is not None or self.MAX_ROWS is None:
+            return True
+        if self._rows is None:
+            self._rows = self._db.fetchone('SELECT count(*) FROM objects')[0]
+        return self._rows <= self.MAX_ROWS
+
+    @property
+    def data(self) -> np.ndarray:
+        """Structured array with one record per object, loaded on first access."""
+        self._db.check()
+        data = self._data
+        if data is None:
+            with self._lock:
+                if self._data is None:
+                    self._data = self._load()
+                data = self._data
+        return data
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    @property
+    def names(self) -> np.ndarray:
+        """Main identifiers of the objects."""
+        return self.data['name']
+
+    @property
+    def types(self) -> np.ndarray:
+        """Types of the objects."""
+        return self.data['type']
+
+    @property
+    def constellations(self) -> np.ndarray:
+        """Constellations of the objects."""
+        return self.data['const']
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """Unit vectors of shape (N, 3), all zeros for objects without coordinates."""
+        return self.data['xyz']
+
+    def invalidate(self) -> None:
+        """Drop the loaded arrays, they will be loaded again on next use."""
+        with self._lock:
+            self._data = None
+            self._rows = None
+            self._trees = {}
+
+    def mask(self, catalog: str = "all", dup: bool = False) -> np.ndarray:
+        """Select objects by catalog and type.
+
+        Args:
+            catalog: filter for "NGC" or "IC" objects - default is all
+            dup: if set to True, include duplicated records. Default is False.
+
+        Returns:
+            A boolean array with one element per object.
+        """
+        data = self.data
+        if dup:
+            selected = np.ones(len(data), dtype=bool)
+        else:
+            selected = data['type'] != 'Dup'
+        if catalog.upper() in ["NGC", "IC"]:
+            selected &= np.char.startswith(data['name'], catalog.upper())
+        return selected
+
+    def cone(self, coords: np.ndarray, radius: float,
+             mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Find the objects within a distance from a point in the sky.
+
+        Args:
+            coords: R.A. and Dec of the search center in radians as numpy array with shape(2,)
+            radius: search radius in degrees
+            mask: boolean array to select which objects can be returned
+
+        Returns:
+            `(indices, separations)`
+
+            The indices of the objects found and their separations in degrees,
+            ordered by separation.
+        """
+        return self.cones(coords[0:1], coords[1:2], radius, mask)[0]
+
+    def cones(self, ra: np.ndarray, dec: np.ndarray, radius: Union[float, np.ndarray],
+              mask: Optional[np.ndarray] = None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """Run many cone searches at once.
+
+        Args:
+            ra: R.A. of the search centers in radians
+            dec: Dec of the search centers in radians
+            radius: search radius in degrees, one for all the searches or one per search
+            mask: boolean array to select which objects can be returned
+
+        Returns:
+            A list with an `(indices, separations)` tuple for each search center,
+            as returned by `cone`.
+        """
+        data = self.data
+        ra = np.atleast_1d(np.asarray(ra, dtype=float))
+        dec = np.atleast_1d(np.asarray(dec, dtype=float))
+        radius = np.broadcast_to(np.asarray(radius, dtype=float), ra.shape)
+        centers = _unit_vectors(ra, dec)
+        # Compare cosines with a small margin, exact separations are computed below
+        min_cos = np.cos(np.radians(radius)) - 1e-9
+
+        candidates = data['xyz'] if mask is None else data['xyz'][mask]
+        index_map = None if mask is None else np.flatnonzero(mask)
+
+        results = []
+        for start in range(0, len(centers), self.BATCH_SIZE):
+            stop = start + self.BATCH_SIZE
+            dots = centers[start:stop] @ candidates.T
+            for row, i in enumerate(range(start, min(stop, len(centers)))):
+                found = np.flatnonzero(dots[row] >= min_cos[i])
+                if index_map is not None:
+                    found = index_map[found]
+                separations = _distance(np.array([ra[i], dec[i]]),
+                                        np.array([data['ra'][found], data['dec'][found]]))[0]
+                inside = separations <= radius[i]
+                found, separations = found[inside], separations[inside]
+                order = np.argsort(separations, kind='stable')
+                results.append((found[order], separations[order]))
+        return results
+
+    def crossmatch(self, ra: np.ndarray, dec: np.ndarray, radius: float,
+                   catalog: str = "all") -> Tuple[np.ndarray, np.ndarray]:
+        """Find the nearest object to each of many points in the sky.
+
+        Points are matched with a KD-tree built on the unit vectors of the objects,
+        which is built once for each catalog filter and then reused.
+
+        Args:
+            ra: R.A. of the points in radians
+            dec: Dec of the points in radians
+            radius: maximum separation of a match in degrees
+            catalog: filter for "NGC" or "IC" objects - default is all
+
+        Returns:
+            `(indices, separations)`
+
+            For each point, the index of the nearest object and its separation in degrees.
+            Points without an object within radius get index -1 and separation NaN.
+        """
+        ra = np.atleast_1d(np.asarray(ra, dtype=float))
+        dec = np.atleast_1d(np.asarray(dec, dtype=float))
+        indices = np.full(ra.shape, -1, dtype=np.intp)
+        separations = np.full(ra.shape, np.nan)
+        if ra.size == 0:
+            return indices, separations
+
+        tree, index_map = self._tree(catalog)
+        if index_map.size == 0:
+            return indices, separations
+        # Chord length on the unit sphere, slightly enlarged because the exact
+        # separation is computed again below
+        chord = 2 * np.sin(np.radians(min(radius, 180)) / 2) + 1e-9
+        # Points with unknown coordinates can't match anything
+        nearest = np.full(ra.shape, index_map.size, dtype=np.intp)
+        valid = np.isfinite(ra) & np.isfinite(dec)
+        _, nearest[valid] = tree.query(_unit_vectors(ra[valid], dec[valid]), k=1,
+                                       distance_upper_bound=chord)
+
+        # Missing neighbors are reported with an index equal to the tree size
+        matched = nearest < index_map.size
+        found = index_map[nearest[matched]]
+        data = self.data
+        distances = _distance(np.array([ra[matched], dec[matched]]),
+                              np.array([data['ra'][found], data['dec'][found]]))[0]
+        inside = distances <= radius
+        matched[matched] = inside
+        indices[matched] = found[inside]
+        separations[matched] = distances[inside]
+        return indices, separations
+
+    def _tree(self, catalog: str):
+        key = catalog.upper() if catalog.upper() in ["NGC", "IC"] else "all"
+        tree = self._trees.get(key)
+        if tree is None:
+            from scipy.spatial import KDTree
+
+            data = self.data
+            mask = self.mask(key)
+            mask &= ~(np.isnan(data['ra']) | np.isnan(data['dec']))
+            index_map = np.flatnonzero(mask)
+            tree = (KDTree(data['xyz'][index_map]), index_map)
+            self._trees[key] = tree
+        return tree
+
+    def objects(self, indices: np.ndarray) -> List['Object']:
+        """Build the Object objects for the given indices.
+
+        Args:
+            indices: indices of the objects in the index
+
+        Returns:
+            A list of Object objects.
+        """
+        data = self.data
+        return [Object._from_row((str(data['name'][i]), str(data['type'][i]),
+                                  _nan_to_none(data['ra'][i]), _nan_to_none(data['dec'][i]),
+                                  str(data['const'][i])))
+                for i in indices]
+
+    def save(self, path: str) -> None:
+        """Save the index as a `.npy` file.
+
+        Args:
+            path: destination file
+        """
+        self._save(self.data, path)
+
+    @staticmethod
+    def _save(data: np.ndarray, path: str) -> None:
+        # Write to a temporary file first, so a reader never maps a partial file
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.asarray(data), allow_pickle=False)
+        os.replace(tmp_path, path)
+
+    def _load(self) -> np.ndarray:
+        if self._cache_path is not None and os.path.isfile(self._cache_path):
+            try:
+                if os.path.getmtime(self._cache_path) >= os.path.getmtime(self._db.path):
+                    data = np.load(self._cache_path, mmap_mode='r', allow_pickle=False)
+                    if data.dtype == self.DTYPE:
+                        return data
+            except (OSError, ValueError):
+                pass
+
+        rows = self._db.fetchall(f'SELECT {OBJECT_COLS} FROM objects')
+        data = np.zeros(len(rows), dtype=self.DTYPE)
+        if rows:
+            names, types, ra, dec, consts = zip(*rows)
+            data['name'] = names
+            data['type'] = types
+            data['const'] = [c or '' for c in consts]
+            data['ra'] = np.array(ra, dtype=float)
+            data['dec'] = np.array(dec, dtype=float)
+            valid = ~(np.isnan(data['ra']) | np.isnan(data['dec']))
+            data['xyz'][valid] = _unit_vectors(data['ra'][valid], data['dec'][valid])
+
+        if self._cache_path is not None:
+            try:
+                self._save(data, self._cache_path)
+            except OSError:
+                # The cache is optional, the package directory may be read-only
+                pass
+        return data
+
+
+def _unit_vectors(ra: np.ndarray, dec: np.ndarray) -> np.ndarray:
+    """Convert equatorial coordinates to unit vectors.
+
+    Args:
+        ra: R.A. in radians
+        dec: Dec in radians
+
+    Returns:
+        A numpy array of shape (N, 3) with cartesian coordinates on the unit sphere.
+    """
+    cos_dec = np.cos(dec)
+    return np.stack([cos_dec * np.cos(ra), cos_dec * np.sin(ra), np.sin(dec)], axis=-1)
+
+
+def _nan_to_none(value: float) -> Optional[float]:
+    """Convert a NaN read from the index back to the None stored in database."""
+    return None if np.isnan(value) else float(value)
+
+
+catalog_index = CatalogIndex(catalog_db, CACHEPATH)
+
+
+def _reload_catalog() -> None:
+    """Drop connections and loaded data after the catalog database changed."""
+    catalog_db.close()
+    catalog_index.invalidate()
+
+
+object_cache = ObjectCache(DBPATH, on_change=_reload_catalog)
+# Every query and every use of the index notices a replaced database file
+catalog_db.watch(object_cache.check_file)
+
+
+class CatalogExecutor(object):
+    """Run catalog queries on a dedicated thread pool for asyncio code.
+
+    The web server calls the catalog from its event loop: running the queries here
+    keeps slow ones from stalling every other websocket. At most `max_pending` queries
+    can be queued or running at the same time, further requests fail with CatalogBusy.
+
+    When the awaiting task is cancelled, a query not yet started is dropped and a running
+    SQLite statement is interrupted.
+
+            >>> from pyongc.ongc import anearby
+            >>> await anearby('11:08:44 -00:09:01.3') #doctest: +SKIP
+            [(<pyongc.ongc.Object object at 0x...>, 0.1799936868460791), ...]
+
+    """
+
+    def __init__(self, db: CatalogConnection, max_workers: int = 2, max_pending: int = 16):
+        """Catalog executor constructor.
+
+        Args:
+            db: connection manager used by the queries, to interrupt them
+            max_workers: number of threads running queries
+            max_pending: maximum number of queued and running queries
+        """
+        self._db = db
+        self._max_workers = max_workers
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+
+    async def run(self, func: Callable[..., Any], *args, timeout: Optional[float] = None,
+                  **kwargs) -> Any:
+        """Run a function on the thread pool and wait for its result.
+
+        Args:
+            func: the catalog function to run
+            timeout: seconds after which the query is cancelled, None to wait forever
+            args, kwargs: arguments of the function
+
+        Returns:
+            The result of the function.
+
+        Raises:
+            CatalogBusy: If too many queries are pending.
+            asyncio.TimeoutError: If the timeout expires.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise CatalogBusy()
+
+        running = []
+
+        def call():
+            running.append(self._db.connection())
+            try:
+                return func(*args, **kwargs)
+            finally:
+                running.clear()
+
+        try:
+            future = self._get_executor().submit(call)
+        except BaseException:
+            self._slots.release()
+            raise
+        # Free the slot when the query ends, or when it's cancelled before starting
+        future.add_done_callback(lambda _: self._slots.release())
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            for db in list(running):
+                db.interrupt()
+            raise
+
+    def shutdown(self) -> None:
+        """Stop the threads, they are started again by the next query."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._max_workers,
+                                                    thread_name_prefix='catalog')
+            return self._executor
+
+
+catalog_executor = CatalogExecutor(catalog_db)
+
+
 def _distance(coords1: np.ndarray, coords2: np.ndarray) -> Tuple[float, float, float]:
     """Calculate distance between two points in the sky.
 
@@ -340,17 +1086,20 @@ def _distance(coords1: np.ndarray, coords2: np.ndarray) -> Tuple[float, float, f
     return np.degrees(separation), np.degrees(a2-a1), np.degrees(d2-d1)
 
 
-def _limiting_coords(coords: np.ndarray, radius: int) -> str:
+def _limiting_coords(coords: np.ndarray, radius: float) -> str:
     """Write query filters for limiting search to specific area of the sky.
 
     This is a quick method to exclude objects farther than a specified distance
-    from the starting point, but it's not meant to be precise.
+    from the starting point, but it's not meant to be precise: it selects from the
+    `objPositions` spatial index all the objects inside the cube circumscribing
+    the search cone on the unit sphere. Since the filter works on cartesian
+    coordinates, it's correct near the poles and across RA=0 too.
 
             >>> from pyongc.ongc import Object, _limiting_coords
             >>> start = Object('ngc1').coords
-            >>> _limiting_coords(start, 2)
-            ' AND (ra <= 0.06660176425610362 OR ra >= 6.279973901355917) AND \
-(dec BETWEEN 0.44869069854374555 AND 0.5185038686235187)'
+            >>> _limiting_coords(start, 2) #doctest: +ELLIPSIS
+            ' AND objects.rowid IN (SELECT id FROM objPositions WHERE maxX >= 0.8499... AND minX <= 0.9197... \
+AND maxY >= -0.0068... AND minY <= 0.0629... AND maxZ >= 0.4300... AND minZ <= 0.4998...)'
 
     Args:
         coords: R.A. and Dec of the starting point in the sky.
@@ -378,30 +1127,60 @@ def _limiting_coords(coords: np.ndarray, radius: int) -> str:
     else:
         rad_coords = coords
 
-    radius_rad = np.radians(radius)
-    ra_lower_limit = rad_coords[0] - radius_rad
-    ra_upper_limit = rad_coords[0] + radius_rad
-    if ra_lower_limit < 0:
-        ra_lower_limit += 2 * np.pi
-        params = f' AND (ra <= {ra_upper_limit} OR ra >= {ra_lower_limit})'
-    elif ra_upper_limit > 2 * np.pi:
-        ra_upper_limit -= 2 * np.pi
-        params = f' AND (ra <= {ra_upper_limit} OR ra >= {ra_lower_limit})'
-    else:
-        params = f' AND (ra BETWEEN {ra_lower_limit} AND {ra_upper_limit})'
+    center = _unit_vectors(rad_coords[0], rad_coords[1])
+    # Any point closer than radius is closer than the chord along each axis,
+    # plus a small margin for the single precision values stored in the index
+    chord = 2 * np.sin(np.radians(min(radius, 180)) / 2) + 1e-6
+    limits = [f'max{axis} >= {center[i] - chord} AND min{axis} <= {center[i] + chord}'
+              for i, axis in enumerate('XYZ')]
 
-    dec_lower_limit = rad_coords[1] - radius_rad
-    if dec_lower_limit < -1/2 * np.pi:
-        dec_lower_limit = -1/2 * np.pi
-    dec_upper_limit = rad_coords[1] + radius_rad
-    if dec_upper_limit > 1/2 * np.pi:
-        dec_upper_limit = 1/2 * np.pi
+    return f' AND objects.rowid IN (SELECT id FROM objPositions WHERE {" AND ".join(limits)})'
 
-    params += f' AND (dec BETWEEN {dec_lower_limit} AND {dec_upper_limit})'
-    return params
 
+def _queryCone(coords: np.ndarray, radius: float, catalog: str = "all",
+               exclude: Optional[str] = None) -> List[Tuple[Object, float]]:
+    """Search the objects within a distance from a point in the sky.
 
-def _queryFetchOne(cols: str, tables: str, params: str) -> tuple:
+    The search runs on the in-memory `catalog_index` when the catalog is small enough
+    to be loaded, otherwise on the spatial index of the database.
+
+    Args:
+        coords: R.A. and Dec of search center expressed in radians
+        radius: search radius in degrees
+        catalog: filter for "NGC" or "IC" objects - default is all
+        exclude: name of an object to leave out of the results
+
+    Returns:
+        `[(Object, separation),]` ordered by separation.
+
+    """
+    if catalog_index.enabled:
+        mask = catalog_index.mask(catalog)
+        if exclude is not None:
+            mask &= catalog_index.names != exclude
+        indices, distances = catalog_index.cone(coords, radius, mask)
+        return list(zip(catalog_index.objects(indices), distances))
+
+    params = 'type != "Dup"'
+    args = ()
+    if exclude is not None:
+        params += ' AND name != ?'
+        args = (exclude, )
+    if catalog.upper() in ["NGC", "IC"]:
+        params += f' AND name LIKE "{catalog.upper()}%"'
+
+    params += _limiting_coords(coords, radius)
+
+    candidates = _queryObjects('objects', params, args=args)
+    if candidates == []:
+        return []
+    distances = _distance(coords, np.array([[obj._ra for obj in candidates],
+                                            [obj._dec for obj in candidates]]))[0]
+    return sorted([(obj, dist) for obj, dist in zip(candidates, distances) if dist <= radius],
+                  key=lambda neighbor: neighbor[1])
+
+
+def _queryFetchOne(cols: str, tables: str, params: str, args: tuple = ()) -> tuple:
     """Search one row in database.
 
     Be sure to use a WHERE clause which is very specific, otherwise the query
@@ -410,41 +1189,28 @@ def _queryFetchOne(cols: str, tables: str, params: str) -> tuple:
             >>> from pyongc.ongc import _queryFetchOne
             >>> cols = 'type'
             >>> tables = 'objects'
-            >>> params = 'name="NGC0001"'
-            >>> _queryFetchOne(cols, tables, params)
+            >>> params = 'name=?'
+            >>> _queryFetchOne(cols, tables, params, ('NGC0001', ))
             ('G',)
 
     Args:
         cols: the `SELECT` field of the query
         tables: the `FROM` field of the query
         params: the `WHERE` field of the query
+        args: values bound to the `?` placeholders of the query
 
     Returns:
         Selected row data from database
 
     """
-    try:
-        db = sqlite3.connect(f'file:{DBPATH}?mode=ro', uri=True)
-    except sqlite3.Error:
-        raise OSError(f'There was a problem accessing database file at {DBPATH}')
-
-    try:
-        cursor = db.cursor()
-        cursor.execute(f'SELECT {cols} '
-                       f'FROM {tables} '
-                       f'WHERE {params}'
-                       )
-        objectData = cursor.fetchone()
-    except Exception as err:  # pragma: no cover
-        raise err
-    finally:
-        db.close()
-
-    return objectData
+    return catalog_db.fetchone(f'SELECT {cols} '
+                               f'FROM {tables} '
+                               f'WHERE {params}',
+                               args)
 
 
 def _queryFetchMany(cols: str, tables: str, params: str,
-                    order: str = '') -> Generator[tuple, None, None]:
+                    order: str = '', args: tuple = ()) -> Generator[tuple, None, None]:
     """Search many rows in database.
 
             >>> from pyongc.ongc import _queryFetchMany
@@ -459,35 +1225,46 @@ def _queryFetchMany(cols: str, tables: str, params: str,
         tables: the `FROM` field of the query
         params: the `WHERE` field of the query
         order: the `ORDER` clause of the query
+        args: values bound to the `?` placeholders of the query
 
     Yields:
         Selected row data from database
 
     """
-    try:
-        db = sqlite3.connect(f'file:{DBPATH}?mode=ro', uri=True)
-    except sqlite3.Error:
-        raise OSError(f'There was a problem accessing database file at {DBPATH}')
+    yield from catalog_db.fetchall(f'SELECT {cols} '
+                                   f'FROM {tables} '
+                                   f'WHERE {params}'
+                                   f'{" ORDER BY " + order if order != "" else ""}',
+                                   args)
 
-    try:
-        cursor = db.cursor()
-
-        cursor.execute(f'SELECT {cols} '
-                       f'FROM {tables} '
-                       f'WHERE {params}'
-                       f'{" ORDER BY " + order if order != "" else ""}'
-                       )
-        while True:
-            objectList = cursor.fetchmany()
-            if objectList == []:
-                break
-            yield objectList[0]
-    except Exception as err:  # pragma: no cover
-        raise err
-    finally:
-        db.close()
 
+def _queryObjects(tables: str, params: str, order: str = '',
+                  args: tuple = ()) -> List[Object]:
+    """Search many objects in database and build them from a single query.
+
+    Rows are selected with all the columns needed by `Object`, so no other
+    query is run for each object found. Duplicated records are returned as
+    they are: callers which don't want them must exclude them with `params`.
+
+            >>> from pyongc.ongc import _queryObjects
+            >>> print(_queryObjects('objects', 'name=?', args=('NGC0001', ))[0])
+            NGC0001, G in Peg
+
+    Args:
+        tables: the `FROM` field of the query, it must include the `objects` table
+        params: the `WHERE` field of the query
+        order: the `ORDER` clause of the query
+        args: values bound to the `?` placeholders of the query
 
+    Returns:
+        A list of Object objects.
+
+    """
+    return [Object._from_row(row) for row in _queryFetchMany(OBJECT_COLS, tables, params,
+                                                             order, args)]
+
+
+@lru_cache(maxsize=4096)
 def _recognize_name(text: str) -> Tuple[str, str]:
     """Recognize catalog and object id.
 
@@ -646,22 +1423,7 @@ def getNeighbors(obj: Union[Object, str], separation: Union[int, float],
     if obj.rad_coords is None:
         raise InvalidCoordinates('Starting object hasn\'t got registered coordinates.')
 
-    cols = 'objects.name'
-    tables = 'objects'
-    params = f'type != "Dup" AND name !="{obj.name}"'
-    if catalog.upper() in ["NGC", "IC"]:
-        params += f' AND name LIKE "{catalog.upper()}%"'
-
-    params += _limiting_coords(obj.rad_coords, np.ceil(separation / 60))
-
-    neighbors = []
-    for item in _queryFetchMany(cols, tables, params):
-        possibleNeighbor = Object(item[0])
-        distance = getSeparation(obj, possibleNeighbor)[0]
-        if distance <= (separation / 60):
-            neighbors.append((possibleNeighbor, distance))
-
-    return sorted(neighbors, key=lambda neighbor: neighbor[1])
+    return _queryCone(obj.rad_coords, separation / 60, catalog, exclude=obj.name)
 
 
 def getSeparation(obj1: Union[Object, str], obj2: Union[Object, str],
@@ -731,6 +1493,51 @@ def getSeparation(obj1: Union[Object, str], obj2: Union[Object, str],
         return separation
 
 
+def crossmatch(ra_array: np.ndarray, dec_array: np.ndarray, radius: float = 1,
+               catalog: str = "all") -> Tuple[np.ndarray, np.ndarray]:
+    """
+        Match many positions against the catalog at once.
+
+        This is meant to label the known objects among the sources detected in a
+        solved frame: each position is matched to its nearest object, if there is one
+        within the search radius.
+
+                >>> from pyongc.ongc import catalog_index, crossmatch
+                >>> indices, separations = crossmatch([1.8066, 10.0], [27.7081, -80.0], 1)
+                >>> catalog_index.names[indices[indices >= 0]]
+                array(['NGC0001'], dtype='<U16')
+                >>> indices
+                array([5595,   -1])
+
+        Args:
+            ra_array: R.A. of the positions expressed in degrees
+            dec_array: Dec of the positions expressed in degrees
+            radius: maximum separation of a match expressed in arcmin - default 1
+            catalog: filter for "NGC" or "IC" objects - default is all
+
+        Returns:
+            `(indices, separations)`
+
+            Two numpy arrays with an element for each position: the index of the nearest
+            object in `catalog_index` (use `catalog_index.objects` to get the Object objects)
+            and its separation in degrees. Positions without a match get -1 and NaN.
+
+        Raises:
+            ValueError: If the search radius exceeds 10 degrees.
+            ValueError: If the R.A. and Dec arrays have different shapes.
+
+    """
+    if radius > 600:
+        raise ValueError('The maximum search radius allowed is 10 degrees.')
+    ra_array = np.asarray(ra_array, dtype=float)
+    dec_array = np.asarray(dec_array, dtype=float)
+    if ra_array.shape != dec_array.shape:
+        raise ValueError('R.A. and Dec arrays must have the same shape.')
+
+    return catalog_index.crossmatch(np.radians(ra_array), np.radians(dec_array),
+                                    radius / 60, catalog)
+
+
 def listObjects(**kwargs) -> List[Object]:
     """
         Query the database for DSObjects with specific parameters.
@@ -757,12 +1564,13 @@ def listObjects(**kwargs) -> List[Object]:
                 >>> print(objectList[0])
                 IC0011, Duplicated record in Cas
 
-        The maxSize filter will include objects with no size recorded in database:
+        The words of the cname filter are searched in the common names, the last one
+        can be the beginning of a word:
 
                 >>> from pyongc.ongc import listObjects
-                >>> objectList = listObjects(maxsize=0)
-                >>> len(objectList)
-                1967
+                >>> objectList = listObjects(cname="Androm")
+                >>> print(objectList[0])
+                NGC0224, G in And
 
         Args:
             catalog (string, optional): filter for catalog. [NGC|IC|M]
@@ -778,7 +1586,8 @@ def listObjects(**kwargs) -> List[Object]:
             maxra (float, optional): filter for objects with RA degrees lower than value
             mindec (float, optional): filter for objects above specified Dec degrees
             maxdec (float, optional): filter for objects below specified Dec degrees
-            cname (string, optional): filter for objects with common name like input value
+            cname (string, optional): filter for objects with common name containing the
+                words of input value, the last one as a prefix
             withname (bool, optional): filter for objects with common names
 
         Returns:
@@ -787,6 +1596,8 @@ def listObjects(**kwargs) -> List[Object]:
         Raises:
             ValueError: If a filter name other than those expected is inserted.
             ValueError: If an unrecognized catalog name is entered. Only [NGC|IC|M] are permitted.
+            ValueError: If a size or magnitude filter is used, they are not in the database.
+            ValueError: If the cname filter has no word to search.
 
     """
     available_filters = ['catalog',
@@ -802,12 +1613,11 @@ def listObjects(**kwargs) -> List[Object]:
                          'maxdec',
                          'cname',
                          'withname']
-    cols = 'objects.name'
     tables = 'objects'
 
     if kwargs == {}:
         params = '1'
-        return [Object(str(item[0]), True) for item in _queryFetchMany(cols, tables, params)]
+        return _queryObjects(tables, params)
     for element in kwargs:
         if element not in available_filters:
             raise ValueError("Wrong filter name.")
@@ -856,8 +1666,68 @@ def listObjects(**kwargs) -> List[Object]:
     elif "maxdec" in kwargs:
         paramslist.append(f'dec <= {np.radians(kwargs["maxdec"])}')
 
-    params = " AND ".join(paramslist)
-    return [Object(item[0], True) for item in _queryFetchMany(cols, tables, params, order)]
+    for element in ("minsize", "maxsize", "uptobmag", "uptovmag"):
+        if element in kwargs:
+            # the objects table has no size or magnitude columns
+            raise ValueError(f"Filter {element} is not available in this database.")
+
+    args = []
+    if "cname" in kwargs:
+        # common names are matched as words in the full-text index of the names
+        words = re.findall(r'[^\W\d_]+|\d+', kwargs["cname"].upper())
+        if words == []:
+            raise ValueError('Wrong value for cname filter.')
+        paramslist.append('objects.rowid IN '
+                          '(SELECT rowid FROM objNames WHERE objNames MATCH ?)')
+        args.append(f'commonname : "{" ".join(words)}" *')
+
+    if kwargs.get("withname"):
+        paramslist.append("objects.rowid IN "
+                          "(SELECT rowid FROM objNames WHERE commonname != '')")
+
+    params = " AND ".join(paramslist) or '1'
+    return _queryObjects(tables, params, order, tuple(args))
+
+
+def suggest(prefix: str, limit: int = 10) -> List[dict]:
+    """
+        Search objects whose identifier or common name starts with the given text.
+
+        This is meant for autocompletion while the user types an object name: the
+        identifiers are indexed without zero padding, so "ngc7" finds NGC0007,
+        NGC0070, NGC0700... Results come in catalog order.
+
+                >>> from pyongc.ongc import suggest
+                >>> [s['identifier'] for s in suggest('ngc 70', 3)]
+                ['NGC0070', 'NGC0700', 'NGC0701']
+
+        Args:
+            prefix: the beginning of an identifier or of a common name
+            limit: maximum number of results - default 10
+
+        Returns:
+            `[{'name': ..., 'identifier': ..., 'type': ..., 'constellation': ...},]`
+
+            A list of dicts describing the objects found, empty if the text contains no
+            letters or digits.
+
+    """
+    words = re.findall(r'[^\W\d_]+|\d+', prefix.upper())
+    # Numbers are indexed without zero padding, a number of only zeros is still
+    # being typed and can't be matched yet
+    words = [word.lstrip('0') if word.isdigit() else word for word in words]
+    if words and words[-1] == '':
+        words.pop()
+    if '' in words or words == []:
+        return []
+
+    rows = catalog_db.fetchall('SELECT objects.name, objNames.identifier, objects.type, objects.const '
+                               'FROM objNames JOIN objects ON objects.rowid = objNames.rowid '
+                               'WHERE objNames MATCH ? '
+                               'ORDER BY objNames.rowid LIMIT ?',
+                               (f'{{alias commonname}} : "{" ".join(words)}" *', limit))
+    return [{'name': name, 'identifier': identifier, 'type': objtype, 'constellation': const}
+            for name, identifier, objtype, const in rows]
 
 
 def nearby(coords_string: str, separation: float = 60,
@@ -908,19 +1778,42 @@ def nearby(coords_string: str, separation: float = 60,
 
     coords = _str_to_coords(coords_string)
 
-    cols = 'objects.name'
-    tables = 'objects'
-    params = 'type != "Dup"'
-    if catalog.upper() in ["NGC", "IC"]:
-        params += f' AND name LIKE "{catalog.upper()}%"'
+    return _queryCone(coords, separation / 60, catalog)
+
+
+async def aget(name: str, timeout: Optional[float] = None) -> Optional[Object]:
+    """Non-blocking `get`, see CatalogExecutor."""
+    return await catalog_executor.run(get, name, timeout=timeout)
+
+
+async def agetNeighbors(obj: Union[Object, str], separation: Union[int, float],
+                        catalog: str = "all",
+                        timeout: Optional[float] = None) -> List[Tuple[Object, float]]:
+    """Non-blocking `getNeighbors`, see CatalogExecutor."""
+    return await catalog_executor.run(getNeighbors, obj, separation, catalog, timeout=timeout)
+
+
+async def alistObjects(timeout: Optional[float] = None, **kwargs) -> List[Object]:
+    """Non-blocking `listObjects`, see CatalogExecutor."""
+    return await catalog_executor.run(listObjects, timeout=timeout, **kwargs)
+
+
+async def anearby(coords_string: str, separation: float = 60, catalog: str = "all",
+                  timeout: Optional[float] = None) -> List[Tuple[Object, float]]:
+    """Non-blocking `nearby`, see CatalogExecutor."""
+    return await catalog_executor.run(nearby, coords_string, separation, catalog,
+                                      timeout=timeout)
+
 
-    params += _limiting_coords(coords, np.ceil(separation / 60))
+async def acrossmatch(ra_array: np.ndarray, dec_array: np.ndarray, radius: float = 1,
+                      catalog: str = "all",
+                      timeout: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Non-blocking `crossmatch`, see CatalogExecutor."""
+    return await catalog_executor.run(crossmatch, ra_array, dec_array, radius, catalog,
+                                      timeout=timeout)
 
-    neighbors = []
-    for item in _queryFetchMany(cols, tables, params):
-        possibleNeighbor = Object(item[0])
-        distance = _distance(coords, possibleNeighbor.rad_coords)[0]
-        if distance <= (separation / 60):
-            neighbors.append((possibleNeighbor, distance))
 
-    return sorted(neighbors, key=lambda neighbor: neighbor[1])
+async def asuggest(prefix: str, limit: int = 10,
+                   timeout: Optional[float] = None) -> List[dict]:
+    """Non-blocking `suggest`, see CatalogExecutor."""
+    return await catalog_executor.run(suggest, prefix, limit, timeout=timeout)
@@ -0,0 +1,209 @@
+# coding=utf-8
+
+"""
+
+Copyright(c) 2022-2023 Max Qian  <lightapt.com>
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Library General Public
+License version 3 as published by the Free Software Foundation.
+This library is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Library General Public License for more details.
+You should have received a copy of the GNU Library General Public License
+along with this library; see the file COPYING.LIB.  If not, write to
+the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+Boston, MA 02110-1301, USA.
+
+"""
+
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+# Deepest HEALPix order of the tiles , order 5 tiles are about 1.8 degrees wide
+MAX_ORDER = 5
+
+# Most objects kept in a tile above MAX_ORDER , the deepest tiles keep all of them
+TILE_LIMIT = 64
+
+# Objects which are kept first when a tile is culled , the catalog has neither magnitudes
+# nor sizes so the type is used as the measure of how prominent an object is
+TYPE_PRIORITY = (
+    "GCl", "PN", "OCl", "Cl+N", "SNR", "HII", "EmN", "RfN", "Neb", "DrkN",
+    "GGroup", "GTrpl", "GPair", "G", "*Ass", "**", "*", "Nova", "Other",
+)
+
+def _spread_bits(values : np.ndarray, bits : int) -> np.ndarray:
+    """
+        Interleave the lowest bits of the integers with zeros , bit i goes to bit 2i
+    """
+    values = values.astype(np.int64)
+    result = np.zeros_like(values)
+    for bit in range(bits):
+        result |= ((values >> bit) & 1) << (2 * bit)
+    return result
+
+def ang2pix_nest(order : int, ra : np.ndarray, dec : np.ndarray) -> np.ndarray:
+    """
+        HEALPix pixels of points in the NESTED scheme , as in healpix_base
+        Args :
+            order : int # the HEALPix order , nside is 2 ** order
+            ra : np.ndarray # radians
+            dec : np.ndarray # radians
+        Returns : np.ndarray # pixel indices
+    """
+    nside = 1 << order
+    z = np.sin(dec)
+    za = np.abs(z)
+    tt = np.mod(ra, 2 * np.pi) / (np.pi / 2)
+    tt = np.where(tt >= 4, 0, tt)
+
+    # Equatorial region
+    temp1 = nside * (0.5 + tt)
+    temp2 = nside * (z * 0.75)
+    jp = (temp1 - temp2).astype(np.int64)
+    jm = (temp1 + temp2).astype(np.int64)
+    ifp = jp >> order
+    ifm = jm >> order
+    face_eq = np.where(ifp == ifm, ifp | 4, np.where(ifp < ifm, ifp, ifm + 8))
+    ix_eq = jm & (nside - 1)
+    iy_eq = nside - (jp & (nside - 1)) - 1
+
+    # Polar caps
+    ntt = np.minimum(tt.astype(np.int64), 3)
+    tp = tt - ntt
+    tmp = nside * np.sqrt(3 * (1 - za))
+    jp = np.minimum((tp * tmp).astype(np.int64), nside - 1)
+    jm = np.minimum(((1 - tp) * tmp).astype(np.int64), nside - 1)
+    north = z >= 0
+    face_pol = np.where(north, ntt, ntt + 8)
+    ix_pol = np.where(north, nside - jm - 1, jp)
+    iy_pol = np.where(north, nside - jp - 1, jm)
+
+    equatorial = za <= 2 / 3
+    face = np.where(equatorial, face_eq, face_pol)
+    ix = np.where(equatorial, ix_eq, ix_pol)
+    iy = np.where(equatorial, iy_eq, iy_pol)
+    return (face << (2 * order)) + _spread_bits(ix, order) + (_spread_bits(iy, order) << 1)
+
+class TileSet(object):
+    """
+        Catalog objects split into HEALPix tiles , one level per order like HiPS catalogs.
+        The tiles of an order are complete up to TILE_LIMIT objects , the most prominent ones first ,
+        so that a client only fetches the visible tiles of its zoom level.
+        Every tile is a compact JSON blob with a precomputed ETag.
+    """
+
+    def __init__(self, max_order : int = MAX_ORDER, limit : int = TILE_LIMIT) -> None:
+        """
+            Args :
+                max_order : int # deepest order , tiles of this order are not culled
+                limit : int # most objects in a tile above max_order
+        """
+        self.max_order = max_order
+        self.limit = limit
+        self._data = None
+        self._tiles = {}
+        self._lock = threading.Lock()
+
+    def build(self, data : np.ndarray) -> dict:
+        """
+            Split catalog objects into tiles
+            Args :
+                data : np.ndarray # rows of search.CatalogIndex.DTYPE
+            Returns : dict # (order , npix) -> (blob , etag) , empty tiles are left out
+        """
+        known = np.isfinite(data["ra"]) & np.isfinite(data["dec"]) \
+            & (data["type"] != "Dup") & (data["type"] != "NonEx")
+        rows = np.flatnonzero(known)
+        ra = data["ra"][rows]
+        dec = data["dec"][rows]
+        ranks = {name: rank for rank, name in enumerate(TYPE_PRIORITY)}
+        priority = np.array([ranks.get(t, len(ranks)) for t in data["type"][rows]])
+
+        # Pixels of the deepest order , the parents are obtained by dropping bits
+        deepest = ang2pix_nest(self.max_order, ra, dec)
+        tiles = {}
+        for order in range(self.max_order + 1):
+            pixels = deepest >> (2 * (self.max_order - order))
+            # Sort by pixel , then priority , then catalog order
+            indices = np.lexsort((rows, priority, pixels))
+            sorted_pixels = pixels[indices]
+            starts = np.flatnonzero(np.r_[True, sorted_pixels[1:] != sorted_pixels[:-1]])
+            ends = np.r_[starts[1:], len(indices)]
+            for start, end in zip(starts, ends):
+                total = end - start
+                if order < self.max_order:
+                    end = min(end, start + self.limit)
+                selected = rows[indices[start:end]]
+                npix = int(sorted_pixels[start])
+                tiles[(order, npix)] = self._encode(order, npix, int(total), data[selected])
+        return tiles
+
+    @staticmethod
+    def _encode(order : int, npix : int, total : int, objects : np.ndarray) -> tuple:
+        """
+            Encode a tile , the ETag is the hash of the blob
+        """
+        blob = json.dumps({
+            "order": order,
+            "npix": npix,
+            "total": total,
+            "objects": [
+                [str(o["name"]), str(o["type"]), round(float(np.degrees(o["ra"])), 6),
+                 round(float(np.degrees(o["dec"])), 6), str(o["const"])]
+                for o in objects
+            ]
+        }, separators=(",", ":")).encode()
+        return blob, '"%s"' % hashlib.sha1(blob).hexdigest()
+
+    def tiles(self) -> dict:
+        """
+            Get all of the tiles of the catalog , they are rebuilt when the catalog is reloaded
+            Returns : dict # (order , npix) -> (blob , etag)
+        """
+        from .search import catalog_index
+
+        data = catalog_index.data
+        with self._lock:
+            if self._data is not data:
+                self._tiles = self.build(data)
+                self._data = data
+            return self._tiles
+
+    def tile(self, order : int, npix : int) -> tuple | None:
+        """
+            Get a tile
+            Args :
+                order : int
+                npix : int
+            Returns : tuple | None # (blob , etag) , None if the tile doesn't exist
+        """
+        if not 0 <= order <= self.max_order or not 0 <= npix < 12 << (2 * order):
+            return None
+        tile = self.tiles().get((order, npix))
+        if tile is None:
+            tile = self._encode(order, npix, 0, [])
+        return tile
+
+    def save(self, directory : str) -> int:
+        """
+            Write the tiles with the HiPS layout , Norder{order}/Dir{dir}/Npix{npix}.json
+            Args :
+                directory : str
+            Returns : int # number of tiles written
+        """
+        tiles = self.tiles()
+        for (order, npix), (blob, _) in tiles.items():
+            path = os.path.join(directory, "Norder%d" % order, "Dir%d" % (npix // 10000 * 10000))
+            os.makedirs(path, exist_ok=True)
+            with open(os.path.join(path, "Npix%d.json" % npix), "wb") as f:
+                f.write(blob)
+        return len(tiles)
+
+catalog_tiles = TileSet()
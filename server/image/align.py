@@ -44,6 +44,9 @@ __all__ = [
     "MaxIterError",
     "NUM_NEAREST_NEIGHBORS",
     "PIXEL_TOL",
+    "RANSAC_BATCH",
+    "RansacReport",
+    "ReferenceModel",
     "apply_transform",
     "estimate_transform",
     "find_transform",
@@ -79,6 +82,18 @@ the triangle invariants.
 Default: 5
 """
 
+RANSAC_BATCH = True
+"""
+Score the candidate transforms of RANSAC by batches in one vectorized pass
+instead of fitting them one at a time. Both give the same transformation.
+Default: True
+"""
+
+_RANSAC_BATCH_ELEMENTS = 1 << 16
+"""
+Largest number of (candidate, source point) computed at once by the batched RANSAC
+"""
+
 _default_median = bn.nanmedian if HAS_BOTTLENECK else _np.nanmedian  # pragma: no cover
 """
 Default median function when/if optional bottleneck is available
@@ -100,16 +115,33 @@ Default std deviation function when/if optional bottleneck is available
 """
 
 
-def _invariantfeatures(x1, x2, x3):
-    """Given 3 points x1, x2, x3, return the invariant features for the set."""
-    sides = _np.sort(
+def _side_lengths(x1, x2, x3):
+    """Return the lengths of the sides (x1, x2), (x2, x3) and (x3, x1).
+    The points can be arrays of points, the sides are on the last axis.
+    """
+    return _np.stack(
         [
-            _np.linalg.norm(x1 - x2),
-            _np.linalg.norm(x2 - x3),
-            _np.linalg.norm(x1 - x3),
-        ]
+            _np.sqrt(((x1 - x2) ** 2).sum(axis=-1)),
+            _np.sqrt(((x2 - x3) ** 2).sum(axis=-1)),
+            _np.sqrt(((x3 - x1) ** 2).sum(axis=-1)),
+        ],
+        axis=-1,
     )
-    return [sides[2] / sides[1], sides[1] / sides[0]]
+
+
+def _invariantfeatures(x1, x2, x3):
+    """Given 3 points x1, x2, x3, return the invariant features for the set.
+    The points can also be (N, 2) arrays, one row per triangle.
+    """
+    sides = _np.sort(_side_lengths(x1, x2, x3), axis=-1)
+    return _np.stack(
+        [sides[..., 2] / sides[..., 1], sides[..., 1] / sides[..., 0]], axis=-1
+    )
+
+
+# Vertex shared by two sides, side 0 is (v0, v1), side 1 is (v1, v2)
+# and side 2 is (v2, v0)
+_SHARED_VERTEX = _np.array([[0, 1, 0], [1, 1, 2], [0, 2, 2]])
 
 
 def _arrangetriplet(sources, vertex_indices):
@@ -120,26 +152,24 @@ def _arrangetriplet(sources, vertex_indices):
       c is the vertex defined by L3 & L1
     and L1 < L2 < L3 are the sides of the triangle
     defined by vertex_indices.
+    vertex_indices can also be an (N, 3) array, one row per triangle.
     """
-    ind1, ind2, ind3 = vertex_indices
-    x1, x2, x3 = sources[vertex_indices]
-
-    side_ind = _np.array([(ind1, ind2), (ind2, ind3), (ind3, ind1)])
-    side_lengths = list(map(_np.linalg.norm, (x1 - x2, x2 - x3, x3 - x1)))
-    l1_ind, l2_ind, l3_ind = _np.argsort(side_lengths)
-
-    # the most common vertex in the list of vertices for two sides is the
-    # point at which they meet.
-    from collections import Counter
-
-    count = Counter(side_ind[[l1_ind, l2_ind]].flatten())
-    a = count.most_common(1)[0][0]
-    count = Counter(side_ind[[l2_ind, l3_ind]].flatten())
-    b = count.most_common(1)[0][0]
-    count = Counter(side_ind[[l3_ind, l1_ind]].flatten())
-    c = count.most_common(1)[0][0]
-
-    return _np.array([a, b, c])
+    vertex_indices = _np.asarray(vertex_indices)
+    points = sources[vertex_indices]
+    side_lengths = _side_lengths(
+        points[..., 0, :], points[..., 1, :], points[..., 2, :]
+    )
+    order = _np.argsort(side_lengths, axis=-1, kind="stable")
+    l1, l2, l3 = order[..., 0], order[..., 1], order[..., 2]
+    vertices = _np.stack(
+        [
+            _SHARED_VERTEX[l1, l2],
+            _SHARED_VERTEX[l2, l3],
+            _SHARED_VERTEX[l3, l1],
+        ],
+        axis=-1,
+    )
+    return _np.take_along_axis(vertex_indices, vertices, axis=-1)
 
 
 def _generate_invariants(sources):
@@ -149,40 +179,27 @@ def _generate_invariants(sources):
     """
     from scipy.spatial import KDTree
     from itertools import combinations
-    from functools import partial
-
-    arrange = partial(_arrangetriplet, sources=sources)
 
-    inv = []
-    triang_vrtx = []
+    sources = _np.asarray(sources)
     coordtree = KDTree(sources)
     # The number of nearest neighbors to request (to work with few sources)
     knn = min(len(sources), NUM_NEAREST_NEIGHBORS)
-    for asrc in sources:
-        __, indx = coordtree.query(asrc, knn)
+    __, indx = coordtree.query(sources, knn)
+    indx = indx.reshape(len(sources), knn)
 
-        # Generate all possible triangles with the 5 indx provided, and store
-        # them with the order (a, b, c) defined in _arrangetriplet
-        all_asterism_triang = [
-            arrange(vertex_indices=list(cmb)) for cmb in combinations(indx, 3)
-        ]
-        triang_vrtx.extend(all_asterism_triang)
+    # Generate all possible triangles with the knn neighbors of every source,
+    # and store them with the order (a, b, c) defined in _arrangetriplet
+    triangles = indx[:, _np.array(list(combinations(range(knn), 3)))]
+    triang_vrtx = _arrangetriplet(sources, triangles.reshape(-1, 3))
+    points = sources[triang_vrtx]
+    inv = _invariantfeatures(points[:, 0], points[:, 1], points[:, 2])
 
-        inv.extend(
-            [
-                _invariantfeatures(*sources[triplet])
-                for triplet in all_asterism_triang
-            ]
-        )
+    # Remove here all possible duplicate triangles, the last occurrence of
+    # each invariant is kept in the order they were generated
+    __, last = _np.unique(inv[::-1], axis=0, return_index=True)
+    uniq_ind = _np.sort(len(inv) - 1 - last)
 
-    # Remove here all possible duplicate triangles
-    uniq_ind = [
-        pos for (pos, elem) in enumerate(inv) if elem not in inv[pos + 1 :]
-    ]
-    inv_uniq = _np.array(inv)[uniq_ind]
-    triang_vrtx_uniq = _np.array(triang_vrtx)[uniq_ind]
-
-    return inv_uniq, triang_vrtx_uniq
+    return inv[uniq_ind], triang_vrtx[uniq_ind]
 
 
 class _MatchTransform:
@@ -214,6 +231,118 @@ class _MatchTransform:
         error = resid.max(axis=1)
         return error
 
+    def fit_batch(self, data):
+        """
+        Return the 2D similarity transform of each set of corresponding
+        triangles in data, arranged in a (N, 3, 2) array.
+        The least squares solution is computed in closed form for all of
+        them at once, it is returned as a (N, 3, 3) array of matrices.
+        """
+        src = self.source[data[..., 0]]
+        dst = self.target[data[..., 1]]
+        src_mean = src.mean(axis=1)
+        dst_mean = dst.mean(axis=1)
+        sx, sy = _np.moveaxis(src - src_mean[:, None], -1, 0)
+        dx, dy = _np.moveaxis(dst - dst_mean[:, None], -1, 0)
+        with _np.errstate(divide="ignore", invalid="ignore"):
+            norm = (sx**2 + sy**2).sum(axis=1)
+            a = (sx * dx + sy * dy).sum(axis=1) / norm
+            b = (sx * dy - sy * dx).sum(axis=1) / norm
+        params = _np.zeros((len(data), 3, 3))
+        params[:, 0, 0] = params[:, 1, 1] = a
+        params[:, 0, 1] = -b
+        params[:, 1, 0] = b
+        params[:, 0, 2] = dst_mean[:, 0] - (a * src_mean[:, 0] - b * src_mean[:, 1])
+        params[:, 1, 2] = dst_mean[:, 1] - (b * src_mean[:, 0] + a * src_mean[:, 1])
+        params[:, 2, 2] = 1
+        return params
+
+    def pairs(self, data, thresh):
+        """
+        Index the (source, target) point pairs of the triangles in data,
+        (N, 3, 2), for inliers_batch with the same thresh.
+        """
+        from scipy.spatial import KDTree
+
+        n_target = len(self.target)
+        keys, inverse = _np.unique(
+            data[..., 0] * n_target + data[..., 1], return_inverse=True
+        )
+        inverse = inverse.reshape(-1)
+        # triangles of each pair, in a compressed sparse layout
+        order = _np.argsort(inverse, kind="stable")
+        starts = _np.searchsorted(inverse[order], _np.arange(len(keys) + 1))
+        # only the source points which belong to a pair are transformed
+        sources = _np.unique(keys // n_target)
+        # target points closer than thresh to a point are closer than
+        # 2 * thresh to each other, so this many neighbors cover all of them
+        tree = KDTree(self.target)
+        neighbors = max(map(len, tree.query_ball_tree(tree, 2 * thresh)))
+        return (
+            tree,
+            neighbors,
+            sources,
+            keys,
+            order // 3,
+            starts,
+            len(data),
+        )
+
+    def inliers_batch(self, pairs, params, thresh):
+        """
+        Return a (M, N) boolean array, True where the error of a set of
+        triangles indexed by pairs is below thresh under a transform of
+        params, (M, 3, 3). It is the same as get_error(data, T) < thresh
+        for every transform.
+        The good pairs are found by looking up the target points close to
+        the transformed source points, so the cost doesn't depend on the
+        number of triangles.
+        """
+        tree, neighbors, sources, keys, triangles, starts, n_data = pairs
+        n_target = len(self.target)
+        points = _np.hstack((self.source[sources], _np.ones((len(sources), 1))))
+        with _np.errstate(invalid="ignore"):
+            mapped = points @ params[:, :2].transpose(0, 2, 1)
+        mapped = mapped.reshape(-1, 2)
+        mapped[~_np.isfinite(mapped).all(axis=1)] = _np.inf
+        # the queried distance is slightly larger , the errors are checked next
+        __, close = tree.query(
+            mapped, k=neighbors, distance_upper_bound=thresh * (1 + 1e-6)
+        )
+        close = close.reshape(len(mapped), neighbors)
+        rows, src = _np.divmod(
+            _np.nonzero(close < n_target)[0], len(sources)
+        )
+        close = close[close < n_target]
+        point = self.source[sources[src]]
+        row = params[rows]
+        resid = _np.hypot(
+            row[:, 0, 0] * point[:, 0] + row[:, 0, 1] * point[:, 1] + row[:, 0, 2]
+            - self.target[close, 0],
+            row[:, 1, 0] * point[:, 0] + row[:, 1, 1] * point[:, 1] + row[:, 1, 2]
+            - self.target[close, 1],
+        )
+        below = resid < thresh
+        rows = rows[below]
+        wanted = sources[src[below]] * n_target + close[below]
+        # keep the close pairs which belong to triangles
+        good = _np.searchsorted(keys, wanted)
+        found = good < len(keys)
+        found[found] = keys[good[found]] == wanted[found]
+        rows, good = rows[found], good[found]
+        # a set of triangles is an inlier when its 3 pairs are good
+        lengths = starts[good + 1] - starts[good]
+        offsets = _np.arange(lengths.sum()) - _np.repeat(
+            _np.cumsum(lengths) - lengths, lengths
+        )
+        keys = _np.repeat(rows, lengths) * n_data + triangles[
+            _np.repeat(starts[good], lengths) + offsets
+        ]
+        keys, counts = _np.unique(keys, return_counts=True)
+        inliers = _np.zeros((len(params), n_data), dtype=bool)
+        inliers.flat[keys[counts == 3]] = True
+        return inliers
+
 
 def _data(image):
     if hasattr(image, "data") and isinstance(image.data, _np.ndarray):
@@ -237,6 +366,62 @@ def _shape(image):
     return h, w
 
 
+class ReferenceModel:
+    """Control points, triangle invariants and invariant tree of a target.
+    Aligning a sequence of frames to the same reference only needs them once,
+    pass the model to ``find_transform`` or ``register`` in place of the
+    target image.
+    Parameters
+    ----------
+        target
+            A 2D NumPy, CCData or NDData array of the target (destination) image
+            or an interable of (x, y) coordinates of the target control points.
+        max_control_points
+            The maximum number of control point-sources to find the transformation.
+        detection_sigma : int
+            Factor of background std-dev above which is considered a detection.
+            This value is ignored if input are not images.
+        min_area : int
+            Minimum number of connected pixels to be considered a source.
+            This value is ignored if input are not images.
+    Raises
+    ------
+        TypeError
+            If input type of ``target`` is not supported.
+        ValueError
+            If it cannot find more than 3 stars on the target.
+    """
+
+    def __init__(
+        self, target, max_control_points=50, detection_sigma=5, min_area=5
+    ):
+        from scipy.spatial import KDTree
+
+        self.shape = None
+        try:
+            if len(_data(target)[0]) == 2:
+                # Assume it's a list of (x, y) pairs
+                self.controlp = _np.array(target)[:max_control_points]
+            else:
+                # Assume it's a 2D image
+                self.shape = _data(target).shape
+                self.controlp = _find_sources(
+                    _bw(_data(target)),
+                    detection_sigma=detection_sigma,
+                    min_area=min_area,
+                )[:max_control_points]
+        except Exception:
+            raise TypeError("Input type for target not supported.")
+
+        if len(self.controlp) < 3:
+            raise ValueError(
+                "Reference stars in target image are less than the "
+                "minimum value (3)."
+            )
+        self.invariants, self.asterisms = _generate_invariants(self.controlp)
+        self.tree = KDTree(self.invariants)
+
+
 def find_transform(
     source, target, max_control_points=50, detection_sigma=5, min_area=5
 ):
@@ -252,7 +437,8 @@ def find_transform(
             or an interable of (x, y) coordinates of the source control points.
         target
             A 2D NumPy, CCData or NDData array of the target (destination) image
-            or an interable of (x, y) coordinates of the target control points.
+            or an interable of (x, y) coordinates of the target control points
+            or a ``ReferenceModel`` of the target, prepared once.
         max_control_points
             The maximum number of control point-sources to find the transformation.
         detection_sigma : int
@@ -266,6 +452,7 @@ def find_transform(
         T, (source_pos_array, target_pos_array)
             The transformation object and a tuple of corresponding star positions
             in source and target.
+            ``T.report`` is the RansacReport of the search.
     Raises
     ------
         TypeError
@@ -273,10 +460,9 @@ def find_transform(
         ValueError
             If it cannot find more than 3 stars on any input.
         MaxIterError
-            If no transformation is found.
+            If no transformation is found, its ``report`` attribute is the
+            RansacReport of the search.
     """
-    from scipy.spatial import KDTree
-
     try:
         if len(_data(source)[0]) == 2:
             # Assume it's a list of (x, y) pairs
@@ -291,19 +477,15 @@ def find_transform(
     except Exception:
         raise TypeError("Input type for source not supported.")
 
-    try:
-        if len(_data(target)[0]) == 2:
-            # Assume it's a list of (x, y) pairs
-            target_controlp = _np.array(target)[:max_control_points]
-        else:
-            # Assume it's a 2D image
-            target_controlp = _find_sources(
-                _bw(_data(target)),
-                detection_sigma=detection_sigma,
-                min_area=min_area,
-            )[:max_control_points]
-    except Exception:
-        raise TypeError("Input type for target not supported.")
+    if isinstance(target, ReferenceModel):
+        reference = target
+    else:
+        reference = ReferenceModel(
+            target,
+            max_control_points=max_control_points,
+            detection_sigma=detection_sigma,
+            min_area=min_area,
+        )
 
     # Check for low number of reference points
     if len(source_controlp) < 3:
@@ -311,18 +493,30 @@ def find_transform(
             "Reference stars in source image are less than the "
             "minimum value (3)."
         )
-    if len(target_controlp) < 3:
-        raise ValueError(
-            "Reference stars in target image are less than the "
-            "minimum value (3)."
-        )
+
+    return _match_control_points(source_controlp, reference)
+
+
+def _match_control_points(source_controlp, reference):
+    """Estimate the transform between control points and a reference.
+    Returns
+    -------
+        T, (source_pos_array, target_pos_array)
+            As returned by ``find_transform``.
+    Raises
+    ------
+        MaxIterError
+            If no transformation is found.
+    """
+    from scipy.spatial import KDTree
+
+    target_controlp = reference.controlp
+    target_asterisms = reference.asterisms
+    target_invariant_tree = reference.tree
 
     source_invariants, source_asterisms = _generate_invariants(source_controlp)
     source_invariant_tree = KDTree(source_invariants)
 
-    target_invariants, target_asterisms = _generate_invariants(target_controlp)
-    target_invariant_tree = KDTree(target_invariants)
-
     # r = 0.1 is the maximum search distance, 0.1 is an empirical value that
     # returns about the same number of matches than inputs
     # matches_list is a list of lists such that for each element
@@ -337,12 +531,14 @@ def find_transform(
     # matches is a (N, 3, 2) array. N sets of similar corresponding triangles.
     # 3 indices for a triangle in ref
     # and the 3 indices for the corresponding triangle in target;
-    matches = []
     # t1 is an asterism in source, t2 in target
-    for t1, t2_list in zip(source_asterisms, matches_list):
-        for t2 in target_asterisms[t2_list]:
-            matches.append(list(zip(t1, t2)))
-    matches = _np.array(matches)
+    t1 = _np.repeat(_np.arange(len(matches_list)), list(map(len, matches_list)))
+    t2 = _np.fromiter(
+        (t for t2_list in matches_list for t in t2_list), dtype=_np.intp
+    )
+    matches = _np.stack(
+        [source_asterisms[t1], target_asterisms[t2]], axis=-1
+    )
 
     inv_model = _MatchTransform(source_controlp, target_controlp)
     n_invariants = len(matches)
@@ -353,10 +549,12 @@ def find_transform(
     ) == 1:
         best_t = inv_model.fit(matches)
         inlier_ind = _np.arange(len(matches))  # All of the indices
+        report = RansacReport(1, 1, 1, min_matches, 0.0, False)
     else:
-        best_t, inlier_ind = _ransac(
+        best_t, inlier_ind, report = _ransac(
             matches, inv_model, PIXEL_TOL, min_matches
         )
+    best_t.report = report
     triangle_inliers = matches[inlier_ind]
     d1, d2, d3 = triangle_inliers.shape
     inl_arr = triangle_inliers.reshape(d1 * d2, d3)
@@ -394,7 +592,8 @@ def apply_transform(
         source
             A 2D NumPy, CCData or NDData array of the source image to be transformed.
         target
-            A 2D NumPy, CCData or NDData array of the target image.
+            A 2D NumPy, CCData or NDData array of the target image
+            or a ``ReferenceModel``.
             Only used to set the output image shape.
         fill_value : float
             A value to fill in the areas of aligned_image where footprint == True.
@@ -410,7 +609,10 @@ def apply_transform(
     from skimage.transform import warp
 
     source_data = _data(source)
-    target_shape = _data(target).shape
+    if isinstance(target, ReferenceModel):
+        target_shape = target.shape or source_data.shape
+    else:
+        target_shape = _data(target).shape
 
     aligned_image = warp(
         source_data,
@@ -463,7 +665,8 @@ def register(
         source
             A 2D NumPy, CCData or NDData array of the source image to be transformed.
         target
-            A 2D NumPy, CCData or NDData array of the target image.
+            A 2D NumPy, CCData or NDData array of the target image
+            or a ``ReferenceModel`` of it.
             Used to set the output image shape as well.
         fill_value
             A value to fill in the areas of aligned_image where footprint == True.
@@ -552,13 +755,61 @@ def _find_sources(img, detection_sigma=5, min_area=5):
 # Modified by Martin Beroiz
 
 
+class RansacReport:
+    """Statistics of a RANSAC search.
+    Attributes
+    ----------
+        iterations : int
+            Number of candidate matches tried.
+        candidates : int
+            Number of candidate matches available.
+        inliers : int
+            Number of inliers of the accepted transformation, or the largest
+            number reached by a candidate if none was accepted.
+        min_matches : int
+            Number of inliers required to accept a transformation.
+        elapsed : float
+            Duration of the search in seconds.
+        batched : bool
+            Whether the candidates were scored by batches.
+    """
+
+    def __init__(
+        self, iterations, candidates, inliers, min_matches, elapsed, batched
+    ):
+        self.iterations = iterations
+        self.candidates = candidates
+        self.inliers = inliers
+        self.min_matches = min_matches
+        self.elapsed = elapsed
+        self.batched = batched
+
+    def __repr__(self):
+        return (
+            "RansacReport(iterations=%d, candidates=%d, inliers=%d, "
+            "min_matches=%d, elapsed=%.4f, batched=%s)"
+            % (
+                self.iterations,
+                self.candidates,
+                self.inliers,
+                self.min_matches,
+                self.elapsed,
+                self.batched,
+            )
+        )
+
+
 class MaxIterError(RuntimeError):
-    """Raise if maximum iterations reached."""
+    """Raise if maximum iterations reached.
+    The ``report`` attribute is the RansacReport of the search, if any.
+    """
 
-    pass
+    def __init__(self, message, report=None):
+        super().__init__(message)
+        self.report = report
 
 
-def _ransac(data, model, thresh, min_matches):
+def _ransac(data, model, thresh, min_matches, batch=None):
     """Fit model parameters to data using the RANSAC algorithm.
     This implementation written from pseudocode found at
     http://en.wikipedia.org/w/index.php?title=RANSAC&oldid=116358182
@@ -569,41 +820,39 @@ def _ransac(data, model, thresh, min_matches):
         thresh: a threshold value to determine when a data point fits a model
         min_matches: the min number of matches required to assert that a model
             fits well to data
+        batch: score the candidates by batches, the model needs ``fit_batch``,
+            ``pairs`` and ``inliers_batch``. Default is RANSAC_BATCH
     Returns
     -------
         bestfit: model parameters which best fit the data (or nil if no good
                   model is found)
+        inliers: indices of the data points which fit bestfit
+        report: RansacReport of the search
     """
-    good_fit = None
+    from time import perf_counter
+
+    start = perf_counter()
+    if batch is None:
+        batch = RANSAC_BATCH
+    batch = batch and hasattr(model, "inliers_batch")
     n_data = data.shape[0]
     all_idxs = _np.arange(n_data)
     _np.random.shuffle(all_idxs)
 
-    for iter_i in range(n_data):
-        # Partition indices into two random subsets
-        maybe_idxs = all_idxs[iter_i : iter_i + 1]
-        test_idxs = list(all_idxs[:iter_i])
-        test_idxs.extend(list(all_idxs[iter_i + 1 :]))
-        test_idxs = _np.array(test_idxs, dtype="i8")
-        maybeinliers = data[maybe_idxs, :]
-        test_points = data[test_idxs, :]
-        maybemodel = model.fit(maybeinliers)
-        test_err = model.get_error(test_points, maybemodel)
-        # select indices of rows with accepted points
-        also_idxs = test_idxs[test_err < thresh]
-        alsoinliers = data[also_idxs, :]
-        if len(alsoinliers) >= min_matches:
-            good_data = _np.concatenate((maybeinliers, alsoinliers))
-            good_fit = model.fit(good_data)
-            break
-
-    if good_fit is None:
+    search = _ransac_batched if batch else _ransac_sequential
+    accepted, good_data, iterations, most = search(
+        data, all_idxs, model, thresh, min_matches
+    )
+    if accepted is None:
         raise MaxIterError(
             "List of matching triangles exhausted before an acceptable "
-            "transformation was found"
+            "transformation was found",
+            RansacReport(
+                iterations, n_data, most, min_matches, perf_counter() - start, batch
+            ),
         )
 
-    better_fit = good_fit
+    better_fit = model.fit(good_data)
     for i in range(3):
         test_err = model.get_error(data, better_fit)
         better_inlier_idxs = _np.arange(n_data)[test_err < thresh]
@@ -611,4 +860,70 @@ def _ransac(data, model, thresh, min_matches):
         better_fit = model.fit(better_data)
     best_fit = better_fit
     best_inlier_idxs = better_inlier_idxs
-    return best_fit, best_inlier_idxs
\ No newline at end of file
+    report = RansacReport(
+        iterations,
+        n_data,
+        len(best_inlier_idxs),
+        min_matches,
+        perf_counter() - start,
+        batch,
+    )
+    return best_fit, best_inlier_idxs, report
+
+
+def _ransac_sequential(data, all_idxs, model, thresh, min_matches):
+    """Try the candidates in the order of all_idxs, one at a time.
+    Returns the accepted candidate, the data to fit, the number of candidates
+    tried and the largest number of inliers of a candidate.
+    """
+    most = 0
+    for iter_i in range(len(all_idxs)):
+        # Partition indices into two random subsets
+        maybe_idxs = all_idxs[iter_i : iter_i + 1]
+        test_idxs = _np.concatenate(
+            (all_idxs[:iter_i], all_idxs[iter_i + 1 :])
+        )
+        maybeinliers = data[maybe_idxs, :]
+        test_points = data[test_idxs, :]
+        maybemodel = model.fit(maybeinliers)
+        test_err = model.get_error(test_points, maybemodel)
+        # select indices of rows with accepted points
+        also_idxs = test_idxs[test_err < thresh]
+        most = max(most, len(also_idxs))
+        if len(also_idxs) >= min_matches:
+            good_data = _np.concatenate((maybeinliers, data[also_idxs, :]))
+            return iter_i, good_data, iter_i + 1, most
+    return None, None, len(all_idxs), most
+
+
+def _ransac_batched(data, all_idxs, model, thresh, min_matches):
+    """Score the candidates in the order of all_idxs by batches.
+    The first batch is small since a good candidate is usually found right
+    away, the next ones double up to _RANSAC_BATCH_ELEMENTS transformed points.
+    The candidate accepted is the same as with _ransac_sequential.
+    """
+    n_data = len(all_idxs)
+    shuffled = data[all_idxs]
+    pairs = model.pairs(shuffled, thresh)
+    largest = max(1, _RANSAC_BATCH_ELEMENTS // max(len(pairs[2]), 1))
+    size = min(8, largest)
+    most = 0
+    first = 0
+    while first < n_data:
+        last = min(first + size, n_data)
+        params = model.fit_batch(shuffled[first:last])
+        inliers = model.inliers_batch(pairs, params, thresh)
+        # a candidate doesn't count as its own inlier
+        inliers[_np.arange(last - first), _np.arange(first, last)] = False
+        counts = inliers.sum(axis=1)
+        most = max(most, int(counts.max()))
+        (good,) = _np.nonzero(counts >= min_matches)
+        if len(good):
+            i = good[0]
+            good_data = _np.concatenate(
+                (shuffled[first + i : first + i + 1], shuffled[inliers[i]])
+            )
+            return all_idxs[first + i], good_data, first + i + 1, most
+        first = last
+        size = min(size * 2, largest)
+    return None, None, n_data, most
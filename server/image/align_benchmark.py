@@ -0,0 +1,143 @@
+# coding=utf-8
+
+"""
+
+Copyright(c) 2022-2023 Max Qian  <lightapt.com>
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Library General Public
+License version 3 as published by the Free Software Foundation.
+This library is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Library General Public License for more details.
+You should have received a copy of the GNU Library General Public License
+along with this library; see the file COPYING.LIB.  If not, write to
+the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+Boston, MA 02110-1301, USA.
+
+"""
+
+# Benchmark of the registration of a sequence against a fixed reference ,
+# with the target prepared for every frame and with a reusable reference model ,
+# then of RANSAC with the candidates tried one at a time and by batches ,
+# then the shifts of phase correlation are checked against star matching
+# Usage : python align_benchmark.py [frames]
+
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+import align
+from align import MaxIterError, ReferenceModel, find_transform
+from noise import make_star_field
+
+# registration is imported from its package , it has relative imports
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from server.image.registration import PhaseCorrelator
+
+def make_sequence(shape : tuple, count : int, stars : int = 150) -> tuple:
+    """
+        Reference frame and copies of it slightly rotated and shifted like a drifting mount
+    """
+    reference, _ = make_star_field(shape, stars, fwhm=3.0, sky=500, read_noise=5,
+                                   flux=(5e3, 5e4), dtype=np.uint16, rng=2)
+    reference = reference.astype(np.float32)
+    rng = np.random.default_rng(3)
+    height, width = shape
+    frames = []
+    for _ in range(count):
+        angle = rng.uniform(-1.0, 1.0)
+        dx, dy = rng.uniform(-15, 15, 2)
+        matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+        matrix[:, 2] += (dx, dy)
+        frame = cv2.warpAffine(reference, matrix, (width, height), borderValue=500)
+        frame += rng.normal(0, 5, shape).astype(np.float32)
+        frames.append(frame)
+    return reference, frames
+
+def make_translations(reference, count : int) -> list:
+    """
+        Copies of the reference only shifted , interpolated like a frame moved by the registration
+    """
+    rng = np.random.default_rng(5)
+    height, width = reference.shape
+    frames = []
+    for _ in range(count):
+        matrix = np.float32([[1, 0, 0], [0, 1, 0]])
+        matrix[:, 2] = rng.uniform(-15, 15, 2)
+        frame = cv2.warpAffine(reference, matrix, (width, height), borderValue=500)
+        frames.append(frame + rng.normal(0, 5, reference.shape).astype(np.float32))
+    return frames
+
+def ransac(source, target, batch : bool, max_control_points : int) -> tuple:
+    """
+        Transform and RANSAC report of a search , the report of the error if none is found
+    """
+    align.RANSAC_BATCH = batch
+    # Same candidate order for both modes
+    np.random.seed(0)
+    try:
+        transform, _ = find_transform(source, target, max_control_points=max_control_points)
+        return transform, transform.report
+    except MaxIterError as e:
+        return None, e.report
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    reference, frames = make_sequence((1080, 1440), count)
+    print("%d frames of %dx%d" % (count, reference.shape[1], reference.shape[0]))
+
+    per_frame = [timed(find_transform, frame, reference) for frame in frames]
+    elapsed = sum(t for _, t in per_frame)
+    print("  target prepared per frame   %.3f s , %.1f ms per frame" % (elapsed, 1000 * elapsed / count))
+
+    model, prepare = timed(ReferenceModel, reference)
+    reused = [timed(find_transform, frame, model) for frame in frames]
+    elapsed = prepare + sum(t for _, t in reused)
+    print("  reference model             %.3f s , %.1f ms per frame , %.1f ms to prepare the model"
+          % (elapsed, 1000 * sum(t for _, t in reused) / count, 1000 * prepare))
+
+    # Both paths must find the same transforms
+    diff = max(np.abs(a[0].params - b[0].params).max() for (a, _), (b, _) in zip(per_frame, reused))
+    print("  largest difference between the transforms %.2e" % diff)
+    ok = diff < 1e-6
+
+    # A frame which matches and one which doesn't , the whole list of candidates is tried
+    rng = np.random.default_rng(4)
+    print("RANSAC , one at a time and by batches")
+    for label, points in (("matching", 200), ("not matching", 100)):
+        if label == "matching":
+            source, target = frames[0], reference
+        else:
+            source, target = rng.uniform(0, 1000, (2, points, 2))
+        (former, report_former), elapsed_former = timed(ransac, source, target, False, points)
+        (batched, report), elapsed = timed(ransac, source, target, True, points)
+        print("  %-13s %d candidates , %d tried , %d inliers : %.3f s then %.3f s"
+              % (label, report.candidates, report.iterations, report.inliers, elapsed_former, elapsed))
+        ok &= report.iterations == report_former.iterations and report.inliers == report_former.inliers
+        if former is not None:
+            ok &= np.allclose(former.params, batched.params)
+    print("  results %s" % ("match" if ok else "DIFFER"))
+
+    # Both registration paths must move the frames alike , compared at the center of the frame
+    # where the star transform is least sensitive to an error of its rotation
+    correlator = PhaseCorrelator(reference)
+    center = np.array([reference.shape[1] / 2, reference.shape[0] / 2, 1.0])
+    worst = 0.0
+    for frame in make_translations(reference, count):
+        dx, dy, _ = correlator.shift(frame)
+        transform, _ = find_transform(frame, model)
+        moved = np.linalg.inv(transform.params) @ center - center
+        worst = np.inf if dx is None else max(worst, abs(dx - moved[0]), abs(dy - moved[1]))
+    print("Phase correlation , largest difference with star matching %.4f px" % worst)
+    ok &= worst < 0.02
+    sys.exit(0 if ok else 1)
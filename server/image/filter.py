@@ -18,119 +18,131 @@ Boston, MA 02110-1301, USA.
 
 """
 
+import cv2
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 
 # #################################################################
 # Some functions about filter
 # #################################################################
 
+# Number of window elements handled at once by the numpy median , to bound the memory used
+MEDIAN_BLOCK_ELEMENTS = 1 << 24
+
+def _check_template(template_size : int) -> int:
+    """
+        Check the template size and return its radius
+    """
+    if template_size < 1 or template_size % 2 == 0:
+        raise ValueError("Template size must be a positive odd number")
+    return template_size // 2
+
+def _clear_border(img : np.ndarray, radius : int) -> np.ndarray:
+    """
+        Set the pixels whose window doesn't fit in the image to zero
+    """
+    if radius:
+        img[:radius] = 0
+        img[-radius:] = 0
+        img[:, :radius] = 0
+        img[:, -radius:] = 0
+    return img
+
+def _median_blocks(img : np.ndarray, template_size : int) -> np.ndarray:
+    """
+        Median filter with sliding windows , a block of rows at a time
+    """
+    radius = template_size // 2
+    h, w = img.shape[:2]
+    output = np.zeros_like(img)
+    middle = template_size * template_size // 2
+    channels = int(np.prod(img.shape[2:]))
+    rows = max(1, MEDIAN_BLOCK_ELEMENTS // (w * channels * template_size * template_size))
+    for top in range(radius, h - radius, rows):
+        bottom = min(top + rows, h - radius)
+        windows = sliding_window_view(img[top - radius:bottom + radius], (template_size, template_size), axis=(0, 1))
+        windows = windows.reshape(windows.shape[:-2] + (-1,))
+        output[top:bottom, radius:w - radius] = np.partition(windows, middle, axis=-1)[..., middle]
+    return output
+
 def medianfliter(img : np.ndarray, template_size : int) -> np.ndarray:
     """
         Median-fliter function | 中值滤波
         Args:
-            img : np.ndarray # image to calculate
-            template_size : int # template size , 3 or 5
+            img : np.ndarray # image to calculate , 8 or 16 bits , gray or color
+            template_size : int # template size , any odd number
         Returns:
-            np.ndarray: median-fliter image
+            np.ndarray: median-fliter image , the pixels closer to the edge than the template radius are zero
     """
-    output = img
-    if template_size == 3 :
-        output1 = np.zeros(img.shape, np.uint8)
-        # Complete the 9 surrounding squares and templates for bubble sorting
-        for i in range(1, output.shape[0]-1):
-            for j in range(1, output.shape[1]-1):
-                value1 = [output[i-1][j-1], output[i-1][j], output[i-1][j+1], output[i][j-1], output[i][j], output[i][j+1], output[i+1][j-1], output[i+1][j], +output[i+1][j+1]]
-                output1[i-1][j-1] = np.sort(value1)[4]
-    elif template_size == 5:
-        output1 = np.zeros(img.shape, np.uint8)
-        # Complete 25 squares around to convolve with the template
-        for i in range(2, output.shape[0]-2):
-            for j in range(2, output.shape[1]-2):
-                value1 = [output[i-2][j-2],output[i-2][j-1],output[i-2][j],output[i-2][j+1],output[i-2][j+2],output[i-1][j-2],output[i-1][j-1],output[i-1][j],output[i-1][j+1],\
-                            output[i-1][j+2],output[i][j-2],output[i][j-1],output[i][j],output[i][j+1],output[i][j+2],output[i+1][j-2],output[i+1][j-1],output[i+1][j],output[i+1][j+1],\
-                            output[i+1][j+2],output[i+2][j-2],output[i+2][j-1],output[i+2][j],output[i+2][j+1],output[i+2][j+2]]
-                output1[i-2][j-2] = value1.sort()[12]
-    else :
-        print("Unknown template size , choose from 3 or 5")
-    return output1
+    radius = _check_template(template_size)
+    img = np.asarray(img)
+    h, w = img.shape[:2]
+    if h < template_size or w < template_size:
+        return np.zeros_like(img)
+    channels = img.shape[2] if img.ndim == 3 else 1
+    # OpenCV handles any size for 8 bits , but only 3 and 5 for 16 bits
+    if template_size > 1 and channels in (1, 3, 4) and (img.dtype == np.uint8
+            or (img.dtype == np.uint16 and template_size <= 5)):
+        output = cv2.medianBlur(img, template_size)
+    else:
+        output = _median_blocks(img, template_size)
+    return _clear_border(output, radius)
 
 def meanflite(img : np.ndarray, template_size : int) -> np.ndarray:
     """
-        Mean-flite function | 中值滤波
+        Mean-flite function | 均值滤波
         Args:
-            a : np.ndarray # image to calculate
-            windowsize : int # window size, 3 or 5
+            img : np.ndarray # image to calculate , 8 or 16 bits , gray or color
+            template_size : int # window size , any odd number
         Returns:
-            output : np.ndarray # image after mean filter process
+            output : np.ndarray # image after mean filter process , the pixels closer to the edge
+                than the template radius are zero
     """
-    output = img
-    if template_size == 3:
-        # Generate 3x3 templates
-        window = np.ones((3, 3)) / 3 ** 2
-        output1 = np.zeros(img.shape, np.uint8)
-        # Complete the 9 surrounding squares and templates for bubble sorting
-        for i in range(1, output.shape[0] - 1):
-            for j in range(1, output.shape[1] - 1):
-                value = (output[i - 1][j - 1] * window[0][0] + output[i - 1][j] * window[0][1] + output[i - 1][j + 1] *
-                         window[0][2] + \
-                         output[i][j - 1] * window[1][0] + output[i][j] * window[1][1] + output[i][j + 1] * window[1][
-                             2] +\
-                         output[i + 1][j - 1] * window[2][0] + output[i + 1][j] * window[2][1] + output[i + 1][j + 1] *
-                         window[2][2])
-                output1[i - 1][j - 1] = value
-    elif template_size == 5:
-        # Generate 5x5 templates
-        window = np.ones((5, 5)) / 5 ** 2
-        output1 = np.zeros(img.shape, np.uint8)
-        # Complete 25 squares around to convolve with the template
-        for i in range(2, output.shape[0] - 2):
-            for j in range(2, output.shape[1] - 2):
-                value = (output[i - 2][j - 2] * window[0][0] + output[i - 2][j - 1] * window[0][1] + output[i - 2][j] *
-                         window[0][2] + output[i - 2][j + 1] * window[0][3] + output[i - 2][j + 2] * window[0][4] + \
-                         output[i - 1][j - 2] * window[1][0] + output[i - 1][j - 1] * window[1][1] + output[i - 1][j] *
-                         window[1][2] + output[i - 1][j + 1] * window[1][3] + output[i - 1][j + 2] * window[1][4] + \
-                         output[i][j - 2] * window[2][0] + output[i][j - 1] * window[2][1] + output[i][j] * window[2][
-                             2] + output[i][j + 1] * window[2][3] + output[i][j + 2] * window[2][4] + \
-                         output[i + 1][j - 2] * window[3][0] + output[i + 1][j - 1] * window[3][1] + output[i + 1][j] *
-                         window[3][2] + output[i + 1][j + 1] * window[3][3] + output[i + 1][j + 2] * window[3][4] + \
-                         output[i + 2][j - 2] * window[4][0] + output[i + 2][j - 1] * window[4][1] + output[i + 2][j] *
-                         window[4][2] + output[i + 2][j + 1] * window[4][3] + output[i + 2][j + 2] * window[4][4])
-                output1[i - 2][j - 2] = value
+    radius = _check_template(template_size)
+    img = np.asarray(img)
+    h, w = img.shape[:2]
+    output = np.zeros_like(img)
+    if h < template_size or w < template_size:
+        return output
+    integer = np.issubdtype(img.dtype, np.integer)
+    # Summed-area table , every window sum is then four lookups
+    table = np.zeros((h + 1, w + 1) + img.shape[2:], dtype=np.int64 if integer else np.float64)
+    np.cumsum(np.cumsum(img, axis=0, dtype=table.dtype), axis=1, out=table[1:, 1:])
+    k = template_size
+    sums = table[k:, k:] - table[:-k, k:] - table[k:, :-k] + table[:-k, :-k]
+    if integer:
+        output[radius:h - radius, radius:w - radius] = sums // (k * k)
     else:
-        print("Invalid template size was given")
-    return output1
+        output[radius:h - radius, radius:w - radius] = sums / (k * k)
+    return output
 
 def gaussianfilter(img : np.ndarray,sigma : float,kernel_size : int) -> np.ndarray:
     """
         Gaussian filter | 高斯滤波
         Args:
-            img : np.ndarray # image to filter
+            img : np.ndarray # image to filter , 8 or 16 bits , gray or color
             sigma : float # sigma of the Gaussian filter
-            kernel_size : int # kernel size of the Gaussian filter
+            kernel_size : int # kernel size of the Gaussian filter , any odd number
         Returns:
-            np.ndarray # filtered image
+            np.ndarray # filtered image , with the type of the input and zero padding at the edges
         Examples:
             gaussianfilter(image,1.5,3)
     """
-    h,w,c = img.shape
-    # Zero padding | 零填充
-    padding = kernel_size//2
-    out = np.zeros((h + 2*padding,w + 2*padding,c),dtype=np.float)
-    out[padding:padding+h,padding:padding+w] = img.copy().astype(np.float)
-    # Define filter kernel | 定义滤波核
-    kernel = np.zeros((kernel_size,kernel_size),dtype=np.float)
-    
-    for x in range(-padding,-padding+kernel_size):
-        for y in range(-padding,-padding+kernel_size):
-            kernel[y+padding,x+padding] = np.exp(-(x**2+y**2)/(2*(sigma**2)))
-    kernel /= (sigma*np.sqrt(2*np.pi))
+    padding = _check_template(kernel_size)
+    img = np.asarray(img)
+    # The kernel is separable , so the image is filtered by rows and then by columns
+    x = np.arange(-padding, padding + 1)
+    kernel = np.exp(-(x ** 2) / (2 * (sigma ** 2)))
     kernel /= kernel.sum()
-    
-    # Convolution process | 卷积过程
-    tmp = out.copy()
-    for y in range(h):
-        for x in range(w):
-            for ci in range(c):
-                out[padding+y,padding+x,ci] = np.sum(kernel*tmp[y:y+kernel_size,x:x+kernel_size,ci])
-    
-    return out[padding:padding+h,padding:padding+w].astype(np.uint8)
\ No newline at end of file
+    source = img.astype(np.float64)
+    if img.ndim == 3 and img.shape[2] > 4:
+        out = np.stack([
+            cv2.sepFilter2D(source[..., ci], cv2.CV_64F, kernel, kernel, borderType=cv2.BORDER_CONSTANT)
+            for ci in range(img.shape[2])
+        ], axis=-1)
+    else:
+        out = cv2.sepFilter2D(source, cv2.CV_64F, kernel, kernel, borderType=cv2.BORDER_CONSTANT)
+    if np.issubdtype(img.dtype, np.integer):
+        info = np.iinfo(img.dtype)
+        return np.clip(out, info.min, info.max).astype(img.dtype)
+    return out.astype(img.dtype)
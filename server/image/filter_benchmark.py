@@ -0,0 +1,129 @@
+# coding=utf-8
+
+"""
+
+Copyright(c) 2022 Max Qian  <astroair.cn>
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Library General Public
+License version 3 as published by the Free Software Foundation.
+This library is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Library General Public License for more details.
+You should have received a copy of the GNU Library General Public License
+along with this library; see the file COPYING.LIB.  If not, write to
+the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+Boston, MA 02110-1301, USA.
+
+"""
+
+# Micro-benchmark of the filters , compared with the former per-pixel loops
+# Usage : python filter_benchmark.py [width height]
+
+import sys
+import time
+
+import numpy as np
+
+from filter import gaussianfilter, meanflite, medianfliter
+
+# #################################################################
+# Former implementations , the 3x3 and 5x5 windows are written generically
+# #################################################################
+
+def loop_medianfliter(img : np.ndarray, template_size : int) -> np.ndarray:
+    # The former loops wrote the result of the window centered on (i, j) to (i - r, j - r)
+    r = template_size // 2
+    output1 = np.zeros(img.shape, np.uint8)
+    for i in range(r, img.shape[0] - r):
+        for j in range(r, img.shape[1] - r):
+            value1 = [img[i + y][j + x] for y in range(-r, r + 1) for x in range(-r, r + 1)]
+            output1[i - r][j - r] = np.sort(value1)[len(value1) // 2]
+    return output1
+
+def loop_meanflite(img : np.ndarray, template_size : int) -> np.ndarray:
+    r = template_size // 2
+    window = np.ones((template_size, template_size)) / template_size ** 2
+    output1 = np.zeros(img.shape, np.uint8)
+    for i in range(r, img.shape[0] - r):
+        for j in range(r, img.shape[1] - r):
+            value = 0
+            for y in range(-r, r + 1):
+                for x in range(-r, r + 1):
+                    value = value + img[i + y][j + x] * window[y + r][x + r]
+            output1[i - r][j - r] = value
+    return output1
+
+def loop_gaussianfilter(img : np.ndarray, sigma : float, kernel_size : int) -> np.ndarray:
+    h, w, c = img.shape
+    padding = kernel_size // 2
+    out = np.zeros((h + 2 * padding, w + 2 * padding, c), dtype=float)
+    out[padding:padding + h, padding:padding + w] = img.copy().astype(float)
+    kernel = np.zeros((kernel_size, kernel_size), dtype=float)
+    for x in range(-padding, -padding + kernel_size):
+        for y in range(-padding, -padding + kernel_size):
+            kernel[y + padding, x + padding] = np.exp(-(x ** 2 + y ** 2) / (2 * (sigma ** 2)))
+    kernel /= (sigma * np.sqrt(2 * np.pi))
+    kernel /= kernel.sum()
+    tmp = out.copy()
+    for y in range(h):
+        for x in range(w):
+            for ci in range(c):
+                out[padding + y, padding + x, ci] = np.sum(kernel * tmp[y:y + kernel_size, x:x + kernel_size, ci])
+    return out[padding:padding + h, padding:padding + w].astype(np.uint8)
+
+def compare(name : str, expected : np.ndarray, result : np.ndarray, elapsed : float) -> bool:
+    diff = np.abs(expected.astype(np.int64) - result.astype(np.int64))
+    print("  %-14s former loop %.2f s , max difference %d , %d of %d pixels differ"
+          % (name, elapsed, diff.max(), np.count_nonzero(diff), diff.size))
+    return diff.max() <= 1
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+if __name__ == "__main__":
+    width, height = (int(v) for v in sys.argv[1:3]) if len(sys.argv) >= 3 else (4096, 3072)
+    rng = np.random.default_rng(0)
+
+    # Equality with the former loops , on a frame small enough for them
+    small = rng.integers(0, 256, (96, 128, 3), dtype=np.uint8)
+    gray = small[..., 0]
+    print("Comparison with the former loops on %dx%d" % (small.shape[1], small.shape[0]))
+    ok = True
+    for size in (3, 5):
+        r = size // 2
+        old, elapsed = timed(loop_medianfliter, gray, size)
+        new = medianfliter(gray, size)
+        # Median values are exact , so they must be equal
+        ok &= compare("median %dx%d" % (size, size), old[:-2 * r, :-2 * r], new[r:-r, r:-r], elapsed) \
+            and np.array_equal(old[:-2 * r, :-2 * r], new[r:-r, r:-r])
+        old, elapsed = timed(loop_meanflite, gray, size)
+        new = meanflite(gray, size)
+        # The former sum of weighted floats sometimes truncated an exact mean to the level below
+        ok &= compare("mean %dx%d" % (size, size), old[:-2 * r, :-2 * r], new[r:-r, r:-r], elapsed)
+        old, elapsed = timed(loop_gaussianfilter, small, 1.5, size)
+        new = gaussianfilter(small, 1.5, size)
+        ok &= compare("gaussian %dx%d" % (size, size), old, new, elapsed)
+    print("  results %s" % ("match" if ok else "DIFFER"))
+
+    # Speed on a full frame
+    frame8 = rng.integers(0, 256, (height, width), dtype=np.uint8)
+    frame16 = rng.integers(0, 65536, (height, width), dtype=np.uint16)
+    color = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    print("Full frame %dx%d" % (width, height))
+    for label, func, args in (
+        ("median 3 u8", medianfliter, (frame8, 3)),
+        ("median 7 u8", medianfliter, (frame8, 7)),
+        ("median 5 u16", medianfliter, (frame16, 5)),
+        ("median 7 u16", medianfliter, (frame16, 7)),
+        ("mean 5 u8", meanflite, (frame8, 5)),
+        ("mean 15 u16", meanflite, (frame16, 15)),
+        ("gaussian 5 rgb", gaussianfilter, (color, 1.5, 5)),
+        ("gaussian 9 u16", gaussianfilter, (frame16, 2.5, 9)),
+    ):
+        _, elapsed = timed(func, *args)
+        print("  %-16s %.3f s" % (label, elapsed))
+    sys.exit(0 if ok else 1)
@@ -24,92 +24,129 @@ import numpy as np
 # Some functions about adding noise to image
 # #########################################################################
 
-from random import random,randint
+def _generator(rng : np.random.Generator | int | None) -> np.random.Generator:
+    """
+        Get a random generator from a generator , a seed or None for a fresh one
+    """
+    return np.random.default_rng(rng)
+
+def _white(dtype : np.dtype) -> float:
+    """
+        Get the value of a white pixel , the largest integer or 1 for float images
+    """
+    if np.issubdtype(dtype, np.integer):
+        return np.iinfo(dtype).max
+    return 1.0
 
-def add_salt_pepper_noise(image : np.ndarray, threshold : float) -> np.ndarray:
+def add_salt_pepper_noise(image : np.ndarray, threshold : float,
+                          rng : np.random.Generator | int | None = None) -> np.ndarray:
     """
         Add salt and pepper noise to image
         Args:
             image: np.ndarray # image to add noise
-            threshold: float # Salt noise threshold
+            threshold: float # Salt noise threshold , the probability of each kind of noise
+            rng: np.random.Generator | int | None # generator or seed , for reproducible noise
         Returns:
-            np.ndarray
+            np.ndarray # same type as the image
     """
-    output = np.zeros(image.shape, np.uint8)
-    thres = 1 - threshold
-    # Traverse the grayscale of the entire image | 遍历整个图片的灰度级
-    for i in range(image.shape[0]):
-        for j in range(image.shape[1]):
-            # Generate a random number between 0-1 | 生成一个随机0-1之间的随机数
-            randomnum = random()
-            # If the random number is greater than the salt noise threshold of 0.1, set the gray level value at this position to 0, that is, add salt noise
-            if randomnum < threshold:  # 如果随机数大于盐噪声阈值0.1，则将此位置灰度级的值设为0，即添加盐噪声
-                output[i][j] = 0
-            # If the random number is greater than the pepper noise threshold of 1-0.1, set the output of the gray level at this position to 255, that is, add pepper noise
-            elif randomnum > thres:  # 如果随机数大于胡椒噪声阈值1-0.1，则将此位置灰度级的输出设为255，即添加胡椒噪声
-                output[i][j] = 255
-            # If the random number is between the two, the gray level value at this position is equal to the gray level value of the original image
-            else:  # 如果随机数处于两者之间，则此位置的灰度级的值等于原图的灰度级值
-                output[i][j] = image[i][j]
+    image = np.asarray(image)
+    output = image.copy()
+    # One draw per pixel , shared by all of the channels like the former loops
+    randomnum = _generator(rng).random(image.shape[:2])
+    # Below the threshold the pixel becomes black , above 1 - threshold it becomes white
+    output[randomnum < threshold] = 0
+    output[randomnum > 1 - threshold] = _white(image.dtype)
     return output
 
-def add_gaussian_noise(image : np.ndarray, mean : float, var : float) -> np.ndarray:
+def add_gaussian_noise(image : np.ndarray, mean : float, var : float,
+                       rng : np.random.Generator | int | None = None) -> np.ndarray:
     """
         Add gaussian noise to image | 为图像添加高斯噪声
         Args:
             image: np.ndarray # image to add noise
-            mean: float # mean value 均值
-            var: float # variance value 方差
+            mean: float # mean value 均值 , as a fraction of the white level
+            var: float # variance value 方差 , as a fraction of the white level
+            rng: np.random.Generator | int | None # generator or seed , for reproducible noise
         Returns:
-            np.ndarray # image with gaussian noise
+            np.ndarray # image with gaussian noise , same type as the image
     """
-    image = np.array(image/255, dtype=float)
-    noise = np.normal(mean, var ** 0.5, image.shape)
-    output = image + noise
-    output_handle = np.array([[[0]*3 for i in range(output.shape[1])] for i in range(output.shape[0])], dtype=float)
-    if output.min() < 0:
-        low_clip = -1.
-    else:
-        low_clip = 0.
-    for i in range (output.shape[0]):
-        for j in range (output.shape[1]):
-            for k in range (output.shape[2]):
-                if output[i][j][k] < low_clip:
-                    output_handle[i][j][k] = low_clip
-                elif output[i][j][k] > 1.0:
-                    output_handle[i][j][k] = 1.0
-                else:
-                    output_handle[i][j][k] = output[i][j][k]
-    output = np.uint8(output_handle*255)
-    return output
+    image = np.asarray(image)
+    white = _white(image.dtype)
+    output = image / white
+    output += _generator(rng).normal(mean, var ** 0.5, image.shape)
+    np.clip(output, 0.0, 1.0, out=output)
+    output *= white
+    return output.astype(image.dtype)
 
-def add_random_noise(image : np.ndarray,threshold : float) -> np.ndarray:
+def add_random_noise(image : np.ndarray,threshold : float,
+                     rng : np.random.Generator | int | None = None) -> np.ndarray:
     """
         Add random noise to image | 为图像添加随机噪声
         Args:
-            image: np.ndarray # image to add noise
+            image: np.ndarray # color image to add noise
             threshold: float # probability to add noise
+            rng: np.random.Generator | int | None # generator or seed , for reproducible noise
+        Returns:
+            np.ndarray # image with random bright and dark pixels , same type as the image
+    """
+    rng = _generator(rng)
+    output = np.array(image, copy=True)
+    scale = _white(output.dtype) / 255
+    n = int(rng.integers(1, 1001)) + int(threshold*20000)
+    # Bright pixels first , then dark pixels which may cover some of them
+    for count, bright in ((max(n - 500, 0), True), (n, False)):
+        i = rng.integers(0, output.shape[0], count)
+        j = rng.integers(0, output.shape[1], count)
+        values = rng.integers(0, 51, (count,) + output.shape[2:]) * scale
+        if bright:
+            values = _white(output.dtype) - values
+        output[i, j] = values.astype(output.dtype)
+    return output
+
+def make_star_field(shape : tuple = (1080, 1920), stars : int = 200, fwhm : float = 3.0,
+                    sky : float = 1000.0, read_noise : float = 5.0, flux : tuple = (1e3, 1e5),
+                    dtype : np.dtype = np.uint16, rng : np.random.Generator | int | None = None) -> tuple:
+    """
+        Generate a synthetic star field , for detection and stacking benchmarks
+        Args:
+            shape: tuple # (height , width) of the frame
+            stars: int # number of stars
+            fwhm: float # FWHM of the Gaussian PSF in pixels
+            sky: float # sky background in electrons per pixel
+            read_noise: float # read noise in electrons
+            flux: tuple # (min , max) total flux of the stars in electrons , drawn log-uniformly
+            dtype: np.dtype # type of the frame , values are clipped to its range
+            rng: np.random.Generator | int | None # generator or seed , for reproducible frames
         Returns:
-            np.ndarray # image with random noise
+            tuple # (frame , truth) , truth is a (stars , 3) array of x , y and flux
+        Examples:
+            frame, truth = make_star_field((512, 512), 50, rng=42)
     """
-    output = image
-    n = randint(1, 1000) + int(threshold*20000)
-    for k in range(n-500):
-        a = randint(0, 50)
-        b = randint(0, 50)
-        c = randint(0, 50)
-        i = randint(0, image.shape[0]-1)
-        j = randint(0, image.shape[1]-1)
-        output[i][j][0] = 255-a
-        output[i][j][1] = 255-b
-        output[i][j][2] = 255-c
-    for k in range(n):
-        a = randint(0, 50)
-        b = randint(0, 50)
-        c = randint(0, 50)
-        i = randint(0, image.shape[0]-1)
-        j = randint(0, image.shape[1]-1)
-        output[i][j][0] = a
-        output[i][j][1] = b
-        output[i][j][2] = c
-    return output
\ No newline at end of file
+    rng = _generator(rng)
+    height, width = shape
+    sigma = fwhm / (2 * np.sqrt(2 * np.log(2)))
+    radius = max(int(np.ceil(4 * sigma)), 1)
+
+    x = rng.uniform(0, width - 1, stars)
+    y = rng.uniform(0, height - 1, stars)
+    fluxes = np.exp(rng.uniform(np.log(flux[0]), np.log(flux[1]), stars))
+    truth = np.column_stack((x, y, fluxes))
+
+    # All of the stamps are rendered at once , then added to the frame
+    offsets = np.arange(-radius, radius + 1)
+    px = np.rint(x)[:, None, None].astype(np.int64) + offsets[None, None, :]
+    py = np.rint(y)[:, None, None].astype(np.int64) + offsets[None, :, None]
+    psf = np.exp(-((px - x[:, None, None]) ** 2 + (py - y[:, None, None]) ** 2) / (2 * sigma ** 2))
+    psf *= (fluxes / psf.sum(axis=(1, 2)))[:, None, None]
+    px, py = np.broadcast_arrays(px, py)
+    inside = (px >= 0) & (px < width) & (py >= 0) & (py < height)
+    signal = np.full(shape, float(sky))
+    np.add.at(signal, (py[inside], px[inside]), psf[inside])
+
+    # Photon noise of the sky and the stars , then the read noise
+    frame = rng.poisson(signal).astype(float)
+    frame += rng.normal(0.0, read_noise, shape)
+    if np.issubdtype(np.dtype(dtype), np.integer):
+        info = np.iinfo(dtype)
+        frame = np.clip(np.rint(frame), info.min, info.max)
+    return frame.astype(dtype), truth
@@ -0,0 +1,429 @@
+# coding=utf-8
+
+"""
+
+Copyright(c) 2022-2023 Max Qian  <lightapt.com>
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Library General Public
+License version 3 as published by the Free Software Foundation.
+This library is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Library General Public License for more details.
+You should have received a copy of the GNU Library General Public License
+along with this library; see the file COPYING.LIB.  If not, write to
+the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+Boston, MA 02110-1301, USA.
+
+"""
+
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+
+import cv2
+import numpy
+from skimage.transform import SimilarityTransform
+
+from . import align
+from ..logging import logger
+
+
+# Ways to register a frame , "phase" falls back to "stars" when the correlation is weak
+METHODS = ("stars", "phase")
+
+
+def _peak(correlation):
+    """
+        Position of the peak of a phase correlation surface , refined to a fraction of pixel by a Gaussian
+        through the peak and its two neighbours on each axis , the spectrum is weighted by a Gaussian so
+        the peak of a shift is a sampled Gaussian
+        Returns : tuple # (x , y , height of the peak) , the position is signed
+    """
+    height, width = correlation.shape
+    iy, ix = numpy.unravel_index(numpy.argmax(correlation), correlation.shape)
+    peak = correlation[iy, ix]
+
+    def refine(before, after):
+        # Vertex of the parabola through the logarithms , neighbours at or below zero are floored
+        before, peak_log, after = numpy.log(numpy.maximum([before, peak, after], peak * 1e-6))
+        curvature = 2 * peak_log - before - after
+        return 0.5 * (after - before) / curvature if curvature > 0 else 0.0
+
+    y = iy + refine(correlation[iy - 1, ix], correlation[(iy + 1) % height, ix])
+    x = ix + refine(correlation[iy, ix - 1], correlation[iy, (ix + 1) % width])
+    return (x - width if x > width / 2 else x), (y - height if y > height / 2 else y), float(peak)
+
+
+class PhaseCorrelator(object):
+    """
+        Translation of frames against a fixed reference by FFT phase correlation.
+        A coarse shift is found on the downsampled frames , it is refined at full resolution on a grid
+        of tiles. The tiles have to agree , a rotation makes them disagree and a poor frame makes the
+        correlation peaks weak.
+        The normalized cross-power spectrum of the tiles is weighted by a Gaussian : the high frequencies ,
+        mostly noise and where an interpolated frame doesn't move like its stars , would pull the peak
+        towards whole pixels.
+    """
+
+    def __init__(self, reference, mask=None, factor=4, grid=3, size=256, min_response=0.2, min_peak=0.1,
+                 tolerance=0.5, bandwidth=0.08):
+        """
+            Args :
+                reference : numpy.ndarray
+                mask : numpy.ndarray # optional , only its bounding box is correlated
+                factor : int # downsampling of the coarse pass
+                grid : int # grid x grid tiles are correlated at full resolution
+                size : int # largest side of the tiles
+                min_response : float # weakest response of the coarse pass , 1 is a perfect match
+                min_peak : float # weakest peak of a tile , 1 is a perfect match
+                tolerance : float # largest disagreement between the tiles , in pixels
+                bandwidth : float # standard deviation of the Gaussian weighting the spectrum , in cycles per pixel
+        """
+        self.factor = factor
+        self.min_response = min_response
+        self.min_peak = min_peak
+        self.tolerance = tolerance
+
+        gray = self._gray(reference)
+        if mask is None:
+            y0, y1, x0, x1 = 0, gray.shape[0], 0, gray.shape[1]
+        else:
+            ys, xs = numpy.nonzero(mask)
+            y0, y1, x0, x1 = ys.min(), ys.max() + 1, xs.min(), xs.max() + 1
+        self.region = (y0, y1, x0, x1)
+
+        # cv2.phaseCorrelate multiplies its inputs by the window in place , so the window is applied
+        # here , once for the reference and to a copy of the frames
+        small = self._downsample(gray)
+        self.window = cv2.createHanningWindow(small.shape[::-1], cv2.CV_32F)
+        self.small = small * self.window
+
+        # Tiles centered on the cells of the grid , their spectra are computed once
+        grid = max(1, min(grid, (y1 - y0) // 64, (x1 - x0) // 64))
+        size_y = min(size, (y1 - y0) // grid)
+        size_x = min(size, (x1 - x0) // grid)
+        self.origins = [
+            (y0 + (2 * i + 1) * (y1 - y0) // (2 * grid) - size_y // 2,
+             x0 + (2 * j + 1) * (x1 - x0) // (2 * grid) - size_x // 2)
+            for i in range(grid) for j in range(grid)
+        ]
+        self.tile_shape = (size_y, size_x)
+        self.tile_window = cv2.createHanningWindow((size_x, size_y), cv2.CV_32F)
+        self.spectra = [
+            numpy.conj(numpy.fft.rfft2(gray[top:top + size_y, left:left + size_x] * self.tile_window))
+            for top, left in self.origins
+        ]
+        frequencies = numpy.fft.fftfreq(size_y)[:, None] ** 2 + numpy.fft.rfftfreq(size_x) ** 2
+        self.weights = numpy.exp(frequencies / (-2 * bandwidth * bandwidth))
+        # The peak of a perfect match stays 1
+        self.weights /= numpy.fft.irfft2(self.weights, self.tile_shape)[0, 0]
+        # A tile can be left out , the others are enough to see a rotation
+        self.min_tiles = min(3, len(self.origins))
+
+    @staticmethod
+    def _gray(image):
+        image = numpy.asarray(image, dtype=numpy.float32)
+        return image.mean(axis=2, dtype=numpy.float32) if image.ndim == 3 else image
+
+    def _downsample(self, gray):
+        y0, y1, x0, x1 = self.region
+        return cv2.resize(
+            gray[y0:y1, x0:x1], None, fx=1 / self.factor, fy=1 / self.factor, interpolation=cv2.INTER_AREA
+        )
+
+    def shift(self, frame):
+        """
+            Translation of a frame against the reference
+            Args :
+                frame : numpy.ndarray # shape of the reference
+            Returns : tuple # (dx , dy , response) , dx and dy are None if the correlation is weak
+        """
+        gray = self._gray(frame)
+        (dx, dy), response = cv2.phaseCorrelate(self.small, self._downsample(gray) * self.window)
+        if response < self.min_response:
+            return None, None, response
+        dx, dy = int(round(dx * self.factor)), int(round(dy * self.factor))
+
+        # The tiles of the frame are moved by the whole pixels of the coarse shift
+        size_y, size_x = self.tile_shape
+        shifts = []
+        weights = []
+        for spectrum, (top, left) in zip(self.spectra, self.origins):
+            top, left = top + dy, left + dx
+            if top < 0 or left < 0 or top + size_y > gray.shape[0] or left + size_x > gray.shape[1]:
+                continue
+            cross = spectrum * numpy.fft.rfft2(gray[top:top + size_y, left:left + size_x] * self.tile_window)
+            x, y, peak = _peak(numpy.fft.irfft2(cross / (numpy.abs(cross) + 1e-12) * self.weights, self.tile_shape))
+            # A tile with few stars has a weak peak
+            if peak >= self.min_peak:
+                shifts.append((x, y))
+                weights.append(peak)
+        if len(shifts) < self.min_tiles:
+            return None, None, response
+        shifts = numpy.array(shifts)
+        center = numpy.average(shifts, axis=0, weights=weights)
+        if numpy.hypot(*(shifts - center).T).max() > self.tolerance:
+            return None, None, response
+        return dx + center[0], dy + center[1], response
+
+
+def _translate(frame, dx, dy):
+    """
+        Move a frame back by (dx , dy) like align.apply_transform , warpAffine is much faster for a translation
+        Returns : tuple # (aligned , footprint)
+    """
+    data = numpy.asarray(frame, dtype=numpy.float32)
+    height, width = data.shape[:2]
+    matrix = numpy.float32([[1, 0, -dx], [0, 1, -dy]])
+    aligned = cv2.warpAffine(
+        data, matrix, (width, height), flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_CONSTANT,
+        borderValue=(float(numpy.nanmedian(data)),) * 4
+    )
+    # Cubic interpolation overshoots around the stars
+    numpy.clip(aligned, data.min(), data.max(), out=aligned)
+    footprint = cv2.warpAffine(
+        numpy.zeros((height, width), numpy.float32), matrix, (width, height), flags=cv2.INTER_LINEAR,
+        borderMode=cv2.BORDER_CONSTANT, borderValue=1.0
+    ) > 0.4
+    return aligned, footprint
+
+
+class RegistrationResult(object):
+    """
+        Registration of a frame against the reference
+    """
+
+    def __init__(self, index, data, footprint, transform, matches, error=None, report=None, method="stars",
+                 response=None):
+        self.index = index  # position of the frame in the input
+        self.data = data  # registered frame , None if it failed
+        self.footprint = footprint  # True where the frame has no pixel information
+        self.transform = transform  # 3x3 matrix from the frame to the reference
+        self.matches = matches  # number of matched control points
+        self.error = error  # reason of the failure
+        self.report = report  # align.RansacReport of the star matching , if it ran
+        self.method = method  # "phase" if the phase correlation was used , else "stars"
+        self.response = response  # peak of the phase correlation , if it ran
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+# State of a worker process , set once by _init_worker
+_worker = {}
+
+
+def _attach(name, shape, dtype):
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, numpy.ndarray(shape, dtype=dtype, buffer=shm.buf)
+
+
+def _init_worker(reference, correlator, mask, options):
+    # The reference model is sent once per worker , not once per frame
+    _worker["reference"] = reference
+    _worker["correlator"] = correlator
+    _worker["mask"] = mask
+    _worker["options"] = options
+    _worker["blocks"] = {}
+
+
+def _blocks(descriptors):
+    """
+        Arrays of the shared blocks of a register call , the blocks of the former calls are released
+    """
+    attached = _worker["blocks"]
+    if set(attached) != {name for name, _, _ in descriptors}:
+        for shm, _ in attached.values():
+            shm.close()
+        attached.clear()
+        for name, shape, dtype in descriptors:
+            attached[name] = _attach(name, shape, dtype)
+    return [attached[name][1] for name, _, _ in descriptors]
+
+
+def _register_frame(slot, descriptors):
+    """
+        Register the frame of a slot of the shared window , the results are written to the same slot
+    """
+    frames, output, footprints = _blocks(descriptors)
+    frame = frames[slot]
+    mask = _worker["mask"]
+    max_control_points, detection_sigma, min_area = _worker["options"]
+
+    response = None
+    correlator = _worker["correlator"]
+    if correlator is not None:
+        dx, dy, response = correlator.shift(frame)
+        if dx is not None:
+            # The frame moved by (dx , dy) from the reference
+            transform = SimilarityTransform(translation=(-dx, -dy))
+            aligned, footprint = _translate(frame, dx, dy)
+            output[slot] = aligned
+            footprints[slot] = footprint
+            return transform.params, 0, None, None, "phase", response
+
+    masked = frame if mask is None else cv2.bitwise_and(frame, frame, mask=mask)
+    try:
+        controlp = align._find_sources(
+            align._bw(masked),
+            detection_sigma=detection_sigma,
+            min_area=min_area,
+        )[:max_control_points]
+        if len(controlp) < 3:
+            raise ValueError(
+                "Reference stars in source image are less than the minimum value (3)."
+            )
+        transform, (__, matched) = align.find_transform(
+            controlp,
+            _worker["reference"],
+            max_control_points=max_control_points,
+        )
+    except align.MaxIterError as e:
+        return None, 0, str(e), e.report, "stars", response
+    except ValueError as e:
+        return None, 0, str(e), None, "stars", response
+
+    aligned, footprint = align.apply_transform(transform, frame, frame)
+    output[slot] = aligned
+    footprints[slot] = footprint
+    return transform.params, len(matched), None, transform.report, "stars", response
+
+
+class RegistrationEngine(object):
+    """
+        Register frames against a fixed reference with a pool of processes.
+        The control points and the invariants of the reference are computed once and kept by the
+        processes of the engine , the frames and the registered images go through a window of shared
+        memory so that only slot numbers cross the pool. close() stops the processes.
+        With the "phase" method a frame which is only translated is registered by phase correlation ,
+        the stars are matched for the others.
+    """
+
+    def __init__(self, reference, mask=None, max_control_points=50, detection_sigma=5, min_area=5, workers=None,
+                 method="stars"):
+        """
+            Args :
+                reference : numpy.ndarray # frame the others are aligned to
+                mask : numpy.ndarray # optional uint8 mask , the stars are only detected where it is not 0
+                max_control_points : int
+                detection_sigma : int
+                min_area : int
+                workers : int # number of processes , default is the number of cores
+                method : str # one of METHODS
+        """
+        if method not in METHODS:
+            raise ValueError("Unknown registration method : %s" % method)
+        self.reference = numpy.asarray(reference)
+        self.mask = mask
+        self.options = (max_control_points, detection_sigma, min_area)
+        self.workers = workers or os.cpu_count() or 1
+
+        masked = self.reference if mask is None else cv2.bitwise_and(self.reference, self.reference, mask=mask)
+        self.model = align.ReferenceModel(
+            masked,
+            max_control_points=max_control_points,
+            detection_sigma=detection_sigma,
+            min_area=min_area,
+        )
+        self.correlator = PhaseCorrelator(self.reference, mask) if method == "phase" else None
+        self._executor = None
+
+    def register(self, frames):
+        """
+            Register frames against the reference
+            Args :
+                frames : list # numpy arrays with the shape and type of the reference
+            Returns : list # RegistrationResult in the order of the input
+        """
+        return list(self.iter_register(frames))
+
+    def iter_register(self, frames):
+        """
+            Register frames against the reference , one at a time in the order of the input.
+            Only a window of two frames per worker is in shared memory , so a stack can be registered
+            and accumulated with the memory of a few frames.
+            Args :
+                frames : iterable # numpy arrays with the shape and type of the reference
+            Yields : RegistrationResult
+        """
+        shape = self.reference.shape
+        window = 2 * self.workers
+        blocks = []
+        pending = deque()
+        try:
+            _, shared_frames = self._allocate(blocks, (window,) + shape, self.reference.dtype)
+            _, output = self._allocate(blocks, (window,) + shape, numpy.float32)
+            _, footprints = self._allocate(blocks, (window,) + shape[:2], numpy.bool_)
+            descriptors = [(shm.name, array.shape, array.dtype) for shm, array in zip(
+                blocks, (shared_frames, output, footprints)
+            )]
+            pool = self._pool()
+            for index, frame in enumerate(frames):
+                if len(pending) == window:
+                    yield self._collect(pending.popleft(), output, footprints)
+                # The slot of the frame collected above
+                slot = index % window
+                shared_frames[slot] = frame
+                pending.append((index, slot, pool.submit(_register_frame, slot, descriptors)))
+            while pending:
+                yield self._collect(pending.popleft(), output, footprints)
+        finally:
+            # The frames still in the window are dropped if the caller stops early
+            for _, _, future in pending:
+                future.cancel()
+            wait([future for _, _, future in pending])
+            for shm in blocks:
+                shm.close()
+                shm.unlink()
+
+    @staticmethod
+    def _collect(task, output, footprints):
+        """
+            Wait for a frame of the window , its registered image is copied out of the slot
+        """
+        index, slot, future = task
+        params, matches, error, report, method, response = future.result()
+        if error is not None:
+            return RegistrationResult(index, None, None, None, 0, error, report, method=method, response=response)
+        return RegistrationResult(
+            index, output[slot].copy(), footprints[slot].copy(), params, matches, report=report,
+            method=method, response=response
+        )
+
+    def _pool(self):
+        """
+            Processes of the engine , they are started once and keep the reference model
+        """
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(self.model, self.correlator, self.mask, self.options),
+            )
+        return self._executor
+
+    def close(self):
+        """
+            Stop the processes of the engine
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @staticmethod
+    def _allocate(blocks, shape, dtype):
+        size = max(int(numpy.prod(shape)) * numpy.dtype(dtype).itemsize, 1)
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        blocks.append(shm)
+        return shm, numpy.ndarray(shape, dtype=dtype, buffer=shm.buf)
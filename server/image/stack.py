@@ -18,12 +18,171 @@ Boston, MA 02110-1301, USA.
 
 """
 
+import abc
 import time
 import numpy
 import cv2
-import astroalign
 
 from ..logging import logger
+from . import align
+from .registration import METHODS, RegistrationEngine
+
+
+class StackAccumulator(abc.ABC):
+    """
+        Combine frames fed one at a time , the memory used doesn't depend on the number of frames
+    """
+
+    def __init__(self):
+        self.count = 0
+
+    @abc.abstractmethod
+    def add(self, frame):
+        pass
+
+    @abc.abstractmethod
+    def result(self, numpy_type):
+        # raises ValueError if no frame was added
+        pass
+
+    def extend(self, frames):
+        for frame in frames:
+            self.add(frame)
+        return self
+
+
+class MeanAccumulator(StackAccumulator):
+    """
+        Average of the frames , from a float32 running sum
+        NOTE : the sum is exact for up to 256 frames of 16 bits
+    """
+
+    def __init__(self):
+        super(MeanAccumulator, self).__init__()
+        self._sum = None
+
+    def add(self, frame):
+        if self._sum is None:
+            self._sum = numpy.zeros(frame.shape, dtype=numpy.float32)
+        numpy.add(self._sum, frame, out=self._sum, casting='unsafe')
+        self.count += 1
+
+    def result(self, numpy_type):
+        if self._sum is None:
+            raise ValueError('empty stack')
+        mean_image = self._sum / numpy.float32(self.count)
+        return numpy.floor(mean_image).astype(numpy_type)  # no floats
+
+
+class MaxAccumulator(StackAccumulator):
+    """
+        Pixel-wise maximum of the frames
+    """
+
+    def __init__(self):
+        super(MaxAccumulator, self).__init__()
+        self._image = None
+
+    def add(self, frame):
+        if self._image is None:
+            self._image = numpy.array(frame, copy=True)  # start with first image
+        else:
+            numpy.maximum(self._image, frame, out=self._image)
+        self.count += 1
+
+    def result(self, numpy_type):
+        if self._image is None:
+            raise ValueError('empty stack')
+        return self._image
+
+
+class MinAccumulator(MaxAccumulator):
+    """
+        Pixel-wise minimum of the frames
+    """
+
+    def add(self, frame):
+        if self._image is None:
+            self._image = numpy.array(frame, copy=True)  # start with first image
+        else:
+            numpy.minimum(self._image, frame, out=self._image)
+        self.count += 1
+
+
+class SigmaClipAccumulator(StackAccumulator):
+    """
+        Average of the frames with the outliers of every pixel rejected , such as satellites and planes.
+        Mean and variance of all of the values are updated with Welford's algorithm , once a few frames
+        have been seen a value further than sigma standard deviations from the running mean is left out
+        of the average.
+        The first `warmup` frames are kept , they are clipped by result() against the mean and variance
+        of all of the other frames : an outlier can't be far from statistics which include it.
+    """
+
+    def __init__(self, sigma=3.0, warmup=5):
+        super(SigmaClipAccumulator, self).__init__()
+        self.sigma = float(sigma)
+        self.warmup = int(warmup)
+        self._mean = None
+        self._m2 = None
+        self._sum = None
+        self._n = None
+        self._warmup_frames = []
+
+    def add(self, frame):
+        frame = numpy.asarray(frame, dtype=numpy.float32)
+        if self._mean is None:
+            self._mean = numpy.zeros(frame.shape, dtype=numpy.float32)
+            self._m2 = numpy.zeros(frame.shape, dtype=numpy.float32)
+            self._sum = numpy.zeros(frame.shape, dtype=numpy.float32)
+            self._n = numpy.zeros(frame.shape, dtype=numpy.float32)
+
+        delta = frame - self._mean
+        if self.count < self.warmup:
+            self._warmup_frames.append(numpy.array(frame, copy=True))
+        else:
+            accept = delta * delta <= (self.sigma * self.sigma) * self.variance
+            self._sum += numpy.where(accept, frame, 0)
+            self._n += accept
+
+        # Welford's update , M2 += (x - old_mean) * (x - new_mean)
+        self.count += 1
+        self._mean += delta / self.count
+        delta *= frame - self._mean
+        self._m2 += delta
+
+    def _clip_warmup(self):
+        # Second pass on the warm-up frames , each one against the statistics of all of the others
+        # without x : mean - (x - mean) / (n - 1) , M2 - (x - mean)^2 * n / (n - 1)
+        n = self.count
+        for frame in self._warmup_frames:
+            if n < 3:
+                accept = True
+            else:
+                delta = frame - self._mean
+                delta *= delta
+                others_variance = numpy.maximum(self._m2 - delta * (n / (n - 1.0)), 0) / (n - 2)
+                # (x - others mean)^2 = (x - mean)^2 * (n / (n - 1))^2
+                accept = delta * (n / (n - 1.0)) ** 2 <= (self.sigma * self.sigma) * others_variance
+            self._sum += numpy.where(accept, frame, 0)
+            self._n += accept
+        self._warmup_frames = []
+
+    @property
+    def variance(self):
+        return self._m2 / max(self.count - 1, 1)
+
+    @property
+    def rejected(self):
+        # number of values left out for each pixel , the warm-up frames are only counted by result()
+        return self.count - self._n - len(self._warmup_frames)
+
+    def result(self, numpy_type):
+        if self._sum is None:
+            raise ValueError('empty stack')
+        self._clip_warmup()
+        mean_image = self._sum / numpy.maximum(self._n, 1)
+        return numpy.floor(mean_image).astype(numpy_type)  # no floats
 
 
 class IndiAllskyStacker(object):
@@ -35,6 +194,7 @@ class IndiAllskyStacker(object):
         self._detection_sigma = 5
         self._max_control_points = 50
         self._min_area = 10
+        self._registration_method = 'stars'
 
     @property
     def detection_sigma(self):
@@ -63,34 +223,56 @@ class IndiAllskyStacker(object):
         self._min_area = int(new_min_area)
 
 
+    @property
+    def registration_method(self):
+        # "phase" tries phase correlation first for frames which are only translated
+        return self._registration_method
+
+    @registration_method.setter
+    def registration_method(self, new_registration_method):
+        if new_registration_method not in METHODS:
+            raise ValueError('Unknown registration method: {0:s}'.format(str(new_registration_method)))
+        self._registration_method = new_registration_method
+
+
     @property
     def MIN_MATCHES_FRACTION(self):
         # default 0.8
-        return astroalign.MIN_MATCHES_FRACTION
+        return align.MIN_MATCHES_FRACTION
 
     @MIN_MATCHES_FRACTION.setter
     def MIN_MATCHES_FRACTION(self, new_MIN_MATCHES_FRACTION):
-        astroalign.MIN_MATCHES_FRACTION = float(new_MIN_MATCHES_FRACTION)
+        align.MIN_MATCHES_FRACTION = float(new_MIN_MATCHES_FRACTION)
 
 
     @property
     def NUM_NEAREST_NEIGHBORS(self):
         # default 5
-        return astroalign.NUM_NEAREST_NEIGHBORS
+        return align.NUM_NEAREST_NEIGHBORS
 
     @NUM_NEAREST_NEIGHBORS.setter
     def NUM_NEAREST_NEIGHBORS(self, new_NUM_NEAREST_NEIGHBORS):
-        astroalign.NUM_NEAREST_NEIGHBORS = int(new_NUM_NEAREST_NEIGHBORS)
+        align.NUM_NEAREST_NEIGHBORS = int(new_NUM_NEAREST_NEIGHBORS)
 
 
     @property
     def PIXEL_TOL(self):
         # default 2
-        return astroalign.PIXEL_TOL
+        return align.PIXEL_TOL
 
     @PIXEL_TOL.setter
     def PIXEL_TOL(self, new_PIXEL_TOL):
-        astroalign.PIXEL_TOL = int(new_PIXEL_TOL)
+        align.PIXEL_TOL = int(new_PIXEL_TOL)
+
+
+    @property
+    def RANSAC_BATCH(self):
+        # default True
+        return align.RANSAC_BATCH
+
+    @RANSAC_BATCH.setter
+    def RANSAC_BATCH(self, new_RANSAC_BATCH):
+        align.RANSAC_BATCH = bool(new_RANSAC_BATCH)
 
 
 
@@ -100,30 +282,27 @@ class IndiAllskyStacker(object):
 
 
     def average(self, stack_data_list, numpy_type):
-        mean_image = numpy.mean(stack_data_list, axis=0)
-        return numpy.floor(mean_image).astype(numpy_type)  # no floats
+        return MeanAccumulator().extend(stack_data_list).result(numpy_type)
 
 
     def maximum(self, stack_data_list, numpy_type):
-        image_max = stack_data_list[0]  # start with first image
-
-        # compare with remaining images
-        for i in stack_data_list[1:]:
-            image_max = numpy.maximum(image_max, i)
-
-        return image_max
+        return MaxAccumulator().extend(stack_data_list).result(numpy_type)
 
     def minimum(self, stack_data_list, numpy_type):
-        image_min = stack_data_list[0]  # start with first image
+        return MinAccumulator().extend(stack_data_list).result(numpy_type)
 
-        # compare with remaining images
-        for i in stack_data_list[1:]:
-            image_min = numpy.minimum(image_min, i)
 
-        return image_min
+    def sigma_clip(self, stack_data_list, numpy_type, sigma=3.0):
+        # the first 5 frames are kept in memory to be clipped against the whole stack at the end
+        return SigmaClipAccumulator(sigma=sigma).extend(stack_data_list).result(numpy_type)
 
 
     def register(self, stack_i_ref_list):
+        return list(self.iter_register(stack_i_ref_list))
+
+
+    def iter_register(self, stack_i_ref_list):
+        # Registered frames one at a time , the accumulators take them without keeping the stack
         # first image is the reference
         reference_i_ref = stack_i_ref_list[0]
 
@@ -133,67 +312,68 @@ class IndiAllskyStacker(object):
             self._generateSqmMask(reference_i_ref['hdulist'][0].data)
 
 
-        reg_data_list = [reference_i_ref['hdulist'][0].data]  # add target to final list
-
-        #reference_masked = self._crop(reference_i_ref['hdulist'][0].data)
-        reference_masked = cv2.bitwise_and(reference_i_ref['hdulist'][0].data, reference_i_ref['hdulist'][0].data, mask=self._sqm_mask)
+        yield reference_i_ref['hdulist'][0].data  # add target to final list
 
         reg_start = time.time()
 
-        for i_ref in stack_i_ref_list[1:]:
-            #i_masked = self._crop(i_ref['hdulist'][0].data)
-            i_masked = cv2.bitwise_and(i_ref['hdulist'][0].data, i_ref['hdulist'][0].data, mask=self._sqm_mask)
-
-            # detection_sigma default = 5
-            # max_control_points default = 50
-            # min_area default = 5
-
-            try:
-                ### Find transform using a crop of the image
-                transform, (source_list, target_list) = astroalign.find_transform(
-                    i_masked,
-                    reference_masked,
-                    detection_sigma=self.detection_sigma,
-                    max_control_points=self.max_control_points,
-                    min_area=self.min_area,
-                )
+        try:
+            # The stars of the reference are only detected once for the whole stack
+            engine = RegistrationEngine(
+                reference_i_ref['hdulist'][0].data,
+                mask=self._sqm_mask,
+                max_control_points=self.max_control_points,
+                detection_sigma=self.detection_sigma,
+                min_area=self.min_area,
+                method=self.registration_method,
+            )
+        except ValueError as e:
+            logger.error('Image registration failure: %s', str(e))
+            return
+
+        paths = {'phase': 0, 'stars': 0}
+        with engine:
+            for result in engine.iter_register(i_ref['hdulist'][0].data for i_ref in stack_i_ref_list[1:]):
+                if result.report:
+                    logger.info(
+                        'Star matching: %d of %d candidates tried, %d inliers (%d required) in %0.4f s',
+                        result.report.iterations,
+                        result.report.candidates,
+                        result.report.inliers,
+                        result.report.min_matches,
+                        result.report.elapsed,
+                    )
+
+                if not result.ok:
+                    logger.error('Image registration failure: %s', result.error)
+                    continue
+
+                paths[result.method] += 1
+                if result.method == 'phase':
+                    logger.info(
+                        'Registration phase correlation: Translation: (%0.6f, %0.6f), Response: %0.4f',
+                        result.transform[0, 2], result.transform[1, 2], result.response,
+                    )
+                    yield result.data
+                    continue
+
+                if result.response is not None:
+                    logger.info('Weak phase correlation (%0.4f), matching stars', result.response)
 
                 logger.info(
                     'Registration Matches: %d, Rotation: %0.6f, Translation: (%0.6f, %0.6f), Scale: %0.6f',
-                    len(target_list),
-                    transform.rotation,
-                    transform.translation[0], transform.translation[1],
-                    transform.scale,
+                    result.matches,
+                    numpy.arctan2(result.transform[1, 0], result.transform[0, 0]),
+                    result.transform[0, 2], result.transform[1, 2],
+                    numpy.hypot(result.transform[0, 0], result.transform[1, 0]),
                 )
 
-                reg_data, footprint = astroalign.apply_transform(
-                    transform,
-                    i_ref['hdulist'][0],
-                    reference_i_ref['hdulist'][0],
-                )
-
-                ### Register full image
-                #reg_data, footprint = astroalign.register(
-                #    i_ref['hdulist'][0],
-                #    reference_i_ref['hdulist'][0],
-                #    detection_sigma=self.detection_simga,
-                #    max_control_points=self.max_control_points,
-                #    min_area=self.min_area,
-                #)
-            except astroalign.MaxIterError as e:
-                logger.error('Image registration failure: %s', str(e))
-                continue
-            except ValueError as e:
-                logger.error('Image registration failure: %s', str(e))
-                continue
-
-            reg_data_list.append(reg_data)
+                yield result.data
 
 
         reg_elapsed_s = time.time() - reg_start
         logger.info('Registered %d+1 images in %0.4f s', len(stack_i_ref_list) - 1, reg_elapsed_s)  # reference image is not aligned
-
-        return reg_data_list
+        if self.registration_method == 'phase':
+            logger.info('Registration paths: %d phase correlation, %d star matching', paths['phase'], paths['stars'])
 
 
     def _crop(self, image):
@@ -60,12 +60,16 @@ class CalcStars(object):
         )
         self.star_template_w, self.star_template_h = self.star_template.shape[::-1]
 
-    def detect_stars(self, original_data : cv2.Mat) -> list:
+    def detect_stars(self, original_data : cv2.Mat, mode : str = "template", draw : bool = True) -> list:
         """
             Detect stars on the given image
             Args:
                 original_data : cv2.Mat
-            Returns: list
+                mode : str # "template" keeps the first hit of each group of close hits ,
+                    "components" labels the connected regions above the threshold in linear time
+                    and returns their sub-pixel centroids
+                draw : bool # draw circles around the stars on the image
+            Returns: list # (x, y) of the template match , the star is at the center of the template
         """
         if isinstance(self.mask, type(None)):
             # This only needs to be done once if a mask is not provided
@@ -77,23 +81,56 @@ class CalcStars(object):
         else:
             # assume color
             grey_img = cv2.cvtColor(masked_img, cv2.COLOR_BGR2GRAY)
+        template = self.star_template
+        if grey_img.dtype != numpy.uint8:
+            # matchTemplate only takes 8 bits or float images
+            grey_img = grey_img.astype(numpy.float32)
+            template = template.astype(numpy.float32)
         sep_start = time.time()
-        result = cv2.matchTemplate(grey_img, self.star_template, cv2.TM_CCOEFF_NORMED)
-        result_filter = numpy.where(result >= self._detection_threshold)
-        blobs = list()
-        for pt in zip(*result_filter[::-1]):
-            for blob in blobs:
-                if (abs(pt[0] - blob[0]) < self._distanceThreshold) and (abs(pt[1] - blob[1]) < self._distanceThreshold):
-                    break
-            else:
-                # if none of the points are under the distance threshold, then add it
-                blobs.append(pt)
+        result = cv2.matchTemplate(grey_img, template, cv2.TM_CCOEFF_NORMED)
+        if mode == "components":
+            blobs = self._component_centroids(result)
+        elif mode == "template":
+            result_filter = numpy.where(result >= self._detection_threshold)
+            blobs = list()
+            for pt in zip(*result_filter[::-1]):
+                for blob in blobs:
+                    if (abs(pt[0] - blob[0]) < self._distanceThreshold) and (abs(pt[1] - blob[1]) < self._distanceThreshold):
+                        break
+                else:
+                    # if none of the points are under the distance threshold, then add it
+                    blobs.append(pt)
+        else:
+            raise ValueError("Unknown detection mode %s" % mode)
         sep_elapsed_s = time.time() - sep_start
         #logger.info('Star detection in %0.4f s', sep_elapsed_s)
         #logger.info('Found %d objects', len(blobs))
-        self.draw_circles(original_data, blobs)
+        if draw:
+            self.draw_circles(original_data, blobs)
         return blobs
 
+    def _component_centroids(self, result : numpy.ndarray) -> list:
+        """
+            Centroids of the connected regions of the match result above the threshold ,
+            weighted by the match score
+            Args :
+                result : numpy.ndarray # output of matchTemplate
+            Returns : list # (x, y) floats
+        """
+        mask = (result >= self._detection_threshold).astype(numpy.uint8)
+        count, labels = cv2.connectedComponents(mask, connectivity=8)
+        if count <= 1:
+            return []
+        # Only the pixels above the threshold are visited
+        index = numpy.flatnonzero(mask)
+        label = labels.ravel()[index]
+        weight = result.ravel()[index].astype(numpy.float64)
+        width = result.shape[1]
+        total = numpy.bincount(label, weights=weight, minlength=count)[1:]
+        x = numpy.bincount(label, weights=weight * (index % width), minlength=count)[1:] / total
+        y = numpy.bincount(label, weights=weight * (index // width), minlength=count)[1:] / total
+        return list(zip(x.tolist(), y.tolist()))
+
     def generate_mask(self, img : cv2.Mat) -> None:
         """
             Generate a mask
@@ -155,40 +192,157 @@ class CalcStars(object):
         """
             Calculate the HFD of an image | 计算图像HFD
             Args:
-                image : np.ndarray # image to calculate
+                image : np.ndarray # image to calculate , a star at the center
                 outer_diameter : int # outer diameter of the circle
             Returns:
                 float: HFD of the image
         """
         if outer_diameter is None:
             outer_diameter = 60
-        output = image
-        # Calculate the mean of the image
-        # Meanfilter ?
-        mean = numpy.mean(image)
-        for x in range(image.shape[0]):
-            for y in range(image.shape[1]):
-                if image[x][y].any() < mean: 
-                    output[x][y] = 0
-                else:
-                    output[x][y] -= mean
-        
-        out_radius = outer_diameter / 2
+        gray = _gray(image)
+        # The mean of the image is the background , the pixels below it are ignored
+        output = gray - numpy.mean(gray)
+        output[output < 0] = 0
 
+        out_radius = outer_diameter / 2
         center_x = int(output.shape[0] / 2)
         center_y = int(output.shape[1] / 2)
+        x, y = numpy.ogrid[:output.shape[0], :output.shape[1]]
+        dist = numpy.sqrt((x - center_x) ** 2 + (y - center_y) ** 2)
+        inside = dist <= out_radius
 
-        _sum,sum_dist = 0,0
-
-        for x in range(image.shape[0]):
-            for y in range(image.shape[1]):
-                if pow(x - center_x,2) + pow(y - center_y,2) <= pow(out_radius,2):
-                    _sum += output[x][y].any()
-                    sum_dist = output[x][y] * sqrt(pow(x - center_x,2) + pow(y - center_y,2))
+        _sum = output[inside].sum()
+        sum_dist = (output[inside] * dist[inside]).sum()
         if _sum != 0:
             return 2 * sum_dist / _sum
         return sqrt(2) * out_radius
 
+def _gray(image : numpy.ndarray) -> numpy.ndarray:
+    """
+        Convert an image to a float gray image
+    """
+    if image.ndim == 3:
+        if image.shape[2] == 1:
+            image = image[..., 0]
+        else:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY if image.shape[2] == 3 else cv2.COLOR_BGRA2GRAY)
+    return image.astype(numpy.float32)
+
+# Width of the ring around the aperture where the background is measured , in pixels
+BACKGROUND_RING = 4
+
+# FWHM of a Gaussian in units of its sigma
+GAUSSIAN_FWHM = 2 * sqrt(2 * numpy.log(2))
+
+# Passes of the adaptive moments , the window converges in a few of them
+ADAPTIVE_ITERATIONS = 8
+
+def star_metrics(image : numpy.ndarray, centroids : numpy.ndarray, outer_diameter : float = 16) -> dict:
+    """
+        Measure many stars at once | 批量计算星点参数
+        The stamps of all of the stars are cut in one indexing operation , the background is the median
+        of a ring around the aperture and every metric is a weighted sum over the stamps.
+        Args:
+            image : np.ndarray # gray or color image
+            centroids : np.ndarray # (N, 2) x and y of the stars
+            outer_diameter : float # diameter of the aperture in pixels , about three times the FWHM
+        Returns:
+            dict # one array of N values per key :
+                x , y : centroid refined with the first moments
+                flux : background-subtracted flux inside the aperture
+                background : background level per pixel
+                hfd : half flux diameter
+                fwhm : FWHM of the Gaussian with the same adaptive second moments
+                eccentricity : from the adaptive second moments , 0 for a round star
+                NaN where a star has no positive flux or its moments don't converge
+    """
+    centroids = numpy.asarray(centroids, dtype=numpy.float64).reshape(-1, 2)
+    if len(centroids) == 0:
+        empty = numpy.empty(0)
+        return {key: empty.copy() for key in ("x", "y", "flux", "background", "hfd", "fwhm", "eccentricity")}
+    radius = outer_diameter / 2
+    half = int(numpy.ceil(radius)) + BACKGROUND_RING
+    offsets = numpy.arange(-half, half + 1)
+    height, width = image.shape[:2]
+
+    # Stamps of all of the stars , (N, S, S) , the pixels outside of the image are masked
+    cx = numpy.rint(centroids[:, 0]).astype(numpy.int64)
+    cy = numpy.rint(centroids[:, 1]).astype(numpy.int64)
+    rows = cy[:, None, None] + offsets[None, :, None]
+    cols = cx[:, None, None] + offsets[None, None, :]
+    valid = (rows >= 0) & (rows < height) & (cols >= 0) & (cols < width)
+    stamps = image[numpy.clip(rows, 0, height - 1), numpy.clip(cols, 0, width - 1)]
+    if image.ndim == 3:
+        # The stamps are stacked in a single image for the color conversion
+        stamps = _gray(stamps.reshape(-1, len(offsets), image.shape[2])).reshape(rows.shape[0], len(offsets), -1)
+    # All of the metrics are float64 , like the centroids
+    stamps = stamps.astype(numpy.float64)
+
+    dx = cols - centroids[:, 0, None, None]
+    dy = rows - centroids[:, 1, None, None]
+    dist = numpy.sqrt(dx ** 2 + dy ** 2)
+    aperture = valid & (dist <= radius)
+    ring = valid & (dist > radius) & (dist <= radius + BACKGROUND_RING) & numpy.isfinite(stamps)
+
+    # A star whose ring is entirely off the image has no background
+    background = numpy.zeros(len(stamps))
+    measured = ring.any(axis=(1, 2))
+    background[measured] = numpy.nanmedian(
+        numpy.where(ring[measured], stamps[measured], numpy.nan).reshape(measured.sum(), -1), axis=1
+    )
+    # The residuals keep their sign , the sky noise averages out in the sums instead of adding up
+    values = numpy.where(aperture, stamps - background[:, None, None], 0)
+
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        flux = values.sum(axis=(1, 2))
+        hfd = 2 * (values * dist).sum(axis=(1, 2)) / flux
+
+        # Adaptive moments : the stamps are weighted by a Gaussian window which is matched to the star ,
+        # the window keeps the noise of the aperture out of the second moments.
+        # For a Gaussian star the moments under the matched window are half of its covariance.
+        sigma = outer_diameter / (3 * GAUSSIAN_FWHM)
+        wxx = numpy.full(len(values), sigma ** 2)
+        wyy = wxx.copy()
+        wxy = numpy.zeros(len(values))
+        mx = numpy.zeros(len(values))
+        my = numpy.zeros(len(values))
+        for _ in range(ADAPTIVE_ITERATIONS):
+            ddx = dx - mx[:, None, None]
+            ddy = dy - my[:, None, None]
+            det = wxx * wyy - wxy ** 2
+            exponent = (wyy[:, None, None] * ddx ** 2 - 2 * wxy[:, None, None] * ddx * ddy
+                        + wxx[:, None, None] * ddy ** 2) / (2 * det[:, None, None])
+            weighted = values * numpy.exp(-exponent)
+            total = weighted.sum(axis=(1, 2))
+            mx = mx + (weighted * ddx).sum(axis=(1, 2)) / total
+            my = my + (weighted * ddy).sum(axis=(1, 2)) / total
+            cxx = (weighted * ddx * ddx).sum(axis=(1, 2)) / total
+            cyy = (weighted * ddy * ddy).sum(axis=(1, 2)) / total
+            cxy = (weighted * ddx * ddy).sum(axis=(1, 2)) / total
+            # The window of the next pass is the covariance of the star , it must stay positive definite
+            good = (cxx > 0) & (cyy > 0) & (cxx * cyy > cxy ** 2) & (total > 0)
+            wxx = numpy.where(good, 2 * cxx, wxx)
+            wyy = numpy.where(good, 2 * cyy, wyy)
+            wxy = numpy.where(good, 2 * cxy, wxy)
+        # Eigenvalues of the covariance matrix , the variances along the axes of the star
+        spread = numpy.sqrt(((wxx - wyy) / 2) ** 2 + wxy ** 2)
+        major = (wxx + wyy) / 2 + spread
+        minor = numpy.maximum((wxx + wyy) / 2 - spread, 0)
+        fwhm = GAUSSIAN_FWHM * numpy.sqrt((major + minor) / 2)
+        eccentricity = numpy.sqrt(1 - minor / major)
+
+    found = (flux > 0) & good & numpy.isfinite(mx) & numpy.isfinite(my)
+    nan = numpy.nan
+    return {
+        "x": numpy.where(found, centroids[:, 0] + mx, nan),
+        "y": numpy.where(found, centroids[:, 1] + my, nan),
+        "flux": numpy.where(found, flux, nan),
+        "background": background,
+        "hfd": numpy.where(found, hfd, nan),
+        "fwhm": numpy.where(found, fwhm, nan),
+        "eccentricity": numpy.where(found, eccentricity, nan),
+    }
+
 
 if __name__ == '__main__':
     # The following is a simple example of how to use CalcStars
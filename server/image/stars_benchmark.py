@@ -0,0 +1,70 @@
+# coding=utf-8
+
+"""
+
+Copyright(c) 2022-2023 Max Qian  <lightapt.com>
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Library General Public
+License version 3 as published by the Free Software Foundation.
+This library is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Library General Public License for more details.
+You should have received a copy of the GNU Library General Public License
+along with this library; see the file COPYING.LIB.  If not, write to
+the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+Boston, MA 02110-1301, USA.
+
+"""
+
+# Benchmark of the star detection modes on synthetic dense fields
+# Usage : python stars_benchmark.py [stars]
+
+import sys
+import time
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from noise import make_star_field
+from stars import CalcStars, star_metrics
+
+def recall(found : list, truth : np.ndarray, offset : float, tolerance : float = 2.0) -> tuple:
+    """
+        Fraction of the true stars with a detection close to them , and mean distance of the matches
+    """
+    if not found:
+        return 0.0, np.nan
+    points = np.asarray(found, dtype=float) + offset
+    distance, _ = cKDTree(points).query(truth[:, :2], distance_upper_bound=tolerance)
+    matched = np.isfinite(distance)
+    return matched.mean(), distance[matched].mean()
+
+def run(shape : tuple, stars : int, modes : tuple) -> None:
+    frame, truth = make_star_field(shape, stars, fwhm=3.5, sky=200, read_noise=5,
+                                   flux=(2e3, 5e4), dtype=np.uint16, rng=1)
+    # 8 bits like the frames of the allsky camera
+    frame = np.clip(frame / 256, 0, 255).astype(np.uint8)
+    height, width = shape
+    mask = np.full(shape, 255, np.uint8)
+    print("%dx%d with %d stars" % (width, height, stars))
+    for mode in modes:
+        calc = CalcStars(mask=mask, detection_threshold=0.6)
+        start = time.perf_counter()
+        blobs = calc.detect_stars(frame, mode=mode, draw=False)
+        elapsed = time.perf_counter() - start
+        # The star is at the center of the 15x15 template
+        found, error = recall(blobs, truth, 7.0)
+        print("  %-10s %7.3f s %6d detections , recall %.3f , mean error %.2f px"
+              % (mode, elapsed, len(blobs), found, error))
+        if mode == "components" and blobs:
+            start = time.perf_counter()
+            star_metrics(frame, np.asarray(blobs) + 7.0, 10)
+            print("  %-10s %7.3f s for the metrics of all of the stars" % ("", time.perf_counter() - start))
+
+if __name__ == "__main__":
+    stars = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    # The former mode compares every hit with every kept blob , so it only runs on the small field
+    run((1024, 1536), stars // 8, ("template", "components"))
+    run((3000, 4000), stars, ("components",))
@@ -1,5 +1,6 @@
 from .autocomplete import AutoComplete, CompletionStrategy, \
     Dropdown, DropdownItem, InputState
+from .catalog import catalog_items
 
 __all__ = [
     "AutoComplete",
@@ -7,4 +8,5 @@ __all__ = [
     "Dropdown",
     "DropdownItem",
     "InputState",
+    "catalog_items",
 ]
@@ -0,0 +1,22 @@
+from __future__ import annotations
+
+from ...celestial.search import suggest
+from .autocomplete import DropdownItem, InputState
+
+
+def catalog_items(input_state: InputState, limit: int = 12) -> list[DropdownItem]:
+    """Dropdown items for the catalog objects matching the text typed so far.
+
+    Pass it as the `items` of a `Dropdown` to autocomplete object names.
+
+    Args:
+        input_state: The current value and cursor position of the input.
+        limit: Maximum number of items in the dropdown.
+    """
+    return [
+        DropdownItem(
+            main=match["identifier"],
+            right_meta=f'{match["type"]} {match["constellation"]}',
+        )
+        for match in suggest(input_state.value, limit)
+    ]
@@ -0,0 +1,287 @@
+# coding=utf-8
+
+"""
+
+Copyright(c) 2022-2023 Max Qian  <lightapt.com>
+
+This library is free software; you can redistribute it and/or
+modify it under the terms of the GNU Library General Public
+License version 3 as published by the Free Software Foundation.
+This library is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+Library General Public License for more details.
+You should have received a copy of the GNU Library General Public License
+along with this library; see the file COPYING.LIB.  If not, write to
+the Free Software Foundation, Inc., 51 Franklin Street, Fifth Floor,
+Boston, MA 02110-1301, USA.
+
+"""
+
+import json
+import math
+import ephem
+import tornado.ioloop
+import tornado.web
+import tornado.websocket
+
+from ..celestial import search
+from ..logging import logger
+from ..celestial.object import get_polaris_model
+from ..celestial.tiles import catalog_tiles
+
+# Upper bound of the number of suggestions returned for a single request
+MAX_SUGGESTIONS = 50
+
+# Bounds of the polar scope push rate , in Hz
+MIN_POLAR_RATE = 0.1
+MAX_POLAR_RATE = 10
+
+async def get_suggestions(params : dict) -> dict:
+    """
+        Run a catalog name suggestion for a request
+        Args :
+            params : dict
+                prefix : str # the text typed so far
+                limit : int # maximum number of results , default is 10
+        Returns : dict
+    """
+    try:
+        prefix = str(params.get("prefix", ""))
+        limit = min(max(int(params.get("limit", 10)), 1), MAX_SUGGESTIONS)
+    except (TypeError, ValueError):
+        return {"status": 1, "message": "Invalid suggestion parameters", "params": {}}
+    try:
+        suggestions = await search.asuggest(prefix, limit)
+    except search.CatalogBusy as e:
+        return {"status": 1, "message": str(e), "params": {}}
+    return {
+        "status": 0,
+        "message": "",
+        "params": {"suggestions": suggestions}
+    }
+
+async def build_catalog_tiles() -> None:
+    """
+        Build the catalog tiles on the catalog threads when the server starts ,
+        so that the first tile request doesn't wait for them
+        Returns : None
+    """
+    try:
+        count = len(await search.catalog_executor.run(catalog_tiles.tiles))
+    except Exception as e:
+        logger.error("Failed to build the catalog tiles : %s" % str(e))
+        return
+    logger.info("Built %d catalog tiles" % count)
+
+async def fill_almanac() -> None:
+    """
+        Compute the almanac of the observer site ahead of time , off the IOLoop ,
+        so that looking up the twilights never waits for the ephemeris
+        Returns : None
+    """
+    from ..celestial.almanac import almanac
+
+    try:
+        count = await tornado.ioloop.IOLoop.current().run_in_executor(None, almanac.fill)
+    except Exception as e:
+        logger.error("Failed to compute the almanac : %s" % str(e))
+        return
+    if count:
+        logger.info("Computed %d nights of the almanac" % count)
+
+# #################################################################
+# Catalog search
+# #################################################################
+
+class CatalogSuggestHandler(tornado.web.RequestHandler):
+    """
+        Autocomplete object names
+        url : /celestial/suggest/?prefix=ngc70&limit=10
+    """
+    async def get(self):
+        self.write(await get_suggestions({
+            "prefix": self.get_argument("prefix", ""),
+            "limit": self.get_argument("limit", 10)
+        }))
+
+class CatalogTileHandler(tornado.web.RequestHandler):
+    """
+        Objects of a HEALPix tile of the catalog , with the HiPS layout
+        url : /celestial/tiles/Norder3/Dir0/Npix123.json
+
+        The tiles only change when the catalog is rebuilt , clients revalidate them with the ETag
+        They are built on the catalog threads , the IOLoop is not blocked while they are built
+    """
+    async def get(self, order : str, npix : str):
+        try:
+            tile = await search.catalog_executor.run(catalog_tiles.tile, int(order), int(npix))
+        except search.CatalogBusy:
+            raise tornado.web.HTTPError(503)
+        if tile is None:
+            raise tornado.web.HTTPError(404)
+        self._blob, self._etag = tile
+        self.set_header("Content-Type", "application/json")
+        self.set_header("Cache-Control", "public, max-age=3600, must-revalidate")
+        self.write(self._blob)
+
+    def compute_etag(self) -> str | None:
+        # The hash is computed once when the tile is built , not on every response
+        return getattr(self, "_etag", None)
+
+class CatalogWebSocket(tornado.websocket.WebSocketHandler):
+    """
+        Catalog queries over a websocket , to autocomplete on every keystroke
+        url : /celestial/ws/
+
+        Message Example:
+            {
+                "event" : "suggest",
+                "params" : {
+                    "prefix" : "ngc70",
+                    "limit" : 10
+                }
+            }
+    """
+    def check_origin(self, origin: str) -> bool:
+        return True
+
+    async def on_message(self, message):
+        try:
+            command = json.loads(message)
+            event = command["event"]
+            params = command.get("params", {})
+        except (json.JSONDecodeError, KeyError, TypeError, AttributeError):
+            await self.write_message({"status": 1, "message": "Failed to parse message", "params": {}})
+            return
+        if event == "suggest":
+            res = await get_suggestions(params)
+        else:
+            res = {"status": 1, "message": "Unknown event", "params": {}}
+        res["event"] = event
+        await self.write_message(res)
+
+# #################################################################
+# Polar scope
+# #################################################################
+
+class PolarScopeStream(object):
+    """
+        Push the hour angle and the altitude of Polaris to the subscribed clients.
+        Clients of the same site and rate share one timer , and the state is computed once per tick
+        from the Polaris model of the site.
+    """
+
+    def __init__(self) -> None:
+        # (lat, lon, elevation, interval) -> [set of handlers, PeriodicCallback]
+        self._groups = {}
+        self._subscriptions = {}
+
+    def subscribe(self, handler : tornado.websocket.WebSocketHandler, params : dict) -> dict:
+        """
+            Subscribe a client , a client has at most one subscription
+            Args :
+                handler : WebSocketHandler
+                params : dict
+                    lat : str # latitude of the site , in degrees
+                    lon : str # longitude of the site , in degrees
+                    elevation : float # in meters , default is 0
+                    rate : float # messages per second , default is 1
+            Returns : dict
+        """
+        try:
+            lat = ephem.degrees(str(params["lat"]))
+            lon = ephem.degrees(str(params["lon"]))
+            elevation = float(params.get("elevation", 0))
+            rate = float(params.get("rate", 1))
+            # json.loads accepts NaN and Infinity
+            if not all(math.isfinite(value) for value in (lat, lon, elevation, rate)):
+                raise ValueError("non-finite polar scope parameter")
+            rate = min(max(rate, MIN_POLAR_RATE), MAX_POLAR_RATE)
+        except (KeyError, TypeError, ValueError):
+            return {"status": 1, "message": "Invalid polar scope parameters", "params": {}}
+        self.unsubscribe(handler)
+
+        key = (str(lat), str(lon), elevation, 1000 / rate)
+        group = self._groups.get(key)
+        if group is None:
+            timer = tornado.ioloop.PeriodicCallback(lambda: self._push(key), key[3])
+            timer.start()
+            # Stored once the timer runs , so a failure leaves no group without timer
+            group = self._groups[key] = [set(), timer]
+        group[0].add(handler)
+        self._subscriptions[handler] = key
+        return {"status": 0, "message": "", "params": self._state(key)}
+
+    def unsubscribe(self, handler : tornado.websocket.WebSocketHandler) -> None:
+        """
+            Remove the subscription of a client , the timer stops with the last client of a group
+            Args : handler : WebSocketHandler
+        """
+        key = self._subscriptions.pop(handler, None)
+        if key is None:
+            return
+        handlers, timer = self._groups[key]
+        handlers.discard(handler)
+        if not handlers:
+            timer.stop()
+            del self._groups[key]
+
+    def _state(self, key : tuple) -> dict:
+        observer = ephem.Observer()
+        observer.lat, observer.lon, observer.elevation = key[:3]
+        return get_polaris_model(observer).state()
+
+    def _push(self, key : tuple) -> None:
+        group = self._groups.get(key)
+        if group is None:
+            return
+        message = json.dumps({"event": "polar", "status": 0, "message": "", "params": self._state(key)})
+        for handler in list(group[0]):
+            try:
+                handler.write_message(message)
+            except tornado.websocket.WebSocketClosedError:
+                self.unsubscribe(handler)
+
+polar_scope_stream = PolarScopeStream()
+
+class PolarScopeWebSocket(tornado.websocket.WebSocketHandler):
+    """
+        Stream the position of Polaris for the polar scope reticle
+        url : /celestial/polar/ws/
+
+        Message Example:
+            {
+                "event" : "subscribe",
+                "params" : {
+                    "lat" : "31.2",
+                    "lon" : "121.5",
+                    "elevation" : 10,
+                    "rate" : 1
+                }
+            }
+        Then a "polar" event is pushed at the requested rate until "unsubscribe" is sent
+    """
+    def check_origin(self, origin: str) -> bool:
+        return True
+
+    async def on_message(self, message):
+        try:
+            command = json.loads(message)
+            event = command["event"]
+            params = command.get("params", {})
+        except (json.JSONDecodeError, KeyError, TypeError, AttributeError):
+            await self.write_message({"status": 1, "message": "Failed to parse message", "params": {}})
+            return
+        if event == "subscribe":
+            res = polar_scope_stream.subscribe(self, params)
+        elif event == "unsubscribe":
+            polar_scope_stream.unsubscribe(self)
+            res = {"status": 0, "message": "", "params": {}}
+        else:
+            res = {"status": 1, "message": "Unknown event", "params": {}}
+        res["event"] = event
+        await self.write_message(res)
+
+    def on_close(self) -> None:
+        polar_scope_stream.unsubscribe(self)
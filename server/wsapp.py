@@ -43,6 +43,8 @@ from .ws.indi import (INDIClientWebSocket,INDIDebugWebSocket,INDIDebugHtml,
                         INDIFIFODeviceStartStop,INDIFIFOGetAllDevice,
                         INDIServerConnect,INDIServerDisconnect,INDIServerIsConnected
                         )
+from .ws.celestial import CatalogSuggestHandler,CatalogTileHandler,CatalogWebSocket,PolarScopeWebSocket
+from .ws.celestial import build_catalog_tiles, fill_almanac
 
 import server.api
 
@@ -238,6 +240,11 @@ def make_server(loop, options) -> tornado.web.Application:
             (r'/indi/server/disconnect/', INDIServerDisconnect),
             (r'/indi/server/connected/',INDIServerIsConnected),
 
+            (r"/celestial/suggest/",CatalogSuggestHandler),
+            (r"/celestial/tiles/Norder(\d+)/Dir\d+/Npix(\d+)\.json",CatalogTileHandler),
+            (r"/celestial/ws/",CatalogWebSocket),
+            (r"/celestial/polar/ws/",PolarScopeWebSocket),
+
             (r'/webssh/',webssh_index_handler,dict(loop=loop, policy=policy,
                                   host_keys_settings=host_keys_settings)),
             (r'/webssh/ws',webssh_wsock_handler,dict(loop=loop))
@@ -278,6 +285,11 @@ async def run_server(host : str = "127.0.0.1", port : str = 8080, debug : bool =
     if ssl_ctx:
         wsserver.listen(options.sslport, options.ssladdress, **server_settings)
     logger.info("Started SSL server on %s:%d" % (options.address,options.port))
+    # Build the sky map tiles in the background , the server is already answering
+    tiles = asyncio.ensure_future(build_catalog_tiles())
+    # Keep the almanac of the observer site some weeks ahead , checked every 6 hours
+    almanac = asyncio.ensure_future(fill_almanac())
+    tornado.ioloop.PeriodicCallback(fill_almanac, 6 * 3600 * 1000).start()
     shutdown = asyncio.Event()
     await shutdown.wait()
 